@@ -108,9 +108,12 @@ def configure_existing_environment():
             # --- PASO 3: Asociar los docentes al horario específico ---
             log.info(f"\n--- Asociando docentes al horario '{horario.nombre}' del curso '{curso.nombre}' ---")
             
+            # Ids ya asociados en un set: pertenencia O(1) en vez de recorrer la colección por docente
+            ids_asociados = {u.id for u in horario.usuarios}
             for docente in docentes_a_asociar:
-                if docente not in horario.usuarios:
+                if docente.id not in ids_asociados:
                     horario.usuarios.append(docente)
+                    ids_asociados.add(docente.id)
                     log.info(f"Asociando a {docente.nombre}...")
                 else:
                     log.info(f"{docente.nombre} ya está asociado a este horario.")
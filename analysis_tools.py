@@ -7,6 +7,7 @@ import logging
 import json
 import shlex # Para parsear argumentos de forma segura
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, Tuple, List # Añadir List
 
 # Configuración básica de logging para este módulo
@@ -1113,16 +1114,24 @@ def run_code_analysis(
         "success": False
     }
     
-    # Run format analysis if config provided - O(n)
-    if format_config:
-        # This calls an external function, assumed to be O(n)
-        format_results = run_format_analysis_configurable(code, language, format_config)
-        results["format_results"] = format_results
-    
-    # Run metrics analysis if enabled - O(n)
-    if run_metrics:
-        metrics_results = run_metrics_analysis(code, language)
-        results["metrics_results"] = metrics_results
+    if format_config and run_metrics:
+        # Both enabled: the linter is an external process, so the in-process
+        # metrics (AST parse + visit) run while it is working instead of after it
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future_format = executor.submit(run_format_analysis_configurable, code, language, format_config)
+            results["metrics_results"] = run_metrics_analysis(code, language)
+            results["format_results"] = future_format.result()
+    else:
+        # Run format analysis if config provided - O(n)
+        if format_config:
+            # This calls an external function, assumed to be O(n)
+            format_results = run_format_analysis_configurable(code, language, format_config)
+            results["format_results"] = format_results
+        
+        # Run metrics analysis if enabled - O(n)
+        if run_metrics:
+            metrics_results = run_metrics_analysis(code, language)
+            results["metrics_results"] = metrics_results
     
     # Generate consolidated report - O(n)
     consolidated_report = generate_consolidated_report(
@@ -1132,8 +1141,8 @@ def run_code_analysis(
     results["consolidated_report"] = consolidated_report
     
     # Determine overall success - O(1)
-    format_success = results.get("format_results", {}).get("success", True)
-    metrics_success = results.get("metrics_results", {}).get("success", True)
+    format_success = (results.get("format_results") or {}).get("success", True)
+    metrics_success = (results.get("metrics_results") or {}).get("success", True)
     results["success"] = format_success and metrics_success
     
     return results
@@ -2,7 +2,27 @@
 
 import os
 
+def _opciones_engine(uri):
+    """
+    Pool de conexiones para motores cliente-servidor (PostgreSQL, MySQL). SQLite usa
+    NullPool/SingletonThreadPool, que no aceptan pool_size ni max_overflow.
+    pool_pre_ping queda desactivado (evita un SELECT 1 por checkout); pool_recycle
+    descarta conexiones de más de una hora antes de que el servidor las corte.
+    """
+    if uri.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 25)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 25)),
+        'pool_pre_ping': False,
+        'pool_recycle': 3600,
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'tu_clave_secreta'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _opciones_engine(SQLALCHEMY_DATABASE_URI)
+    # Solo desarrollo/pruebas: las consultas de reportes marcan raiseload('*') para que
+    # cualquier lazy load no previsto (N+1) falle en vez de pasar desapercibido.
+    SQLALCHEMY_RAISELOAD = os.environ.get('SQLALCHEMY_RAISELOAD') == '1'
@@ -0,0 +1,87 @@
+# disk_cache.py
+"""
+Poda LRU de cachés de artefactos en disco (binarios C y clases Java del evaluador,
+ejecutables del analizador de rendimiento).
+
+Cada acierto de caché actualiza el mtime del artefacto (tocar_artefacto), así que ordenar
+por mtime da el orden LRU. Una entrada agrupa los archivos o directorios hijos que comparten
+clave, es decir, el nombre hasta el primer punto (p. ej. "abc", "abc.c" y "abc.123.tmp").
+"""
+
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+# Las entradas usadas hace menos de esto nunca se borran: pueden estar ejecutándose
+EN_USO_SEG = 600
+
+
+def tocar_artefacto(path: str) -> bool:
+    """Marca un artefacto cacheado como recién usado (mtime = ahora). False si ya no existe."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _tamano(path: str) -> int:
+    """Bytes que ocupa un archivo o un directorio (recursivo)."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(raiz, nombre)) for raiz, _, nombres in os.walk(path) for nombre in nombres)
+
+
+def podar_cache_lru(directorio: str, max_entradas: int, max_bytes: int, max_edad_seg: float,
+                    en_uso_seg: float = EN_USO_SEG, ahora: Optional[float] = None) -> int:
+    """
+    Borra de `directorio` las entradas más antiguas que max_edad_seg y, mientras se excedan
+    max_entradas o max_bytes, las usadas hace más tiempo. Nunca borra las usadas en los
+    últimos en_uso_seg. Devuelve cuántas entradas borró; los errores de disco solo se registran.
+    """
+    ahora = time.time() if ahora is None else ahora
+    entradas: Dict[str, List] = {}  # clave -> [mtime más reciente, bytes, paths]
+    try:
+        nombres = os.listdir(directorio)
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        log.warning(f"No se pudo leer la caché {directorio}: {e}")
+        return 0
+    for nombre in nombres:
+        path = os.path.join(directorio, nombre)
+        try:
+            mtime, tamano = os.stat(path).st_mtime, _tamano(path)
+        except OSError:
+            continue  # Borrado por otro proceso mientras se recorría
+        entrada = entradas.setdefault(nombre.split('.', 1)[0], [0.0, 0, []])
+        entrada[0] = max(entrada[0], mtime)
+        entrada[1] += tamano
+        entrada[2].append(path)
+
+    total_bytes = sum(entrada[1] for entrada in entradas.values())
+    restantes = len(entradas)
+    borradas = 0
+    # Ordenadas por uso: en cuanto una entrada se conserva, todas las siguientes también
+    for mtime, tamano, paths in sorted(entradas.values(), key=lambda entrada: entrada[0]):
+        edad = ahora - mtime
+        if edad < en_uso_seg or (edad <= max_edad_seg and restantes <= max_entradas and total_bytes <= max_bytes):
+            break
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+        restantes -= 1
+        total_bytes -= tamano
+        borradas += 1
+    if borradas:
+        log.info(f"Caché {directorio}: {borradas} entradas eliminadas ({restantes} restantes).")
+    return borradas
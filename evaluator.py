@@ -8,23 +8,35 @@ import tempfile
 import os
 import sys
 import shlex
+import shutil
+import textwrap
 import time
 import logging
 from datetime import datetime, timezone
 from difflib import unified_diff
-from typing import Optional, Dict, Any, List, Tuple
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache
+from itertools import islice, zip_longest
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+import io
+import hashlib
+import threading
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor, Future
+from sqlalchemy import delete, inspect, or_
 
 # --- Importaciones de Modelos ---
 from models import (
     Evaluacion, ResultadoDeEvaluacion, db, CasoDePrueba, Pregunta,
     Entrega, AnalisisResultado, HerramientaAnalisis,
-    ConfiguracionExamen, TipoAnalisis, ResultadoCriterioLLM 
+    ConfiguracionExamen, TipoAnalisis, ResultadoCriterioLLM, _json_loads
 )
 
 import openai
 
+from disk_cache import podar_cache_lru, tocar_artefacto
+
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 if OPENAI_API_KEY:
     openai.api_key = OPENAI_API_KEY
@@ -32,13 +44,18 @@ else:
     logging.warning("OPENAI_API_KEY no encontrada en las variables de entorno. El análisis con LLM no funcionará.")
 
 LLM_MODEL_OPENAI = "gpt-3.5-turbo-0125"
-
-def construir_prompt_llm(enunciado: str, codigo_estudiante: str, rubrica_json_str: str, solucion_modelo: Optional[str] = None) -> List[Dict[str, str]]:
-    """
-    Construye el prompt en formato de mensajes para la API de Chat de OpenAI.
-    Ahora la rúbrica se pasa como string para incluirla directamente en el prompt del sistema.
-    """
-    system_message_content = f"""
+LLM_TEMPERATURE = 0.2  # Más bajo para mayor consistencia en evaluación
+
+# Caché por proceso de respuestas del LLM, indexada por SHA-256 de (modelo, temperatura, prompt).
+# Un reenvío idéntico (o una re-evaluación) recibe el mismo veredicto sin volver a llamar a la API.
+LLM_CACHE_MAX = 512
+_llm_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_llm_cache_lock = threading.Lock()
+llm_cache_stats = {"hits": 0, "misses": 0}
+
+# Plantillas del prompt construidas una sola vez al cargar el módulo.
+# La única parte variable del mensaje de sistema es la rúbrica ({RUBRICA}).
+_SYSTEM_TEMPLATE = """
 Eres un asistente de profesor experto y justo, especializado en evaluar código de programación de estudiantes.
 Tu tarea es analizar el código proporcionado por un estudiante en respuesta a un problema específico y evaluarlo
 rigurosamente según una rúbrica dada.
@@ -63,26 +80,66 @@ El objeto JSON raíz debe tener una clave "evaluacion_llm". El valor de esta cla
 A continuación, se proporcionará el enunciado, la rúbrica, la solución modelo (si existe) y el código del estudiante.
 ---
 RÚBRICA DE EVALUACIÓN (JSON):
-{rubrica_json_str}
+{RUBRICA}
 ---
-"""
-    user_message_content_parts = [
-        f"ENUNCIADO DEL PROBLEMA:\n{enunciado}\n---"
-    ]
-    if solucion_modelo:
-        user_message_content_parts.append(f"SOLUCIÓN MODELO (Referencia):\n{solucion_modelo}\n---")
-    
-    user_message_content_parts.append(f"CÓDIGO DEL ESTUDIANTE A EVALUAR:\n```\n{codigo_estudiante}\n```\n---")
-    user_message_content_parts.append("Por favor, proporciona tu evaluación en el formato JSON especificado anteriormente.")
+""".strip()
 
-    user_message_content = "\n".join(user_message_content_parts)
+_LINEA_CRITERIO_LLM = "- {0}: {1}{2} pts.{3}"  # nombre, puntaje, "/max", " (Feedback: ...)"
+
+_USER_ENUNCIADO = "ENUNCIADO DEL PROBLEMA:\n"
+_USER_SOLUCION = "\n---\nSOLUCIÓN MODELO (Referencia):\n"
+_USER_CODIGO = "\n---\nCÓDIGO DEL ESTUDIANTE A EVALUAR:\n```\n"
+_USER_CIERRE = "\n```\n---\nPor favor, proporciona tu evaluación en el formato JSON especificado anteriormente."
+
+def construir_prompt_llm(enunciado: str, codigo_estudiante: str, rubrica_json_str: str, solucion_modelo: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Construye el prompt en formato de mensajes para la API de Chat de OpenAI.
+    Ahora la rúbrica se pasa como string para incluirla directamente en el prompt del sistema.
+    """
+    system_message_content = _SYSTEM_TEMPLATE.replace("{RUBRICA}", rubrica_json_str)
+
+    # Concatenar piezas fijas en lugar de reemplazar marcadores: el texto del alumno
+    # podría contener un marcador y no debe ser interpretado.
+    user_message_parts = [_USER_ENUNCIADO, enunciado]
+    if solucion_modelo:
+        user_message_parts += [_USER_SOLUCION, solucion_modelo]
+    user_message_parts += [_USER_CODIGO, codigo_estudiante, _USER_CIERRE]
 
     return [
-        {"role": "system", "content": system_message_content.strip()},
-        {"role": "user", "content": user_message_content.strip()}
+        {"role": "system", "content": system_message_content},
+        {"role": "user", "content": "".join(user_message_parts)}
     ]
 
 
+def _clave_cache_llm(messages: List[Dict[str, str]]) -> str:
+    h = hashlib.sha256(f"{LLM_MODEL_OPENAI}|{LLM_TEMPERATURE}".encode('utf-8'))
+    for m in messages:
+        h.update(b'\0' + m["role"].encode('utf-8') + b'\0' + m["content"].encode('utf-8'))
+    return h.hexdigest()
+
+
+def llamar_api_openai_llm_con_cache(messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    """llamar_api_openai_llm memoizado por contenido del prompt. Solo se cachean respuestas válidas."""
+    clave = _clave_cache_llm(messages)
+    with _llm_cache_lock:
+        cached = _llm_cache.get(clave)
+        if cached is not None:
+            _llm_cache.move_to_end(clave)
+            llm_cache_stats["hits"] += 1
+    if cached is not None:
+        log.info("Evaluación LLM reutilizada desde caché (hits=%d, misses=%d).", llm_cache_stats["hits"], llm_cache_stats["misses"])
+        return cached
+    with _llm_cache_lock:
+        llm_cache_stats["misses"] += 1
+    resultado = llamar_api_openai_llm(messages)
+    if resultado:
+        with _llm_cache_lock:
+            _llm_cache[clave] = resultado
+            if len(_llm_cache) > LLM_CACHE_MAX:
+                _llm_cache.popitem(last=False)
+    return resultado
+
+
 def llamar_api_openai_llm(messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
     """Llama a la API de Chat de OpenAI y retorna el contenido de 'evaluacion_llm'."""
     if not OPENAI_API_KEY:
@@ -95,7 +152,7 @@ def llamar_api_openai_llm(messages: List[Dict[str, str]]) -> Optional[Dict[str,
         response = client.chat.completions.create(
             model=LLM_MODEL_OPENAI,
             messages=messages,
-            temperature=0.2,  # Más bajo para mayor consistencia en evaluación
+            temperature=LLM_TEMPERATURE,
             # max_tokens=1500, # Ajustar según necesidad, pero el modelo puede manejarlo
             response_format={"type": "json_object"} # Solicitar explícitamente salida JSON
         )
@@ -113,7 +170,7 @@ def llamar_api_openai_llm(messages: List[Dict[str, str]]) -> Optional[Dict[str,
 
         # Intentar parsear el contenido como JSON
         try:
-            evaluacion_completa = json.loads(contenido_respuesta)
+            evaluacion_completa = _json_loads(contenido_respuesta)
             if "evaluacion_llm" in evaluacion_completa:
                  log.info("Respuesta JSON del LLM recibida y parseada correctamente.")
                  return evaluacion_completa["evaluacion_llm"] 
@@ -131,28 +188,24 @@ def llamar_api_openai_llm(messages: List[Dict[str, str]]) -> Optional[Dict[str,
         log.error(f"Error inesperado al procesar respuesta del LLM de OpenAI: {e}", exc_info=True)
         return None
     
-def ejecutar_analisis_llm(entrega: Entrega, pregunta: Pregunta) -> Tuple[Optional[List[ResultadoCriterioLLM]], Optional[str], float]:
+def preparar_prompt_llm(entrega: Entrega, pregunta: Pregunta) -> Tuple[Optional[List[Dict[str, str]]], Optional[str]]:
     """
-    Ejecuta el análisis con LLM de OpenAI para una entrega.
-    Retorna: (lista_resultados_criterios_db, feedback_general_llm, puntaje_total_llm)
+    Valida la rúbrica y construye el prompt para el LLM.
+    Retorna: (messages_prompt, None) o (None, feedback_de_error)
     """
     codigo_estudiante = entrega.codigo_fuente
     enunciado = pregunta.enunciado
     rubrica_json_str = pregunta.rubrica_evaluacion # Asumimos que es un string JSON
     solucion_modelo = pregunta.solucion_modelo
 
-    lista_resultados_db = []
-    feedback_general_txt = None
-    puntaje_total_llm = 0.0
-
     if not rubrica_json_str:
         log.warning(f"Pregunta {pregunta.id} no tiene rúbrica definida para análisis LLM. Saltando.")
-        return None, "Análisis con IA no realizado: Rúbrica no definida.", 0.0
+        return None, "Análisis con IA no realizado: Rúbrica no definida."
 
     # Intentar parsear la rúbrica para validación y para extraer max_puntaje
     try:
-        rubrica_dict = json.loads(rubrica_json_str)
-        if not isinstance(rubrica_dict.get("criterios"), list):
+        rubrica_dict = pregunta.rubrica_parsed
+        if not isinstance(rubrica_dict, dict) or not isinstance(rubrica_dict.get("criterios"), list):
             raise ValueError("'criterios' debe ser una lista en la rúbrica.")
         for crit_rubrica in rubrica_dict["criterios"]:
             if not all(k in crit_rubrica for k in ["nombre", "descripcion_general", "max_puntaje_criterio"]):
@@ -162,20 +215,37 @@ def ejecutar_analisis_llm(entrega: Entrega, pregunta: Pregunta) -> Tuple[Optiona
 
     except (json.JSONDecodeError, ValueError) as e:
         log.error(f"Formato de rúbrica JSON inválido para Pregunta {pregunta.id}: {e}. Rúbrica: {rubrica_json_str}")
-        return None, f"Análisis con IA no realizado: Formato de rúbrica inválido ({e}).", 0.0
+        return None, f"Análisis con IA no realizado: Formato de rúbrica inválido ({e})."
 
 
     messages_prompt = construir_prompt_llm(enunciado, codigo_estudiante, rubrica_json_str, solucion_modelo)
     # log.debug(f"Prompt para LLM (Pregunta {pregunta.id}):\n{json.dumps(messages_prompt, indent=2)}")
+    return messages_prompt, None
 
-    resultado_api_llm = llamar_api_openai_llm(messages_prompt)
 
-    # ———> Mostrar el JSON ya parseado para que lo veas antes de armar feedback_general_txt
-    if resultado_api_llm is not None:
-        import json as _json
-        print("=== JSON LLM parseado ===")
-        print(_json.dumps(resultado_api_llm, indent=2, ensure_ascii=False))
-        print("==========================\n")
+def ejecutar_analisis_llm(entrega: Entrega, pregunta: Pregunta) -> Tuple[Optional[List[ResultadoCriterioLLM]], Optional[str], float]:
+    """
+    Ejecuta el análisis con LLM de OpenAI para una entrega.
+    Retorna: (lista_resultados_criterios_db, feedback_general_llm, puntaje_total_llm)
+    """
+    messages_prompt, feedback_error = preparar_prompt_llm(entrega, pregunta)
+    if messages_prompt is None:
+        return None, feedback_error, 0.0
+    return procesar_respuesta_llm(llamar_api_openai_llm_con_cache(messages_prompt))
+
+
+def procesar_respuesta_llm(resultado_api_llm: Optional[Dict[str, Any]]) -> Tuple[List[ResultadoCriterioLLM], Optional[str], float]:
+    """
+    Convierte la respuesta 'evaluacion_llm' en objetos ResultadoCriterioLLM.
+    Retorna: (lista_resultados_criterios_db, feedback_general_llm, puntaje_total_llm)
+    """
+    lista_resultados_db = []
+    feedback_general_txt = None
+    puntaje_total_llm = 0.0
+
+    # ———> Mostrar el JSON ya parseado (solo en DEBUG: el pretty-print con indent es costoso)
+    if resultado_api_llm is not None and log.isEnabledFor(logging.DEBUG):
+        log.debug("=== JSON LLM parseado ===\n%s", json.dumps(resultado_api_llm, indent=2, ensure_ascii=False))
 
     if resultado_api_llm:
         feedback_general_txt = resultado_api_llm.get("feedback_general")
@@ -241,10 +311,40 @@ except ImportError:
         logging.warning("Usando función dummy para run_complete_analysis debido a error de importación.")
         return None, None, "Error: Módulo de análisis no disponible"
 
+# Caché por proceso de resultados de análisis: son funciones puras de
+# (código, lenguaje, configuración), y los reenvíos sin cambios son frecuentes.
+ANALISIS_CACHE_MAX = 256
+_analisis_cache: "OrderedDict[str, Any]" = OrderedDict()
+_analisis_cache_lock = threading.Lock()
+
+
+def _analisis_con_cache(nombre: str, funcion, codigo_fuente: str, lenguaje: str, *config: Any) -> Any:
+    """Ejecuta funcion(codigo_fuente, lenguaje, *config) memoizando el resultado por hash del código."""
+    config_sig = json.dumps(config, sort_keys=True, default=str)
+    clave = hashlib.sha256(f"{nombre}|{lenguaje}|{config_sig}|{codigo_fuente}".encode('utf-8')).hexdigest()
+    with _analisis_cache_lock:
+        if clave in _analisis_cache:
+            _analisis_cache.move_to_end(clave)
+            log.info("Resultado de %s reutilizado desde caché (código sin cambios).", nombre)
+            return _analisis_cache[clave]
+    resultado = funcion(codigo_fuente, lenguaje, *config)
+    if resultado and (not isinstance(resultado, tuple) or any(resultado[:2])):  # No cachear fallos
+        with _analisis_cache_lock:
+            _analisis_cache[clave] = resultado
+            if len(_analisis_cache) > ANALISIS_CACHE_MAX:
+                _analisis_cache.popitem(last=False)
+    return resultado
+
 # --- Configuración, Constantes ---
 ESTADO_EVALUANDO = 'evaluando'
 ESTADO_COMPLETADA = 'completada'
 ESTADO_ERROR = 'error'
+# Antigüedad máxima de una evaluación reutilizable por huella (0 = sin límite)
+REEVALUACION_TTL_SEC = int(os.environ.get('EVALUADOR_REEVALUACION_TTL_SEC', 7 * 24 * 3600))
+# Fases de Evaluacion.checkpoint_phase (NULL = evaluación anterior a los checkpoints, ya finalizada).
+# 'cases_done': los casos terminaron pero falló el LLM; un reintento con la misma huella solo repite el LLM.
+FASE_CASOS_TERMINADOS = 'cases_done'
+FASE_FINALIZADA = 'finalized'
 
 # --- Configuración de logging ---
 log = logging.getLogger(__name__)
@@ -258,11 +358,59 @@ if not log.hasHandlers():
 # --- Constantes de configuración ---
 DEFAULT_TIMEOUT_SEC = 120  # Segundos para cada caso de prueba
 DEFAULT_MAX_DIFF_LINES = 20  # Líneas máximas a mostrar en diferencias
+STREAMING_DIFF_MIN_CHARS = 8 * 1024  # A partir de este tamaño se compara línea a línea sin copiar todo
+MAX_REPORTE_FEEDBACK_CHARS = 1000  # Largo máximo de un reporte de herramienta dentro del feedback
+DIFF_WINDOW_CHARS = 2048  # Caracteres a cada lado de la primera diferencia en líneas muy largas
+LARGE_OUTPUT_REPR_CHARS = 500  # Caracteres mostrados en repr() cuando la salida es grande
+DIFF_BLOQUE_CHARS = 4096  # Tamaño de bloque al buscar la primera diferencia entre salidas
+NORM_CACHE_MAX_CHARS = 64 * 1024  # Solo se memoizan textos hasta este tamaño para acotar la memoria
+REPR_MAX_CHARS = 256 * 1024  # Tamaño máximo de los campos *_repr guardados en la BD
+# Directorio de los fuentes temporales: tmpfs (/dev/shm) si existe, para no tocar disco
+TEMP_SOURCE_DIR = os.environ.get('EVALUADOR_TEMP_DIR') or (
+    '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None)
+# Caché en disco de artefactos compilados (C/Java), indexada por hash del código fuente
+COMPILE_CACHE_DIR = os.environ.get('EVALUADOR_COMPILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'evaluador_compile_cache'))
+# Topes por lenguaje de la caché de compilación (entradas, bytes, antigüedad), aplicados con la poda
+# LRU de disk_cache; el tope de entradas también acota el índice Java en memoria
+COMPILE_CACHE_MAX_ENTRADAS = int(os.environ.get('EVALUADOR_COMPILE_CACHE_MAX', 512))
+COMPILE_CACHE_MAX_BYTES = int(os.environ.get('EVALUADOR_COMPILE_CACHE_MAX_MB', 256)) * 1024 * 1024
+COMPILE_CACHE_MAX_EDAD_SEG = int(os.environ.get('EVALUADOR_COMPILE_CACHE_MAX_HORAS', 7 * 24)) * 3600
+C_COMPILE_FLAGS = ['-Wall', '-Wextra', '-std=c11']
+JAVA_RUN_FLAGS = ['-XX:TieredStopAtLevel=1', '-Xshare:auto']  # Arranque de JVM más rápido para programas cortos
+_java_compile_cache: "OrderedDict[str, Tuple[str, List[str]]]" = OrderedDict()  # hash -> (directorio de clases, comando base), LRU
+_java_cache_lock = threading.Lock()
+# Casos de prueba ejecutados en paralelo (1 = secuencial). Se reservan 2 núcleos para la app web y la BD.
+# Corte temprano: matar el programa en cuanto su stdout diverge byte a byte de la salida esperada.
+# Es más estricto que la comparación flexible (flotantes, espacios por línea), por eso es opcional.
+FAIL_FAST_CASOS = os.environ.get('EVALUADOR_FAIL_FAST', '0').lower() in ('1', 'true', 'yes')
+MAX_WORKERS_CASOS = int(os.environ.get('EVALUADOR_WORKERS_CASOS', max(1, (os.cpu_count() or 1) - 2)))
+# Tope global de programas de estudiantes corriendo a la vez en este proceso (todas las entregas)
+MAX_SUBPROCESOS_GLOBAL = int(os.environ.get('EVALUADOR_MAX_SUBPROCESOS', max(1, os.cpu_count() or 1)))
+_semaforo_subprocesos = threading.BoundedSemaphore(MAX_SUBPROCESOS_GLOBAL)
 
 # =========================================================
 # === Funciones de Utilidad ===
 # =========================================================
 
+def _redondear_flotante(match: re.Match) -> str:
+    """Redondea a 4 decimales el número flotante capturado por la regex."""
+    try:
+        # El grupo 0 es el match completo
+        number = float(match.group(0))
+        return f"{number:.4f}" # Redondear a 4 decimales
+    except (ValueError, IndexError):
+        return match.group(0) # Si no es un número, devolverlo como está
+
+
+def _normalizar_linea(line: str) -> str:
+    """Normaliza una sola línea: espacios, flotantes y minúsculas (ver normalize_output_flexibly)."""
+    # Quitar espacios al inicio/final de la línea y reducir espacios intermedios
+    line = re.sub(r'\s+', ' ', line.strip())
+    # Normalizar números flotantes (posiblemente negativos) redondeándolos a 4 decimales
+    line = re.sub(r'-?\d+\.\d+', _redondear_flotante, line)
+    return line.lower()
+
+
 def normalize_output_flexibly(text: Optional[str]) -> str:
     """
     Normaliza una cadena de texto de forma flexible para la comparación.
@@ -278,36 +426,148 @@ def normalize_output_flexibly(text: Optional[str]) -> str:
     # 1. Normalizar saltos de línea y quitar espacios al inicio/final del texto completo
     normalized_text = text.replace('\r\n', '\n').replace('\r', '\n').strip()
     
-    # 2. Procesar cada línea individualmente
-    lines = normalized_text.split('\n')
-    processed_lines = []
-    for line in lines:
-        # 3. Quitar espacios al inicio/final de la línea y reducir espacios intermedios
-        line = re.sub(r'\s+', ' ', line.strip())
-        
-        # 4. Normalizar números flotantes en la línea
-        # Busca patrones como "x: -1.2345", "y: 3.14" o simplemente números
-        # y los redondea a un número fijo de decimales (ej. 4)
-        def round_match(match):
-            try:
-                # El grupo 0 es el match completo
-                number = float(match.group(0))
-                return f"{number:.4f}" # Redondear a 4 decimales
-            except (ValueError, IndexError):
-                return match.group(0) # Si no es un número, devolverlo como está
-
-        # Expresión regular para encontrar números flotantes (posiblemente negativos)
-        line = re.sub(r'-?\d+\.\d+', round_match, line)
-        
-        processed_lines.append(line)
-        
-    # 5. Unir las líneas procesadas y convertir todo a minúsculas
-    return '\n'.join(processed_lines).lower()
+    # 2. Procesar cada línea individualmente y unir el resultado
+    return '\n'.join(_normalizar_linea(line) for line in normalized_text.split('\n'))
+
+
+@lru_cache(maxsize=4096)
+def _norm_cached(text: str) -> str:
+    return normalize_output_flexibly(text)
+
+
+@lru_cache(maxsize=4096)
+def _norm_strip_cached(text: str) -> str:
+    return normalize_output_flexibly(text).strip()
+
+
+def normalizar_con_cache(text: Optional[str], strip: bool = False) -> str:
+    """
+    normalize_output_flexibly memoizado: las entradas/salidas esperadas se repiten en
+    cada reenvío de la misma pregunta. Los textos grandes no se cachean.
+    """
+    if text is None:
+        text = ""
+    if len(text) > NORM_CACHE_MAX_CHARS:
+        normalizado = normalize_output_flexibly(text)
+        return normalizado.strip() if strip else normalizado
+    return _norm_strip_cached(text) if strip else _norm_cached(text)
+
+
+def salida_esperada_preparada(caso: CasoDePrueba) -> Tuple[str, str, Optional[bytes]]:
+    """
+    Devuelve (salida_original, salida_normalizada_strip, bytes_camino_rapido) del caso.
+    Se calcula una sola vez por instancia y se guarda en el propio objeto; si
+    salida_esperada cambia, se recalcula.
+    """
+    original = caso.salida_esperada if caso.salida_esperada is not None else ""
+    cache = getattr(caso, '_salida_esperada_cache', None)
+    if cache is not None and cache[0] is original:
+        return cache
+    normalizada = normalizar_con_cache(original, strip=True)
+    # Forma mínima para el camino rápido: si el stdout coincide tal cual
+    # (salvo \r\n y espacios en los extremos), la comparación normalizada también coincide.
+    try:
+        esperada_bytes: Optional[bytes] = _bytes_comparables(original.encode('utf-8'))
+    except UnicodeEncodeError:
+        esperada_bytes = None
+    cache = (original, normalizada, esperada_bytes)
+    caso._salida_esperada_cache = cache
+    return cache
+
 
+def _iter_norm_lines(text: Optional[str]) -> Iterator[str]:
+    """
+    Versión perezosa de normalize_output_flexibly: produce las líneas normalizadas
+    una a una sin copiar el texto completo. Omite las líneas vacías del inicio y
+    del final igual que el .strip() de la versión completa.
+    """
+    if not text:
+        return
+    vacias_pendientes = 0
+    inicio = True
+    # newline=None traduce \r\n y \r a \n al leer (saltos de línea universales)
+    for line in io.StringIO(text, newline=None):
+        norm = _normalizar_linea(line)
+        if not norm:
+            if not inicio:
+                vacias_pendientes += 1
+            continue
+        inicio = False
+        for _ in range(vacias_pendientes):
+            yield ""
+        vacias_pendientes = 0
+        yield norm
+
+
+def _recortar_linea(linea: str, inicio: int, fin: int) -> str:
+    """Recorta una línea a [inicio:fin], marcando con '...' los extremos omitidos."""
+    if inicio == 0 and len(linea) <= fin:
+        return linea
+    return ('...' if inicio > 0 else '') + linea[inicio:fin] + ('...' if len(linea) > fin else '')
+
+
+def _diff_acotado(esperado_lines: List[str], obtenido_lines: List[str], max_lineas: int) -> Tuple[List[str], bool]:
+    """
+    Primeras max_lineas líneas del unified_diff y si hubo más. unified_diff es un
+    generador: se deja de consumir en cuanto se llena el resumen, sin formatear
+    los hunks restantes que de todos modos se descartarían.
+    """
+    diff = list(islice(unified_diff(
+        esperado_lines, obtenido_lines, fromfile='Esperado', tofile='Obtenido', lineterm=''
+    ), max_lineas + 1))
+    return diff[:max_lineas], len(diff) > max_lineas
+
+
+def _resumen_diferencias_streaming(esperado: str, obtenido: str, max_lineas: int) -> Optional[str]:
+    """
+    Compara línea a línea de forma perezosa y se detiene en la primera diferencia.
+    Solo se renderiza con unified_diff una ventana de contexto alrededor de ella,
+    así la memoria queda acotada aunque la salida tenga megabytes.
+    """
+    iter_esperado = _iter_norm_lines(esperado)
+    iter_obtenido = _iter_norm_lines(obtenido)
+    contexto = deque(maxlen=max_lineas)
+    linea_diferencia = None
+
+    for num_linea, (linea_esp, linea_obt) in enumerate(zip_longest(iter_esperado, iter_obtenido), start=1):
+        if linea_esp != linea_obt:
+            linea_diferencia = num_linea
+            break
+        contexto.append(linea_esp)
+
+    if linea_diferencia is None:
+        if esperado != obtenido:
+            return (f"Diferencias menores detectadas (posiblemente espacios). Representación (primeros {LARGE_OUTPUT_REPR_CHARS} caracteres):\n"
+                    f"Esperado: {repr(esperado[:LARGE_OUTPUT_REPR_CHARS])}\nObtenido: {repr(obtenido[:LARGE_OUTPUT_REPR_CHARS])}")
+        return None
+
+    # Ventana: contexto previo + línea divergente + hasta max_lineas líneas siguientes de cada lado
+    ventana_esperado = list(contexto) + ([linea_esp] if linea_esp is not None else []) + list(islice(iter_esperado, max_lineas))
+    ventana_obtenido = list(contexto) + ([linea_obt] if linea_obt is not None else []) + list(islice(iter_obtenido, max_lineas))
+
+    # Líneas muy largas (p. ej. toda la salida en una línea): recortar a una ventana de
+    # caracteres alrededor de la primera columna distinta, igual para todas las líneas
+    encabezado = f"Primera diferencia en la línea {linea_diferencia}"
+    linea_esp, linea_obt = linea_esp or "", linea_obt or ""
+    if max(len(linea_esp), len(linea_obt)) > 2 * DIFF_WINDOW_CHARS:
+        columna = next((k for k, (a, b) in enumerate(zip(linea_esp, linea_obt)) if a != b), min(len(linea_esp), len(linea_obt)))
+        inicio, fin = max(0, columna - DIFF_WINDOW_CHARS), columna + DIFF_WINDOW_CHARS
+        ventana_esperado = [_recortar_linea(linea, inicio, fin) for linea in ventana_esperado]
+        ventana_obtenido = [_recortar_linea(linea, inicio, fin) for linea in ventana_obtenido]
+        encabezado += f" (ventana del diff en el carácter {columna})"
+
+    diff, truncado = _diff_acotado(ventana_esperado, ventana_obtenido, max_lineas)
+    resumen = f"{encabezado}:\n" + '\n'.join(diff)
+    if truncado:
+        resumen += f"\n... (Diferencias truncadas a {max_lineas} líneas)"
+    return resumen
 
 
 def generar_resumen_diferencias(esperado: str, obtenido: str, max_lineas: int = DEFAULT_MAX_DIFF_LINES) -> Optional[str]:
     """Genera resumen de diferencias usando unified_diff."""
+    if len(esperado) + len(obtenido) >= STREAMING_DIFF_MIN_CHARS:
+        return _resumen_diferencias_streaming(esperado, obtenido, max_lineas)
+
     esperado_norm = normalize_output_flexibly(esperado)
     obtenido_norm = normalize_output_flexibly(obtenido)
 
@@ -320,31 +580,75 @@ def generar_resumen_diferencias(esperado: str, obtenido: str, max_lineas: int =
     esperado_lines = esperado_norm.splitlines()
     obtenido_lines = obtenido_norm.splitlines()
 
-    diff = list(unified_diff(
-        esperado_lines, obtenido_lines, fromfile='Esperado', tofile='Obtenido', lineterm=''
-    ))
+    diff, truncado = _diff_acotado(esperado_lines, obtenido_lines, max_lineas)
 
     if not diff:
         return f"Diferencias detectadas pero no mostradas por diff. Representación:\nEsperado: {repr(esperado)}\nObtenido: {repr(obtenido)}"
 
-    resumen = '\n'.join(diff[:max_lineas])
-    if len(diff) > max_lineas:
+    resumen = '\n'.join(diff)
+    if truncado:
         resumen += f"\n... (Diferencias truncadas a {max_lineas} líneas)"
     return resumen
 
 
-def get_herramienta_id(nombre_herramienta: str) -> Optional[int]:
-    """Busca el ID de una herramienta de análisis en la BD por su nombre interno."""
+# Caché por proceso de herramientas: nombre interno -> (id, nombre_mostrado).
+# La tabla HerramientaAnalisis es pequeña y solo cambia al sembrar datos: se carga
+# completa en una sola consulta la primera vez que se necesita.
+_herramientas_cache: Dict[str, Tuple[int, str]] = {}
+_herramientas_cache_cargada = False
+_herramientas_cache_lock = threading.Lock()
+
+
+def limpiar_cache_herramientas() -> None:
+    """Invalida la caché de herramientas (llamar si se modifica HerramientaAnalisis)."""
+    global _herramientas_cache_cargada
+    with _herramientas_cache_lock:
+        _herramientas_cache.clear()
+        _herramientas_cache_cargada = False
+
+
+def _cargar_cache_herramientas() -> None:
+    """Carga todas las herramientas en la caché con una única consulta."""
+    global _herramientas_cache_cargada
+    filas = db.session.query(HerramientaAnalisis.nombre, HerramientaAnalisis.id, HerramientaAnalisis.nombre_mostrado).all()
+    with _herramientas_cache_lock:
+        for nombre, herramienta_id, nombre_mostrado in filas:
+            _herramientas_cache[sys.intern(nombre)] = (herramienta_id, nombre_mostrado or nombre)
+        _herramientas_cache_cargada = True
+
+
+def obtener_info_herramienta(nombre_herramienta: str) -> Tuple[Optional[int], str]:
+    """
+    Devuelve (id, nombre_mostrado) de una herramienta por su nombre interno, memoizado
+    por proceso. Si no existe devuelve (None, nombre_herramienta).
+    """
+    # Claves y consultas internadas: el dict compara por identidad antes que carácter a carácter
+    nombre_herramienta = sys.intern(nombre_herramienta)
     try:
+        if not _herramientas_cache_cargada:
+            _cargar_cache_herramientas()
+        with _herramientas_cache_lock:
+            cached = _herramientas_cache.get(nombre_herramienta)
+        if cached is not None:
+            return cached
+        # Herramienta sembrada después de cargar la caché: buscarla individualmente
         herramienta = HerramientaAnalisis.query.filter_by(nombre=nombre_herramienta).first()
         if herramienta:
-            return herramienta.id
+            info = (herramienta.id, herramienta.nombre_mostrado or nombre_herramienta)
+            with _herramientas_cache_lock:
+                _herramientas_cache[nombre_herramienta] = info  # ya internado
+            return info
         else:
             log.warning(f"No se encontró la herramienta '{nombre_herramienta}' en la base de datos.")
-            return None
+            return None, nombre_herramienta
     except Exception as e:
         log.error(f"Error buscando herramienta '{nombre_herramienta}' en la BD: {e}")
-        return None
+        return None, nombre_herramienta
+
+
+def get_herramienta_id(nombre_herramienta: str) -> Optional[int]:
+    """Busca el ID de una herramienta de análisis en la BD por su nombre interno."""
+    return obtener_info_herramienta(nombre_herramienta)[0]
 
 
 def obtener_sufijo_archivo(lenguaje: str) -> str:
@@ -373,9 +677,10 @@ def limpiar_archivos_temporales(source_file_path: Optional[str], ejecutable_path
         except OSError as e:
             log.error(f"Error eliminando archivo fuente temporal {source_file_path}: {e}")
     
-    # Evitar borrar el fuente si es el mismo que el ejecutable (Python, PSeInt)
+    # Evitar borrar el fuente si es el mismo que el ejecutable (Python, PSeInt) y los ejecutables de la caché
     if (ejecutable_path and os.path.exists(ejecutable_path) and 
-        ejecutable_path != source_file_path and lenguaje == 'c'):
+        ejecutable_path != source_file_path and lenguaje == 'c' and
+        not _es_artefacto_cacheado(ejecutable_path)):
         try:
             os.remove(ejecutable_path)
             log.info(f'Ejecutable C eliminado: {ejecutable_path}')
@@ -386,22 +691,351 @@ def limpiar_archivos_temporales(source_file_path: Optional[str], ejecutable_path
 # === Funciones de Evaluación ===
 # =========================================================
 
-def ejecutar_caso_prueba(caso: CasoDePrueba, base_command: List[str], timeout_sec: int) -> ResultadoDeEvaluacion:
+def _decodificar_salida(datos: Optional[bytes]) -> str:
+    """Decodifica la salida capturada en bytes igual que text=True (UTF-8 con reemplazo y saltos de línea universales)."""
+    if not datos:
+        return ""
+    texto = datos.decode('utf-8', 'replace')
+    if '\r' in texto:
+        texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+    return texto
+
+
+def _bytes_comparables(datos: bytes) -> bytes:
+    """Forma mínima para el camino rápido de comparación: finales de línea \n y sin espacios en los extremos."""
+    if b'\r\n' in datos:
+        datos = datos.replace(b'\r\n', b'\n')
+    return datos.strip()
+
+
+def _ejecutar_con_fail_fast(command: List[str], stdin_bytes: bytes, esperada_bytes: bytes,
+                            timeout_sec: int) -> Tuple[Optional[int], bytes, bytes, Optional[int]]:
+    """
+    Ejecuta el comando leyendo stdout por bloques y lo compara en vivo contra esperada_bytes
+    (misma forma que _bytes_comparables). En la primera divergencia mata el proceso.
+    Devuelve (returncode, stdout, stderr, offset_divergencia); offset es None si no hubo divergencia.
+    Lanza subprocess.TimeoutExpired si se supera timeout_sec.
+    """
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    timeout_alcanzado = threading.Event()
+
+    def _matar_por_timeout():
+        timeout_alcanzado.set()
+        proc.kill()
+
+    def _escribir_stdin():
+        try:
+            if stdin_bytes:
+                proc.stdin.write(stdin_bytes)
+        except (BrokenPipeError, OSError):
+            pass  # El programa terminó (o fue terminado) sin leer toda la entrada
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    stderr_chunks: List[bytes] = []
+    temporizador = threading.Timer(timeout_sec, _matar_por_timeout)
+    hilo_stdin = threading.Thread(target=_escribir_stdin, daemon=True)
+    hilo_stderr = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    temporizador.start()
+    hilo_stdin.start()
+    hilo_stderr.start()
+
+    stdout_buf = bytearray()
+    pos = 0                 # Posición ya verificada dentro de esperada_bytes
+    iniciado = False        # Se ignoran los espacios iniciales (equivale al strip())
+    cr_pendiente = b""      # '\r' al final de un bloque: puede ser parte de '\r\n'
+    offset_divergencia = None
+    fd = proc.stdout.fileno()
+    try:
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            stdout_buf += chunk
+            segmento = cr_pendiente + chunk
+            cr_pendiente = b""
+            if segmento.endswith(b'\r'):
+                segmento, cr_pendiente = segmento[:-1], b'\r'
+            segmento = segmento.replace(b'\r\n', b'\n')
+            if not iniciado:
+                segmento = segmento.lstrip()
+                if not segmento:
+                    continue
+                iniciado = True
+            esperado = esperada_bytes[pos:pos + len(segmento)]
+            if segmento[:len(esperado)] != esperado:
+                idx = next(i for i, (a, b) in enumerate(zip(segmento, esperado)) if a != b)
+                offset_divergencia = pos + idx
+            elif len(segmento) > len(esperado) and segmento[len(esperado):].strip():
+                # Salida extra que no es solo espacio final
+                offset_divergencia = len(esperada_bytes)
+            if offset_divergencia is not None:
+                proc.kill()
+                break
+            pos += len(segmento)
+        returncode = proc.wait()
+    finally:
+        temporizador.cancel()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        hilo_stdin.join()
+        hilo_stderr.join()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    if timeout_alcanzado.is_set() and offset_divergencia is None:
+        raise subprocess.TimeoutExpired(command, timeout_sec, output=bytes(stdout_buf))
+    return returncode, bytes(stdout_buf), b"".join(stderr_chunks), offset_divergencia
+
+
+def _first_diff_window(a: str, b: str, pad: int = 64) -> Tuple[int, str, str]:
+    """
+    Devuelve (índice, ventana_a, ventana_b) con ±pad caracteres alrededor del primer
+    carácter distinto. Los bloques iguales se saltan comparando slices (en C); solo el
+    bloque que difiere se recorre carácter a carácter, así que salidas de varios MB no
+    cuestan un bucle de Python por carácter.
+    """
+    limite = min(len(a), len(b))
+    i = 0
+    while i < limite and a[i:i + DIFF_BLOQUE_CHARS] == b[i:i + DIFF_BLOQUE_CHARS]:
+        i += DIFF_BLOQUE_CHARS
+    i = min(i, limite)
+    fin = min(i + DIFF_BLOQUE_CHARS, limite)
+    i = next((k for k in range(i, fin) if a[k] != b[k]), fin)
+    inicio = max(0, i - pad)
+    return i, a[inicio:i + pad], b[inicio:i + pad]
+
+
+def _acotar_repr(valor_repr: Optional[str]) -> Optional[str]:
+    """Trunca un repr() demasiado largo antes de guardarlo en la BD."""
+    if valor_repr is None or len(valor_repr) <= REPR_MAX_CHARS:
+        return valor_repr
+    return valor_repr[:REPR_MAX_CHARS] + f"... (truncado, {len(valor_repr)} caracteres en total)"
+
+
+# Servidor "fork" para Python: un intérprete ya iniciado recibe casos por stdin (una línea
+# JSON por caso) y hace fork() por cada uno, ahorrando el arranque del intérprete por caso.
+# Solo POSIX y opcional (EVALUADOR_PYTHON_FORKSERVER=1): el código del alumno corre en un hijo
+# del intérprete del servidor, no en un "python script.py" limpio. Si falla, se usa el subprocess normal.
+PYTHON_FORKSERVER = hasattr(os, 'fork') and os.environ.get('EVALUADOR_PYTHON_FORKSERVER', '0').lower() in ('1', 'true', 'si', 'sí', 'yes')
+
+_PYTHON_FORKSERVER_SRC = r'''
+import atexit, gc, io, json, os, runpy, signal, sys, threading, time, traceback, warnings
+script = sys.argv[1]
+canal = sys.stdout
+lock = threading.Lock()
+lock_fork = threading.Lock()
+
+def finalizar(code):
+    # Emula el cierre del intérprete de "python script.py": espera los hilos no daemon,
+    # ejecuta los atexit y vacía los archivos que el alumno dejó abiertos.
+    try:
+        threading._shutdown()
+    except Exception:
+        traceback.print_exc()
+    atexit._run_exitfuncs()
+    gc.collect()  # rompe los ciclos del módulo del alumno: sus archivos se cierran al destruirse
+    for obj in gc.get_objects():
+        # canal (el pipe del servidor) puede tener en su buffer una respuesta a medias de otro hilo
+        if isinstance(obj, io.IOBase) and obj is not canal:
+            try:
+                obj.flush()
+            except Exception:
+                pass
+    os._exit(code & 0xFF)
+
+def hijo(req):
+    for fd, path, flags in ((0, req["stdin"], os.O_RDONLY), (1, req["stdout"], os.O_WRONLY), (2, req["stderr"], os.O_WRONLY)):
+        f = os.open(path, flags)
+        os.dup2(f, fd)
+        os.close(f)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", closefd=False)
+    sys.stderr = open(2, "w", closefd=False, errors="backslashreplace")
+    sys.argv = [script] + req["argv"]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    code = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException as e:
+        # Omitir los marcos del servidor/runpy para que el traceback se vea como con "python script.py"
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != script:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        code = 1
+    finalizar(code)
+
+def atender(req):
+    # El aviso de fork() con hilos se silencia solo alrededor de la llamada; al salir del
+    # with, padre e hijo restauran los filtros, así el alumno ve los mismos avisos que con python.
+    with lock_fork, warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        pid = os.fork()
+    if pid == 0:
+        # En el hijo este hilo hace de hilo principal: como en python, no es daemon, así los
+        # hilos que cree el alumno heredan daemon=False y finalizar() los espera.
+        threading.current_thread()._daemonic = False
+        try:
+            hijo(req)
+        finally:
+            os._exit(70)
+    vencido = threading.Event()
+    def matar():
+        vencido.set()
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    timer = threading.Timer(req["timeout"], matar)
+    timer.start()
+    _, status = os.waitpid(pid, 0)
+    timer.cancel()
+    with lock:
+        canal.write(json.dumps({"id": req["id"], "returncode": os.waitstatus_to_exitcode(status), "timeout": vencido.is_set()}) + "\n")
+        canal.flush()
+
+for linea in sys.stdin:
+    threading.Thread(target=atender, args=(json.loads(linea),), daemon=True).start()
+'''
+
+
+class ServidorPython:
+    """
+    Cliente del servidor fork de Python para un script. Es seguro usarlo desde varios hilos:
+    cada caso se identifica con un id y su respuesta se despacha desde un hilo lector.
+    """
+
+    def __init__(self, script_path: str, python_cmd: str):
+        self.script_path = script_path
+        self._dir = tempfile.mkdtemp(prefix='evaluador_fork_')
+        self._proc = subprocess.Popen(
+            [python_cmd, '-c', _PYTHON_FORKSERVER_SRC, script_path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1
+        )
+        self._lock = threading.Lock()
+        self._siguiente_id = 0
+        self._pendientes: Dict[int, Tuple[threading.Event, Dict[str, Any]]] = {}
+        self._lector = threading.Thread(target=self._leer_respuestas, daemon=True)
+        self._lector.start()
+
+    def _leer_respuestas(self) -> None:
+        for linea in self._proc.stdout:
+            respuesta = json.loads(linea)
+            with self._lock:
+                evento, destino = self._pendientes.pop(respuesta["id"], (None, None))
+            if evento is not None:
+                destino.update(respuesta)
+                evento.set()
+        # El servidor terminó: liberar a quien siga esperando
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        for evento, _ in pendientes.values():
+            evento.set()
+
+    def activo(self) -> bool:
+        return self._proc.poll() is None
+
+    def ejecutar(self, args: List[str], stdin_bytes: bytes, timeout_sec: int) -> Tuple[int, bytes, bytes]:
+        """Ejecuta el script como lo haría subprocess.run; lanza TimeoutExpired si se excede timeout_sec."""
+        with self._lock:
+            caso_id = self._siguiente_id
+            self._siguiente_id += 1
+            evento, respuesta = threading.Event(), {}
+            self._pendientes[caso_id] = (evento, respuesta)
+        rutas = {nombre: os.path.join(self._dir, f"{caso_id}.{nombre}") for nombre in ('stdin', 'stdout', 'stderr')}
+        try:
+            with open(rutas['stdin'], 'wb') as f:
+                f.write(stdin_bytes)
+            open(rutas['stdout'], 'wb').close()
+            open(rutas['stderr'], 'wb').close()
+            peticion = json.dumps({"id": caso_id, "argv": args, "timeout": timeout_sec, **rutas})
+            with self._lock:
+                self._proc.stdin.write(peticion + "\n")
+                self._proc.stdin.flush()
+            # Margen sobre el timeout: el propio servidor mata al hijo al vencer
+            if not evento.wait(timeout_sec + 5) or "returncode" not in respuesta:
+                raise RuntimeError("El servidor fork de Python no respondió")
+            with open(rutas['stdout'], 'rb') as f:
+                stdout_bytes = f.read()
+            if respuesta["timeout"]:
+                raise subprocess.TimeoutExpired(self.script_path, timeout_sec, output=stdout_bytes)
+            with open(rutas['stderr'], 'rb') as f:
+                stderr_bytes = f.read()
+            return respuesta["returncode"], stdout_bytes, stderr_bytes
+        finally:
+            with self._lock:
+                self._pendientes.pop(caso_id, None)
+            for ruta in rutas.values():
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+    def cerrar(self) -> None:
+        try:
+            self._proc.stdin.close()  # Fin de la entrada: el servidor sale del bucle
+            self._proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+            self._proc.wait()
+        self._lector.join(timeout=1)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+def iniciar_servidor_python(base_command: List[str]) -> Optional[ServidorPython]:
+    """Inicia el servidor fork si base_command es [python, script.py]; None si no aplica o falla."""
+    if not PYTHON_FORKSERVER or len(base_command) != 2 or not base_command[1].endswith('.py'):
+        return None
+    try:
+        return ServidorPython(base_command[1], base_command[0])
+    except Exception as e:
+        log.warning("No se pudo iniciar el servidor fork de Python, se usará subprocess: %s", e)
+        return None
+
+
+def ejecutar_caso_prueba(caso: CasoDePrueba, base_command: List[str], timeout_sec: int,
+                         servidor: Optional[ServidorPython] = None) -> ResultadoDeEvaluacion:
     """Ejecuta un único caso de prueba y devuelve el objeto ResultadoDeEvaluacion."""
-    args_list = caso.obtener_argumentos()
-    stdin_input = normalize_output_flexibly(caso.entrada if caso.entrada is not None else "")
-    salida_esperada_original = caso.salida_esperada if caso.salida_esperada is not None else ""
-    
+    args_list = caso.argumentos_parsed  # memoizada: solo lectura
+    # La entrada se envía tal cual (la normalización flexible solo aplica a la comparación);
+    # únicamente se unifican los finales de línea \r\n que llegan desde formularios web
+    stdin_bytes = (caso.entrada or "").encode('utf-8')
+    if b'\r\n' in stdin_bytes:
+        stdin_bytes = stdin_bytes.replace(b'\r\n', b'\n')
+    salida_esperada_original, salida_esperada_norm, esperada_bytes = salida_esperada_preparada(caso)
+
+    # Cada repr() se calcula una sola vez y se reutiliza en logs y en la BD
+    args_repr = repr(args_list)
+    entrada_repr = repr(caso.entrada) if caso.entrada else None
+    esperada_repr = repr(salida_esperada_original)
+    stdout_repr: Optional[str] = None
+    stderr_repr: Optional[str] = None
+
+    # Los repr() de entradas/salidas pueden ser enormes: solo se calculan si DEBUG está activo
+    debug_activo = log.isEnabledFor(logging.DEBUG)
+
     # --- LOG INICIAL DE DATOS DEL CASO ---
-    log.debug(f"--- INICIO CASO {caso.id} ---")
-    log.debug(f"Caso ID: {caso.id}, Descripción: {caso.descripcion}")
-    log.debug(f"Argumentos: {args_list}")
-    log.debug(f"Entrada STDIN Original (repr): {repr(caso.entrada)}")
-    log.debug(f"Entrada STDIN Normalizada (repr): {repr(stdin_input)}")
-    log.debug(f"Salida Esperada Original (repr): {repr(salida_esperada_original)}")
-    
-    salida_esperada_norm = normalize_output_flexibly(salida_esperada_original).strip() # <--- AÑADIR .strip() AQUÍ
-    log.debug(f"Salida Esperada Normalizada y Stripped (repr): {repr(salida_esperada_norm)}")
+    if debug_activo:
+        log.debug("--- INICIO CASO %s ---", caso.id)
+        log.debug("Caso ID: %s, Descripción: %s", caso.id, caso.descripcion)
+        log.debug("Argumentos: %s", args_repr)
+        log.debug("Entrada STDIN Original (repr): %s", entrada_repr)
+        log.debug("Salida Esperada Original (repr): %s", esperada_repr)
+        log.debug("Salida Esperada Normalizada y Stripped (repr): %r", salida_esperada_norm)
     # --- FIN LOG INICIAL ---
 
     stdout_obtenido, stderr_obtenido = "", ""
@@ -414,52 +1048,74 @@ def ejecutar_caso_prueba(caso: CasoDePrueba, base_command: List[str], timeout_se
 
     try:
         final_command = base_command + args_list
-        log.info(f'Ejecutando caso {caso.id} (Desc: {caso.descripcion}): {" ".join(map(shlex.quote, final_command))}')
-        if stdin_input: 
-            log.debug(f'  -> Stdin a enviar: {repr(stdin_input)}') # Mostrar exactamente lo que se envía
+        if log.isEnabledFor(logging.INFO):
+            log.info("Ejecutando caso %s (Desc: %s): %s", caso.id, caso.descripcion, shlex.join(final_command))
+        if stdin_bytes and debug_activo:
+            log.debug('  -> Stdin a enviar: %r', stdin_bytes) # Mostrar exactamente lo que se envía
 
         estado_ejecucion = "ejecutando"
-        execute_process = subprocess.run(
-            final_command,
-            input=stdin_input,
-            capture_output=True,
-            timeout=timeout_sec,
-            text=True, # Importante para decodificar a string
-            encoding='utf-8', # Especificar encoding
-            errors='replace'  # Reemplazar caracteres inválidos en la decodificación
-        )
+        offset_divergencia = None
+        if FAIL_FAST_CASOS and esperada_bytes is not None:
+            codigo_retorno, stdout_bytes, stderr_bytes, offset_divergencia = _ejecutar_con_fail_fast(
+                final_command, stdin_bytes, esperada_bytes, timeout_sec)
+        elif servidor is not None and servidor.activo():
+            codigo_retorno, stdout_bytes, stderr_bytes = servidor.ejecutar(args_list, stdin_bytes, timeout_sec)
+        else:
+            # Se captura en bytes: la decodificación se hace una sola vez en _decodificar_salida
+            execute_process = subprocess.run(
+                final_command,
+                input=stdin_bytes,
+                capture_output=True,
+                timeout=timeout_sec
+            )
+            codigo_retorno = execute_process.returncode
+            stdout_bytes, stderr_bytes = execute_process.stdout, execute_process.stderr
         tiempo_fin = time.monotonic()
         tiempo_ejecucion_ms = int((tiempo_fin - tiempo_inicio) * 1000)
-        codigo_retorno = execute_process.returncode
-        estado_ejecucion = "completado" if codigo_retorno == 0 else f"error_exitcode_{codigo_retorno}"
+        if offset_divergencia is not None:
+            estado_ejecucion = "fail_fast"
+            log.info("Caso %s: stdout divergió en el byte %d, proceso terminado anticipadamente.", caso.id, offset_divergencia)
+        else:
+            estado_ejecucion = "completado" if codigo_retorno == 0 else f"error_exitcode_{codigo_retorno}"
 
-        stdout_obtenido = execute_process.stdout
-        stderr_obtenido = execute_process.stderr
+        stdout_obtenido = _decodificar_salida(stdout_bytes)
+        stderr_obtenido = _decodificar_salida(stderr_bytes)
+        stdout_repr = repr(stdout_obtenido)
+        stderr_repr = repr(stderr_obtenido) if stderr_obtenido else None
 
-        # --- LOG DE SALIDAS OBTENIDAS ---
-        log.debug(f"--- SALIDAS OBTENIDAS CASO {caso.id} ---")
-        log.debug(f"STDOUT Original (repr): {repr(stdout_obtenido)}")
-        log.debug(f"STDERR Original (repr): {repr(stderr_obtenido)}")
+        if offset_divergencia is None and esperada_bytes is not None and _bytes_comparables(stdout_bytes or b"") == esperada_bytes:
+            # Camino rápido: coincidencia exacta, no hace falta normalizar el stdout
+            stdout_obtenido_norm = salida_esperada_norm
+        else:
+            stdout_obtenido_norm = normalize_output_flexibly(stdout_obtenido).strip()  # Salida única por entrega: no se cachea
 
-        stdout_obtenido_norm = normalize_output_flexibly(stdout_obtenido).strip() # <--- AÑADIR .strip() AQUÍ
-        log.debug(f"STDOUT Normalizado y Stripped (repr): {repr(stdout_obtenido_norm)}")
+        # --- LOG DE SALIDAS OBTENIDAS ---
+        if debug_activo:
+            log.debug("--- SALIDAS OBTENIDAS CASO %s ---", caso.id)
+            log.debug("STDOUT Original (repr): %s", stdout_repr)
+            log.debug("STDERR Original (repr): %s", stderr_repr)
+            log.debug("STDOUT Normalizado y Stripped (repr): %r", stdout_obtenido_norm)
         # --- FIN LOG SALIDAS ---
 
         # --- COMPARACIÓN ---
-        paso_total = (stdout_obtenido_norm == salida_esperada_norm)
-        log.debug(f"Comparación: stdout_obtenido_norm == salida_esperada_norm -> {paso_total}")
-        if not paso_total:
-            log.warning(f"FALLO EN COMPARACIÓN para Caso {caso.id}:")
-            log.warning(f"  Esperado (norm+strip, repr): {repr(salida_esperada_norm)}")
-            log_multiline_string("  Obtenido (norm+strip, repr):", repr(stdout_obtenido_norm)) # Para ver saltos de línea como \n
-            log_multiline_string("  Obtenido (norm+strip, literal):", stdout_obtenido_norm) # Para ver cómo se ve
-            # También es útil ver los bytes para detectar caracteres invisibles
-            log.warning(f"  Esperado (bytes): {salida_esperada_norm.encode('utf-8', 'replace')}")
-            log.warning(f"  Obtenido (bytes): {stdout_obtenido_norm.encode('utf-8', 'replace')}")
+        paso_total = offset_divergencia is None and (stdout_obtenido_norm == salida_esperada_norm)
+        if debug_activo:
+            log.debug("Comparación: stdout_obtenido_norm == salida_esperada_norm -> %s", paso_total)
+        if not paso_total and log.isEnabledFor(logging.WARNING):
+            # Solo la ventana alrededor de la primera diferencia: el costo del log no crece con la salida
+            pos_diff, esperado_ventana, obtenido_ventana = _first_diff_window(salida_esperada_norm, stdout_obtenido_norm)
+            log.warning("FALLO EN COMPARACIÓN para Caso %s: primera diferencia en el carácter %d "
+                        "(longitudes: esperado %d, obtenido %d)", caso.id, pos_diff,
+                        len(salida_esperada_norm), len(stdout_obtenido_norm))
+            log.warning("  Esperado (norm+strip, ventana, repr): %r", esperado_ventana)
+            log.warning("  Obtenido (norm+strip, ventana, repr): %r", obtenido_ventana)
+            # Los bytes ayudan a detectar caracteres invisibles
+            log.warning("  Esperado (bytes, ventana): %s", esperado_ventana.encode('utf-8', 'replace'))
+            log.warning("  Obtenido (bytes, ventana): %s", obtenido_ventana.encode('utf-8', 'replace'))
 
 
         if codigo_retorno != 0 and stderr_obtenido:
-            log.warning(f"Caso {caso.id} tuvo error en stderr (código {codigo_retorno}): {stderr_obtenido[:200]}...")
+            log.warning("Caso %s tuvo error en stderr (código %s): %s...", caso.id, codigo_retorno, stderr_obtenido[:200])
             # Si un error en stderr debe hacer fallar el caso aunque el stdout coincida:
             # if paso_total: # Si había pasado por stdout pero hay error en stderr
             #     log.warning(f"Caso {caso.id} pasó por STDOUT pero falló por STDERR no vacío.")
@@ -468,44 +1124,52 @@ def ejecutar_caso_prueba(caso: CasoDePrueba, base_command: List[str], timeout_se
         if not paso_total: # Volver a generar diferencias si paso_total es False
             diferencias_resumen = generar_resumen_diferencias(salida_esperada_norm, stdout_obtenido_norm)
             if diferencias_resumen:
-                log.warning(f"Resumen de Diferencias Caso {caso.id}:\n{diferencias_resumen}")
+                log.warning("Resumen de Diferencias Caso %s:\n%s", caso.id, diferencias_resumen)
             else:
-                log.warning(f"Caso {caso.id} falló pero generar_resumen_diferencias no encontró diferencias visuales (podría ser espacios finales o caracteres invisibles).")
+                log.warning("Caso %s falló pero generar_resumen_diferencias no encontró diferencias visuales (podría ser espacios finales o caracteres invisibles).", caso.id)
 
 
         log_level = logging.INFO if paso_total else logging.WARNING
-        log.log(log_level, f'Resultado final Caso {caso.id}: {"OK" if paso_total else "Falló"} ({tiempo_ejecucion_ms} ms)')
+        log.log(log_level, "Resultado final Caso %s: %s (%s ms)", caso.id, "OK" if paso_total else "Falló", tiempo_ejecucion_ms)
 
     except subprocess.TimeoutExpired:
         # ... (tu manejo de Timeout sin cambios) ...
         tiempo_fin = time.monotonic()
         tiempo_ejecucion_ms = int((tiempo_fin - tiempo_inicio) * 1000)
         estado_ejecucion = "timeout"
-        log.warning(f'Timeout ({timeout_sec}s) caso {caso.id}.')
+        log.warning('Timeout (%ss) caso %s.', timeout_sec, caso.id)
         stdout_obtenido = "<TIMEOUT>"
+        stdout_repr = None
         paso_total = False
     except Exception as e:
         # ... (tu manejo de Exception sin cambios) ...
         tiempo_fin = time.monotonic()
         tiempo_ejecucion_ms = int((tiempo_fin - tiempo_inicio) * 1000) if tiempo_inicio else None
         estado_ejecucion = "error_interno_eval"
-        log.error(f'Excepción caso {caso.id}: {e}', exc_info=True)
+        log.error('Excepción caso %s: %s', caso.id, e, exc_info=True)
         stdout_obtenido = f"<ERROR INTERNO EVALUADOR: {e}>"
         stderr_obtenido = str(e)
+        stdout_repr = stderr_repr = None
         paso_total = False
 
+    # En los caminos de timeout/error la salida cambió: calcular los repr que falten
+    if stdout_repr is None:
+        stdout_repr = repr(stdout_obtenido)
+    if stderr_repr is None and stderr_obtenido:
+        stderr_repr = repr(stderr_obtenido)
+
     # Crear objeto resultado
     resultado_db = ResultadoDeEvaluacion(
         paso=paso_total,
         salida_obtenida=stdout_obtenido, # Guardar el stdout original
         puntos_obtenidos=caso.puntos if paso_total else 0.0,
         caso_de_prueba_id=caso.id,
-        salida_obtenida_repr=repr(stdout_obtenido), # repr del original
-        salida_esperada_repr=repr(salida_esperada_original), # repr del original
-        entrada_repr=repr(caso.entrada) if caso.entrada else None,
-        argumentos_repr=repr(args_list),
+        salida_obtenida_repr=_acotar_repr(stdout_repr), # repr del original
+        salida_esperada_repr=_acotar_repr(esperada_repr), # repr del original
+        entrada_repr=_acotar_repr(entrada_repr),
+        argumentos_repr=_acotar_repr(args_repr),
         stderr_obtenido=stderr_obtenido,
-        stderr_obtenido_repr=repr(stderr_obtenido) if stderr_obtenido else None,
+        stderr_obtenido_repr=_acotar_repr(stderr_repr),
         tiempo_ejecucion_ms=tiempo_ejecucion_ms,
         estado_ejecucion=estado_ejecucion,
         codigo_retorno=codigo_retorno,
@@ -514,19 +1178,83 @@ def ejecutar_caso_prueba(caso: CasoDePrueba, base_command: List[str], timeout_se
     )
     return resultado_db
 
+def ejecutar_casos_prueba(casos: List[CasoDePrueba], base_command: List[str], timeout_sec: int,
+                          max_workers: int = MAX_WORKERS_CASOS, lenguaje: Optional[str] = None) -> List[ResultadoDeEvaluacion]:
+    """
+    Ejecuta todos los casos de prueba y devuelve los resultados en el mismo orden que los casos.
+    Cada caso corre en su propio subproceso, así que basta con hilos para solaparlos: el hilo
+    solo espera al proceso hijo (sin GIL) y se evita serializar objetos ORM entre procesos.
+    """
+    # Python con varios casos: un solo intérprete residente hace fork() por caso
+    servidor = iniciar_servidor_python(base_command) if lenguaje == 'python' and len(casos) > 1 and not FAIL_FAST_CASOS else None
+    try:
+        if max_workers <= 1 or len(casos) <= 1:
+            return [_ejecutar_caso_limitado(caso, base_command, timeout_sec, servidor) for caso in casos]
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(casos))) as executor:
+            futures = [executor.submit(_ejecutar_caso_limitado, caso, base_command, timeout_sec, servidor) for caso in casos]
+            return [future.result() for future in futures]
+    finally:
+        if servidor is not None:
+            servidor.cerrar()
+
+
+def _ejecutar_caso_limitado(caso: CasoDePrueba, base_command: List[str], timeout_sec: int,
+                            servidor: Optional[ServidorPython] = None) -> ResultadoDeEvaluacion:
+    """ejecutar_caso_prueba bajo el semáforo global de subprocesos (acota la carga con varias entregas a la vez)."""
+    with _semaforo_subprocesos:
+        return ejecutar_caso_prueba(caso, base_command, timeout_sec, servidor)
+
 # Nueva función de utilidad para loggear strings multilínea
 def log_multiline_string(prefix: str, content: str):
-    """Loggea un string que puede tener múltiples líneas, añadiendo un prefijo a cada línea."""
-    for i, line_content in enumerate(content.splitlines()):
-        log.warning(f"{prefix} (línea {i+1}): {line_content}")
-    if not content.splitlines(): # Si es una cadena vacía o solo espacios sin saltos de línea
-        log.warning(f"{prefix} (vacío o solo espacios): {repr(content)}")
+    """Loggea un string que puede tener múltiples líneas, añadiendo un prefijo a cada línea (en un solo registro)."""
+    if not log.isEnabledFor(logging.WARNING):
+        return
+    lineas = content.splitlines()
+    if not lineas: # Si es una cadena vacía o solo espacios sin saltos de línea
+        log.warning("%s (vacío o solo espacios): %r", prefix, content)
+        return
+    log.warning("%s", "\n".join(f"{prefix} (línea {i}): {line_content}" for i, line_content in enumerate(lineas, start=1)))
+
+
+def _hash_archivo(path: str, *extra: str) -> str:
+    """SHA-256 del contenido de un archivo (más parámetros extra, p. ej. flags de compilación)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        h.update(f.read())
+    for item in extra:
+        h.update(b'\0' + item.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _es_artefacto_cacheado(path: Optional[str]) -> bool:
+    """Indica si un path pertenece a la caché de compilación (no debe borrarse al limpiar)."""
+    if not path:
+        return False
+    cache_dir = os.path.abspath(COMPILE_CACHE_DIR)
+    return os.path.commonpath([os.path.abspath(path), cache_dir]) == cache_dir
+
+
+def _podar_cache_compilacion() -> int:
+    """Poda LRU de los artefactos C y Java de COMPILE_CACHE_DIR (ver disk_cache.podar_cache_lru)."""
+    return sum(
+        podar_cache_lru(os.path.join(COMPILE_CACHE_DIR, subdir), COMPILE_CACHE_MAX_ENTRADAS,
+                        COMPILE_CACHE_MAX_BYTES, COMPILE_CACHE_MAX_EDAD_SEG)
+        for subdir in ('c', 'java')
+    )
+
+
+# Al arrancar: la caché de ejecuciones anteriores del proceso pudo crecer sin tope
+_podar_cache_compilacion()
 
 
 def compilar_codigo(source_file_path: str, lenguaje: str) -> Tuple[Optional[str], Optional[str], List[str]]:
     """
     Compila el código según el lenguaje y devuelve una tupla con:
     (ejecutable_path, error_compilation, base_command)
+    Los artefactos de C y Java se guardan en COMPILE_CACHE_DIR indexados por el hash del
+    código, de modo que un reenvío idéntico no vuelve a invocar gcc/javac; cada artefacto nuevo
+    dispara una poda LRU de la caché (_podar_cache_compilacion).
     """
     ejecutable_path = None
     compile_error_output = None
@@ -534,15 +1262,25 @@ def compilar_codigo(source_file_path: str, lenguaje: str) -> Tuple[Optional[str]
     
     try:
         if lenguaje == 'c':
-            base_name = os.path.splitext(source_file_path)[0]
-            ejecutable_path = base_name + ('.exe' if sys.platform == 'win32' else '')
-            compile_command = ['gcc', '-Wall', '-Wextra', '-std=c11', source_file_path, '-o', ejecutable_path, '-lm']
-            log.info(f'Compilando C: {" ".join(map(shlex.quote, compile_command))}')
-            compile_process = subprocess.run(compile_command, capture_output=True, text=True)
-            if compile_process.returncode != 0:
-                compile_error_output = f"Error de compilación:\n{compile_process.stderr}"
-            else:
+            source_hash = _hash_archivo(source_file_path, *C_COMPILE_FLAGS)
+            ejecutable_path = os.path.join(COMPILE_CACHE_DIR, 'c', source_hash + ('.exe' if sys.platform == 'win32' else ''))
+            if tocar_artefacto(ejecutable_path):
+                log.info(f'Ejecutable C reutilizado desde caché: {ejecutable_path}')
                 base_execute_command = [ejecutable_path]
+            else:
+                os.makedirs(os.path.dirname(ejecutable_path), exist_ok=True)
+                # Compilar a un nombre temporal y renombrar de forma atómica (evita carreras entre evaluaciones)
+                ejecutable_tmp = f"{ejecutable_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                compile_command = ['gcc', *C_COMPILE_FLAGS, source_file_path, '-o', ejecutable_tmp, '-lm']
+                log.info(f'Compilando C: {" ".join(map(shlex.quote, compile_command))}')
+                compile_process = subprocess.run(compile_command, capture_output=True, text=True)
+                if compile_process.returncode != 0:
+                    compile_error_output = f"Error de compilación:\n{compile_process.stderr}"
+                    ejecutable_path = None
+                else:
+                    os.replace(ejecutable_tmp, ejecutable_path)
+                    base_execute_command = [ejecutable_path]
+                    _podar_cache_compilacion()
         
         elif lenguaje == 'python':
             python_cmd = sys.executable or 'python3'
@@ -551,14 +1289,31 @@ def compilar_codigo(source_file_path: str, lenguaje: str) -> Tuple[Optional[str]
         
         elif lenguaje == 'java':
             base_name = os.path.splitext(source_file_path)[0]
-            compile_command = ['javac', source_file_path]
-            log.info(f'Compilando Java: {" ".join(map(shlex.quote, compile_command))}')
-            compile_process = subprocess.run(compile_command, capture_output=True, text=True)
-            if compile_process.returncode != 0:
-                compile_error_output = f"Error de compilación:\n{compile_process.stderr}"
+            source_hash = _hash_archivo(source_file_path)
+            with _java_cache_lock:
+                cached = _java_compile_cache.get(source_hash)
+                if cached:
+                    _java_compile_cache.move_to_end(source_hash)
+            if cached and tocar_artefacto(cached[0]):
+                class_dir, base_execute_command = cached[0], list(cached[1])
+                log.info(f'Clases Java reutilizadas desde caché: {class_dir}')
             else:
-                base_execute_command = ['java', '-cp', os.path.dirname(source_file_path), os.path.basename(base_name)]
-                ejecutable_path = base_name + '.class'
+                class_dir = os.path.join(COMPILE_CACHE_DIR, 'java', source_hash)
+                os.makedirs(class_dir, exist_ok=True)
+                compile_command = ['javac', '-d', class_dir, source_file_path]
+                log.info(f'Compilando Java: {" ".join(map(shlex.quote, compile_command))}')
+                compile_process = subprocess.run(compile_command, capture_output=True, text=True)
+                if compile_process.returncode != 0:
+                    compile_error_output = f"Error de compilación:\n{compile_process.stderr}"
+                else:
+                    base_execute_command = ['java', *JAVA_RUN_FLAGS, '-cp', class_dir, os.path.basename(base_name)]
+                    with _java_cache_lock:
+                        _java_compile_cache[source_hash] = (class_dir, list(base_execute_command))
+                        if len(_java_compile_cache) > COMPILE_CACHE_MAX_ENTRADAS:
+                            _java_compile_cache.popitem(last=False)
+                    _podar_cache_compilacion()
+            if base_execute_command:
+                ejecutable_path = os.path.join(class_dir, base_execute_command[-1] + '.class')
         
         else:
             compile_error_output = f"Error: Lenguaje '{lenguaje}' no soportado para ejecución."
@@ -571,11 +1326,52 @@ def compilar_codigo(source_file_path: str, lenguaje: str) -> Tuple[Optional[str]
     return ejecutable_path, compile_error_output, base_execute_command
 
 
+def preparar_y_compilar(codigo_fuente: str, lenguaje: str) -> Tuple[Optional[str], Optional[str], Optional[str], List[str]]:
+    """
+    Crea el archivo temporal con el código y lo compila/prepara según el lenguaje.
+    Pensada para ejecutarse en segundo plano mientras corren los análisis estáticos.
+    Devuelve una tupla con:
+    (source_file_path, ejecutable_path, error_compilation, base_command)
+    """
+    source_file_path = None
+    try:
+        suffix = obtener_sufijo_archivo(lenguaje)
+        # Escritura directa con os.write: sin TextIOWrapper ni buffer intermedio
+        fd, source_file_path = tempfile.mkstemp(suffix=suffix, dir=TEMP_SOURCE_DIR)
+        try:
+            datos = memoryview(codigo_fuente.encode('utf-8'))
+            while datos:
+                datos = datos[os.write(fd, datos):]
+        finally:
+            os.close(fd)
+        log.info(f'Archivo temporal creado: {source_file_path}')
+    except Exception as e:
+        log.error(f"Error creando archivo temporal: {e}", exc_info=True)
+        return source_file_path, None, f"Error creando archivo temporal: {e}", []
+
+    ejecutable_path, compile_error, base_execute_command = compilar_codigo(source_file_path, lenguaje)
+    return source_file_path, ejecutable_path, compile_error, base_execute_command
+
+
+# Borrador de AnalisisResultado: una tupla simple que se arma durante la evaluación y se
+# inserta con bulk_insert_mappings al guardar, sin instanciar el modelo ORM ni pasar por sus
+# setters instrumentados. entrega_id se completa en guardar_evaluacion_y_resultados.
+BorradorAnalisis = namedtuple('BorradorAnalisis', ['herramienta_id', 'informe', 'puntuacion', 'fecha_analisis'])
+
+
+def _truncar_reporte(reporte: str, max_chars: int = MAX_REPORTE_FEEDBACK_CHARS) -> str:
+    """Acota el reporte mostrado en el feedback; el informe completo queda en AnalisisResultado.informe."""
+    if len(reporte) <= max_chars:
+        return reporte
+    return reporte[:max_chars] + "\n... (reporte truncado)"
+
+
 def ejecutar_analisis_formato(codigo_fuente: str, lenguaje: str, 
-                              config_formato: Dict[str, Any]) -> Tuple[Optional[AnalisisResultado], Optional[str]]:
+                              config_formato: Dict[str, Any],
+                              fecha_analisis: Optional[datetime] = None) -> Tuple[Optional[BorradorAnalisis], Optional[str]]:
     """
     Ejecuta análisis de formato en el código y devuelve una tupla con:
-    (objeto_analisis_db, feedback_str)
+    (borrador_analisis, feedback_str)
     """
     analisis_db = None
     feedback_str = None
@@ -587,49 +1383,40 @@ def ejecutar_analisis_formato(codigo_fuente: str, lenguaje: str,
         return None, "--- Análisis de Formato ---\n(No configurado correctamente para esta pregunta)"
     
     log.info(f"Ejecutando análisis de formato configurable...")
-    resultado_formato = run_format_analysis_configurable(
-        codigo_fuente, lenguaje, config_formato
+    resultado_formato = _analisis_con_cache(
+        'formato', run_format_analysis_configurable, codigo_fuente, lenguaje, config_formato
     )
     
     if not resultado_formato:
         perfil_nom = config_formato.get('perfil', 'desconocido')
         return None, f"--- Análisis de Formato ---\n(No aplicable para perfil '{perfil_nom}' / lenguaje '{lenguaje}')"
     
-    herramienta_id = get_herramienta_id(resultado_formato["tool_name"])
+    herramienta_id, tool_name_display = obtener_info_herramienta(resultado_formato["tool_name"])
     if herramienta_id:
-        analisis_db = AnalisisResultado(
-            entrega_id=None,  # Se asignará después
+        analisis_db = BorradorAnalisis(
             herramienta_id=herramienta_id,
             informe=resultado_formato["report"],
             puntuacion=1.0 if resultado_formato["success"] else 0.0,
-            fecha_analisis=datetime.now(timezone.utc)
+            fecha_analisis=fecha_analisis or datetime.now(timezone.utc)
         )
     
     # Generar feedback
-    tool_name_display = resultado_formato["tool_name"]
-    if herramienta_id:
-        herr_db = HerramientaAnalisis.query.get(herramienta_id)
-        if herr_db and herr_db.nombre_mostrado: 
-            tool_name_display = herr_db.nombre_mostrado
-
     feedback_str = f"--- Análisis de Formato ({tool_name_display}) ---\n"
     
     if resultado_formato["error"]:
         feedback_str += f"Error de la herramienta: {resultado_formato['error']}"
     elif not resultado_formato["success"]:
-        reporte_truncado = resultado_formato['report']
-        if len(reporte_truncado) > 1000:
-            reporte_truncado = reporte_truncado[:1000] + "\n... (reporte truncado)"
-        feedback_str += f"Se encontraron problemas:\n{reporte_truncado}"
+        feedback_str += f"Se encontraron problemas:\n{_truncar_reporte(resultado_formato['report'])}"
     else:
-        feedback_str += resultado_formato["report"]  # Mensaje de éxito
+        feedback_str += _truncar_reporte(resultado_formato["report"])  # Mensaje de éxito
         
     return analisis_db, feedback_str
 
-def ejecutar_analisis_metricas(codigo_fuente: str, lenguaje: str) -> Tuple[Optional[AnalisisResultado], Optional[str]]:
+def ejecutar_analisis_metricas(codigo_fuente: str, lenguaje: str,
+                               fecha_analisis: Optional[datetime] = None) -> Tuple[Optional[BorradorAnalisis], Optional[str]]:
     """
     Ejecuta análisis de métricas en el código y devuelve una tupla con:
-    (objeto_analisis_db, feedback_str)
+    (borrador_analisis, feedback_str)
     """
     analisis_db = None
     feedback_str = None
@@ -638,28 +1425,21 @@ def ejecutar_analisis_metricas(codigo_fuente: str, lenguaje: str) -> Tuple[Optio
         return None, "--- Análisis de Métricas ---\n(Error interno: Módulo de análisis no disponible)"
     
     log.info(f"Ejecutando análisis de métricas para lenguaje {lenguaje}...")
-    resultado_metricas = run_metrics_analysis(codigo_fuente, lenguaje)
+    resultado_metricas = _analisis_con_cache('metricas', run_metrics_analysis, codigo_fuente, lenguaje)
     
     if not resultado_metricas:
         return None, f"--- Análisis de Métricas ---\n(No aplicable para lenguaje '{lenguaje}')"
     
     herramienta_id = get_herramienta_id(resultado_metricas["tool_name"])
     if herramienta_id:
-        analisis_db = AnalisisResultado(
-            entrega_id=None,  # Se asignará después
+        analisis_db = BorradorAnalisis(
             herramienta_id=herramienta_id,
             informe=resultado_metricas["report"],
             puntuacion=1.0,  # Métricas no tienen éxito/fracaso, solo informan
-            fecha_analisis=datetime.now(timezone.utc)
+            fecha_analisis=fecha_analisis or datetime.now(timezone.utc)
         )
     
     # Generar feedback
-    tool_name_display = resultado_metricas["tool_name"]
-    if herramienta_id:
-        herr_db = HerramientaAnalisis.query.get(herramienta_id)
-        if herr_db and herr_db.nombre_mostrado: 
-            tool_name_display = herr_db.nombre_mostrado
-
     feedback_str = resultado_metricas["report"]
         
     return analisis_db, feedback_str
@@ -669,35 +1449,39 @@ def generar_feedback_casos(resultados: List[ResultadoDeEvaluacion]) -> str:
     if not resultados:
         return "--- Pruebas Funcionales ---\n(No hay resultados de casos de prueba)"
     
-    casos_pasados = sum(1 for r in resultados if r.paso)
-    casos_totales = len(resultados)
+    # Una sola pasada: contar aprobados y armar el detalle de los fallidos
+    casos_pasados = 0
+    detalles_fallidos: List[str] = []
+    for idx, res in enumerate(resultados):
+        if res.paso:
+            casos_pasados += 1
+            continue
+        caso_desc = f"Caso {idx+1}"
+        if hasattr(res, 'caso_de_prueba') and res.caso_de_prueba and res.caso_de_prueba.descripcion:
+            caso_desc = f"Caso {idx+1}: {res.caso_de_prueba.descripcion}"
+        
+        estado = "Falló"
+        if res.estado_ejecucion == "timeout":
+            estado = "Timeout"
+        elif res.estado_ejecucion.startswith("error_"):
+            estado = "Error"
+        
+        detalles_fallidos.append(f"- {caso_desc}: {estado}")
+        if res.diferencias_resumen:
+            detalles_fallidos.append("  Diferencias:\n" + textwrap.indent(res.diferencias_resumen, '  '))
+
     fb_casos = [f"--- Pruebas Funcionales ---",
-                f"Resumen Casos Prueba: {casos_pasados} de {casos_totales} pasaron."]
-    
-    if any(not r.paso for r in resultados):
+                f"Resumen Casos Prueba: {casos_pasados} de {len(resultados)} pasaron."]
+    if detalles_fallidos:
         fb_casos.append("\nDetalles Casos Fallidos:")
-        for idx, res in enumerate(resultados):
-            if not res.paso:
-                caso_desc = f"Caso {idx+1}"
-                if hasattr(res, 'caso_de_prueba') and res.caso_de_prueba and res.caso_de_prueba.descripcion:
-                    caso_desc = f"Caso {idx+1}: {res.caso_de_prueba.descripcion}"
-                
-                estado = "Falló"
-                if res.estado_ejecucion == "timeout":
-                    estado = "Timeout"
-                elif res.estado_ejecucion.startswith("error_"):
-                    estado = "Error"
-                
-                fb_casos.append(f"- {caso_desc}: {estado}")
-                if res.diferencias_resumen:
-                    fb_casos.append(f"  Diferencias:\n  {res.diferencias_resumen.replace('\n', '\n  ')}")
+        fb_casos.extend(detalles_fallidos)
     
     return "\n".join(fb_casos)
 
 
 def guardar_evaluacion_y_resultados(
     evaluacion: Evaluacion, 
-    analisis_resultados: List[Optional[AnalisisResultado]],
+    analisis_resultados: List[Optional[BorradorAnalisis]],
     resultados_casos: List[ResultadoDeEvaluacion],
     resultados_llm: Optional[List[ResultadoCriterioLLM]] # Añadido
 ) -> bool:
@@ -705,19 +1489,24 @@ def guardar_evaluacion_y_resultados(
     try:
         with db.session.begin_nested():
             if evaluacion not in db.session: db.session.add(evaluacion)
-            AnalisisResultado.query.filter_by(entrega_id=evaluacion.entrega_id).delete()
+            # Sin sincronizar el identity map: las filas borradas se reemplazan a continuación
+            sin_sync = {'synchronize_session': False}
+            db.session.execute(delete(AnalisisResultado).where(AnalisisResultado.entrega_id == evaluacion.entrega_id), execution_options=sin_sync)
             if evaluacion.id:
-                ResultadoDeEvaluacion.query.filter_by(evaluacion_id=evaluacion.id).delete()
-                ResultadoCriterioLLM.query.filter_by(evaluacion_id=evaluacion.id).delete() # Limpiar previos
+                db.session.execute(delete(ResultadoDeEvaluacion).where(ResultadoDeEvaluacion.evaluacion_id == evaluacion.id), execution_options=sin_sync)
+                db.session.execute(delete(ResultadoCriterioLLM).where(ResultadoCriterioLLM.evaluacion_id == evaluacion.id), execution_options=sin_sync) # Limpiar previos
             db.session.flush()
-            for analisis in analisis_resultados:
-                if analisis: analisis.entrega_id = evaluacion.entrega_id; db.session.add(analisis)
-            eval_id = evaluacion.id or db.session.execute(db.select(Evaluacion.id).filter_by(entrega_id=evaluacion.entrega_id)).scalar_one() # Obtener ID
-            if not eval_id: raise ValueError("ID de evaluación no disponible")
-            evaluacion.id = eval_id # Asegurar que el objeto tenga el ID
-            for res_caso in resultados_casos: res_caso.evaluacion_id = eval_id; db.session.add(res_caso)
+            filas_analisis = [dict(analisis._asdict(), entrega_id=evaluacion.entrega_id) for analisis in analisis_resultados if analisis]
+            if filas_analisis:
+                db.session.bulk_insert_mappings(AnalisisResultado, filas_analisis)
+            eval_id = evaluacion.id # El flush anterior ya asignó el ID (RETURNING / lastrowid)
+            if not eval_id: raise ValueError("ID de evaluación no disponible tras el flush")
+            # Inserción en bloque (executemany) en lugar de un INSERT por fila
+            for res_caso in resultados_casos: res_caso.evaluacion_id = eval_id
+            db.session.bulk_save_objects(resultados_casos, return_defaults=False)
             if resultados_llm:
-                for res_llm in resultados_llm: res_llm.evaluacion_id = eval_id; db.session.add(res_llm)
+                for res_llm in resultados_llm: res_llm.evaluacion_id = eval_id
+                db.session.bulk_save_objects(resultados_llm, return_defaults=False)
         db.session.commit()
         return True
     except Exception as e:
@@ -733,6 +1522,8 @@ def guardar_evaluacion_error(entrega_id: int, mensaje_error: str) -> bool:
         evaluacion_error.puntaje_obtenido = 0.0
         evaluacion_error.feedback = mensaje_error
         evaluacion_error.fecha_evaluacion = datetime.now(timezone.utc)
+        evaluacion_error.huella_evaluacion = None  # Una evaluación fallida nunca se reutiliza
+        evaluacion_error.checkpoint_phase = None
         
         if evaluacion_error not in db.session:
             db.session.add(evaluacion_error)
@@ -750,10 +1541,107 @@ def guardar_evaluacion_error(entrega_id: int, mensaje_error: str) -> bool:
 # === Función Principal de Evaluación ===
 # =========================================================
 
-def evaluar_entrega(entrega: Entrega):
+def calcular_huella_evaluacion(codigo_fuente: str, pregunta: Pregunta, config_examen: Optional[ConfiguracionExamen],
+                               casos: List[CasoDePrueba]) -> str:
+    """SHA-256 de todo lo que determina el resultado: código, pregunta, casos y configuración del examen."""
+    h = hashlib.sha256()
+    partes = [
+        codigo_fuente, pregunta.lenguaje_programacion, pregunta.enunciado, pregunta.solucion_modelo,
+        pregunta.rubrica_evaluacion, pregunta.configuracion_formato_json,
+        *(getattr(config_examen, attr, None) for attr in
+          ('habilitar_formato', 'habilitar_metricas', 'habilitar_similitud', 'habilitar_rendimiento', 'habilitar_analisis_llm')),
+    ]
+    for caso in casos:
+        partes += [caso.id, caso.argumentos, caso.entrada, caso.salida_esperada, caso.puntos]
+    for parte in partes:
+        h.update(b'\0' + str(parte).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _evaluacion_con_huella(alumno_id: int, pregunta_id: int, huella: str, filtro_fase,
+                           ahora: Optional[datetime] = None) -> Optional[Evaluacion]:
+    """
+    Evaluación más reciente (dentro del TTL) de una entrega del mismo alumno a la misma pregunta
+    hecha con la misma huella y en una fase que cumpla filtro_fase. Cada envío crea una Entrega
+    nueva, así que la búsqueda no puede limitarse a la entrega actual.
+    """
+    evaluacion = Evaluacion.query.join(Entrega, Evaluacion.entrega_id == Entrega.id).filter(
+        Entrega.alumno_id == alumno_id,
+        Entrega.pregunta_id == pregunta_id,
+        Evaluacion.huella_evaluacion == huella,
+        filtro_fase
+    ).order_by(Evaluacion.fecha_evaluacion.desc()).first()
+    if not evaluacion:
+        return None
+    if REEVALUACION_TTL_SEC > 0 and evaluacion.fecha_evaluacion:
+        fecha = evaluacion.fecha_evaluacion
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=timezone.utc)
+        if ((ahora or datetime.now(timezone.utc)) - fecha).total_seconds() > REEVALUACION_TTL_SEC:
+            return None
+    return evaluacion
+
+
+def obtener_evaluacion_vigente(alumno_id: int, pregunta_id: int, huella: str,
+                               ahora: Optional[datetime] = None) -> Optional[Evaluacion]:
+    """Evaluación terminada y reutilizable tal cual (ver _evaluacion_con_huella)."""
+    return _evaluacion_con_huella(
+        alumno_id, pregunta_id, huella,
+        or_(Evaluacion.checkpoint_phase.is_(None), Evaluacion.checkpoint_phase == FASE_FINALIZADA), ahora)
+
+
+def obtener_checkpoint_casos(alumno_id: int, pregunta_id: int, huella: str, casos: List[CasoDePrueba],
+                             ahora: Optional[datetime] = None) -> Optional[Tuple[List[ResultadoDeEvaluacion], str]]:
+    """
+    Si un intento anterior con la misma huella terminó los casos de prueba pero falló el LLM
+    (fase 'cases_done'), devuelve copias sin guardar de sus resultados, en el orden de `casos`,
+    y su feedback de casos. None si no hay checkpoint o no cubre exactamente los casos actuales.
+    """
+    checkpoint = _evaluacion_con_huella(
+        alumno_id, pregunta_id, huella, Evaluacion.checkpoint_phase == FASE_CASOS_TERMINADOS, ahora)
+    if checkpoint is None:
+        return None
+    por_caso = {r.caso_de_prueba_id: r for r in checkpoint.resultados}
+    if set(por_caso) != {caso.id for caso in casos}:
+        return None
+    filas = [por_caso[caso.id] for caso in casos]
+    # El feedback se arma con las filas guardadas (tienen su caso cargable); las copias se insertan luego
+    return [_clonar_fila(fila) for fila in filas], generar_feedback_casos(filas)
+
+
+def _clonar_fila(fila):
+    """Copia sin guardar de una fila ORM: mismas columnas salvo la clave primaria."""
+    return type(fila)(**{attr.key: getattr(fila, attr.key)
+                         for attr in inspect(fila).mapper.column_attrs if attr.key != 'id'})
+
+
+def reutilizar_evaluacion(previa: Evaluacion, entrega: Entrega, ahora: datetime) -> bool:
+    """Copia a la entrega la evaluación previa (casos, criterios del LLM y análisis) sin volver a evaluar."""
+    evaluacion = Evaluacion.query.filter_by(entrega_id=entrega.id).first() or Evaluacion(entrega_id=entrega.id)
+    evaluacion.puntaje_obtenido = previa.puntaje_obtenido
+    evaluacion.feedback = previa.feedback
+    evaluacion.feedback_llm_general = previa.feedback_llm_general
+    evaluacion.huella_evaluacion = previa.huella_evaluacion
+    evaluacion.checkpoint_phase = previa.checkpoint_phase
+    evaluacion.fecha_evaluacion = ahora
+    analisis = [
+        BorradorAnalisis(a.herramienta_id, a.informe, a.puntuacion, a.fecha_analisis)
+        for a in AnalisisResultado.query.filter_by(entrega_id=previa.entrega_id).order_by(AnalisisResultado.id)
+    ]
+    # guardar_evaluacion_y_resultados reasigna evaluacion_id a las copias
+    resultados_casos = [_clonar_fila(r) for r in sorted(previa.resultados, key=lambda r: r.id)]
+    resultados_llm = [_clonar_fila(r) for r in previa.resultados_criterios_llm.order_by(ResultadoCriterioLLM.id)]
+    return guardar_evaluacion_y_resultados(evaluacion, analisis, resultados_casos, resultados_llm)
+
+
+def evaluar_entrega(entrega: Entrega, forzar: bool = False):
     """
     Evalúa una entrega: ejecuta análisis de formato y métricas (si están configurados) y casos de prueba.
     Guarda los resultados en la base de datos.
+    Si el alumno ya envió a la misma pregunta una entrega con la misma huella (mismo código y
+    configuración) su evaluación se copia a esta entrega, salvo que forzar sea True. Si ese
+    intento quedó en la fase 'cases_done' (falló el LLM), se reutilizan sus casos de prueba y
+    solo se repite la llamada al LLM.
     """
     if not entrega:
         log.error("evaluar_entrega llamada con entrega None.")
@@ -796,25 +1684,18 @@ def evaluar_entrega(entrega: Entrega):
     puntaje_llm_obtenido = 0.0
 
     # Componentes de feedback
-    feedback_formato = None
-    feedback_metricas = None
-    feedback_casos = None
-    feedback_consolidado = None
-
-    resultados_criterios_llm_db: Optional[List[ResultadoCriterioLLM]] = None # Inicializar
-    
-    total_puntos_casos = 0.0
-    puntaje_llm_obtenido = 0.0 # INICIALIZAR
-    estado_evaluacion = ESTADO_COMPLETADA # Asumir éxito inicial
-    
     feedback_formato: Optional[str] = None
     feedback_metricas: Optional[str] = None
     feedback_casos: Optional[str] = None
-    feedback_llm_general_txt: Optional[str] = None # INICIALIZAR
-    feedback_llm_criterios_str_list: List[str] = [] # INICIALIZAR como lista vacía
+    feedback_consolidado: Optional[str] = None
+    feedback_llm_general_txt: Optional[str] = None
+    feedback_llm_criterios_str_list: List[str] = []
+    fut_compilacion: Optional[Future] = None
+    executor: Optional[ThreadPoolExecutor] = None
 
     try:
         log.info(f"Iniciando evaluación para entrega {entrega.id} (Pregunta {pregunta.id}, Examen {examen.id})")
+        ahora = datetime.now(timezone.utc)  # Un solo timestamp para análisis y evaluación
 
         # 1. Validación Inicial
         if not codigo_fuente:
@@ -830,25 +1711,54 @@ def evaluar_entrega(entrega: Entrega):
             estado_evaluacion = ESTADO_ERROR
             raise ValueError(f"No se especificó lenguaje para la pregunta {pregunta.id}")
 
+        # 1.2 Reutilizar la evaluación previa si nada de lo que la determina cambió
+        huella = calcular_huella_evaluacion(codigo_fuente, pregunta, config_examen, casos_de_prueba)
+        evaluacion_previa = None if forzar else obtener_evaluacion_vigente(entrega.alumno_id, pregunta.id, huella, ahora)
+        if evaluacion_previa is not None and (evaluacion_previa.entrega_id == entrega.id
+                                              or reutilizar_evaluacion(evaluacion_previa, entrega, ahora)):
+            log.info(f"Entrega {entrega.id} idéntica a la evaluada en {evaluacion_previa.id}; se reutiliza el resultado.")
+            total_puntos_casos = evaluacion_previa.puntaje_obtenido
+            return estado_evaluacion
+
+        # 1.3 Checkpoint: un intento anterior con la misma huella terminó los casos y falló el LLM;
+        # se reutilizan sus resultados en lugar de recompilar y volver a ejecutar los casos
+        checkpoint_casos = None if forzar else obtener_checkpoint_casos(
+            entrega.alumno_id, pregunta.id, huella, casos_de_prueba, ahora)
+        if checkpoint_casos is not None:
+            log.info(f"Entrega {entrega.id}: casos de prueba reutilizados del checkpoint; solo se repite el LLM.")
+
+        # 1.5 Lanzar la compilación en segundo plano: solo depende del código (no de la sesión
+        # de BD), así que se solapa con los análisis de formato/métricas, que sí consultan la BD
+        # y se quedan en este hilo. El prompt del LLM se arma ya (consulta la BD), pero la llamada,
+        # que es de pago, solo se lanza si la compilación tiene éxito.
+        executor = ThreadPoolExecutor(max_workers=2)
+        if checkpoint_casos is None:
+            fut_compilacion = executor.submit(preparar_y_compilar, codigo_fuente, lenguaje)
+        fut_llm: Optional[Future] = None
+        messages_llm = None
+        respuesta_llm: Optional[Dict[str, Any]] = None
+        feedback_llm_error: Optional[str] = None
+        if habilitar_analisis_llm and pregunta.rubrica_evaluacion:
+            messages_llm, feedback_llm_error = preparar_prompt_llm(entrega, pregunta)
+
         # 2. Analisis combinado de formato y métricas cuando ambos están habilitados
         if habilitar_formato and habilitar_metricas:
             config_formato_pregunta = pregunta.obtener_configuracion_formato() if habilitar_formato else None
             
             log.info(f"Ejecutando análisis combinado de formato y métricas...")
-            formato_results, metrics_results, consolidated_report = run_complete_analysis(
-                codigo_fuente, lenguaje, config_formato_pregunta
+            formato_results, metrics_results, consolidated_report = _analisis_con_cache(
+                'completo', run_complete_analysis, codigo_fuente, lenguaje, config_formato_pregunta
             )
             
             # Procesar resultados de formato si están disponibles
             if formato_results:
                 herramienta_id = get_herramienta_id(formato_results["tool_name"])
                 if herramienta_id:
-                    analisis_formato = AnalisisResultado(
-                        entrega_id=None,  # Se asignará después
+                    analisis_formato = BorradorAnalisis(
                         herramienta_id=herramienta_id,
                         informe=formato_results["report"],
                         puntuacion=1.0 if formato_results["success"] else 0.0,
-                        fecha_analisis=datetime.now(timezone.utc)
+                        fecha_analisis=ahora
                     )
                     analisis_resultados.append(analisis_formato)
                 feedback_formato = formato_results["report"]
@@ -857,12 +1767,11 @@ def evaluar_entrega(entrega: Entrega):
             if metrics_results:
                 herramienta_id = get_herramienta_id(metrics_results["tool_name"])
                 if herramienta_id:
-                    analisis_metrica = AnalisisResultado(
-                        entrega_id=None,  # Se asignará después
+                    analisis_metrica = BorradorAnalisis(
                         herramienta_id=herramienta_id,
                         informe=metrics_results["report"],
                         puntuacion=1.0,  # Métricas no tienen éxito/fracaso
-                        fecha_analisis=datetime.now(timezone.utc)
+                        fecha_analisis=ahora
                     )
                     analisis_resultados.append(analisis_metrica)
                 feedback_metricas = metrics_results["report"]
@@ -878,7 +1787,7 @@ def evaluar_entrega(entrega: Entrega):
                 config_formato_pregunta = pregunta.obtener_configuracion_formato()
                 if config_formato_pregunta:
                     analisis_formato, feedback_formato = ejecutar_analisis_formato(
-                        codigo_fuente, lenguaje, config_formato_pregunta
+                        codigo_fuente, lenguaje, config_formato_pregunta, ahora
                     )
                     if analisis_formato:
                         analisis_resultados.append(analisis_formato)
@@ -892,7 +1801,7 @@ def evaluar_entrega(entrega: Entrega):
             # Análisis de Métricas (solo)
             if habilitar_metricas:
                 analisis_metrica, feedback_metricas = ejecutar_analisis_metricas(
-                    codigo_fuente, lenguaje
+                    codigo_fuente, lenguaje, ahora
                 )
                 if analisis_metrica:
                     analisis_resultados.append(analisis_metrica)
@@ -900,10 +1809,55 @@ def evaluar_entrega(entrega: Entrega):
                 log.info(f"Análisis de métricas deshabilitado globalmente para examen {examen.id}")
                 feedback_metricas = "--- Análisis de Métricas ---\n(Deshabilitado para este examen)"
         
-        # 3.5 Análisis con LLM
+        # 4. Preparación y Compilación para casos de prueba (esperar a la tarea en segundo plano)
+        base_execute_command = None
+        if fut_compilacion is not None:
+            try:
+                source_file_path, ejecutable_path, compile_error, base_execute_command = fut_compilacion.result()
+
+                if compile_error:
+                    estado_evaluacion = ESTADO_ERROR
+                    feedback_casos = f"--- Compilación y Pruebas Funcionales ---\n{compile_error}"
+                    raise ValueError(f"Error de compilación: {compile_error}")
+
+            except Exception as e:
+                log.error(f"Error durante preparación/compilación: {e}", exc_info=True)
+                if not feedback_casos:  # Si no se asignó en el bloque try
+                    feedback_casos = f"--- Compilación y Pruebas Funcionales ---\nError: {e}"
+                estado_evaluacion = ESTADO_ERROR
+                raise
+
+        # 4.5 El código compila (o sus casos ya corrieron): el LLM corre en segundo plano mientras
+        # se ejecutan los casos de prueba
+        if messages_llm is not None:
+            log.info(f"Lanzando análisis con LLM para entrega {entrega.id} en segundo plano...")
+            fut_llm = executor.submit(llamar_api_openai_llm_con_cache, messages_llm)
+        executor.shutdown(wait=False)  # Los hilos terminan las tareas pendientes; no bloquear aquí
+
+        # 5. Ejecución de Casos de Prueba
+        if checkpoint_casos is not None:
+            resultados_casos_db, feedback_casos = checkpoint_casos
+            total_puntos_casos = sum(resultado_caso.puntos_obtenidos for resultado_caso in resultados_casos_db)
+        elif base_execute_command:  # Si hay comando y no hubo error previo
+            log.info(f"Iniciando ejecución de {len(casos_de_prueba)} casos de prueba...")
+        
+            if casos_de_prueba:
+                resultados_casos_db = ejecutar_casos_prueba(casos_de_prueba, base_execute_command, DEFAULT_TIMEOUT_SEC, lenguaje=lenguaje)
+                total_puntos_casos = sum(resultado_caso.puntos_obtenidos for resultado_caso in resultados_casos_db)
+            
+                # Generar feedback de casos
+                feedback_casos = generar_feedback_casos(resultados_casos_db)
+            else:
+                log.warning(f"No hay casos de prueba definidos para pregunta {pregunta.id}")
+                feedback_casos = "--- Pruebas Funcionales ---\n(No hay casos de prueba definidos)"
+
+        # 5.5 Análisis con LLM (al final: es la única fase que depende de un servicio externo)
         if habilitar_analisis_llm and pregunta.rubrica_evaluacion:
-            log.info(f"Ejecutando análisis con LLM para entrega {entrega.id}...")
-            resultados_criterios_llm_db, feedback_llm_general_txt, puntaje_llm_obtenido = ejecutar_analisis_llm(entrega, pregunta)
+            if fut_llm is not None:
+                respuesta_llm = fut_llm.result()
+                resultados_criterios_llm_db, feedback_llm_general_txt, puntaje_llm_obtenido = procesar_respuesta_llm(respuesta_llm)
+            else:
+                resultados_criterios_llm_db, feedback_llm_general_txt, puntaje_llm_obtenido = None, feedback_llm_error, 0.0
 
             if resultados_criterios_llm_db: # Si hubo resultados de criterios
                 feedback_llm_criterios_str_list.append("\n--- Evaluación Cualitativa (IA) ---")
@@ -911,12 +1865,15 @@ def evaluar_entrega(entrega: Entrega):
                     feedback_llm_criterios_str_list.append(f"Feedback General (IA): {feedback_llm_general_txt}")
                 
                 feedback_llm_criterios_str_list.append("Detalle por Criterio (IA):")
-                for crit_res in resultados_criterios_llm_db:
-                    max_p_str = f"/{crit_res.max_puntaje_criterio}" if crit_res.max_puntaje_criterio is not None else ""
-                    fb_line = f"- {crit_res.criterio_nombre}: {crit_res.puntaje_obtenido_llm}{max_p_str} pts."
-                    if crit_res.feedback_criterio_llm:
-                        fb_line += f" (Feedback: {crit_res.feedback_criterio_llm})"
-                    feedback_llm_criterios_str_list.append(fb_line)
+                feedback_llm_criterios_str_list.extend(
+                    _LINEA_CRITERIO_LLM.format(
+                        crit_res.criterio_nombre,
+                        crit_res.puntaje_obtenido_llm,
+                        f"/{crit_res.max_puntaje_criterio}" if crit_res.max_puntaje_criterio is not None else "",
+                        f" (Feedback: {crit_res.feedback_criterio_llm})" if crit_res.feedback_criterio_llm else ""
+                    )
+                    for crit_res in resultados_criterios_llm_db
+                )
                 feedback_llm_criterios_str_list.append(f"Puntaje Total Cualitativo (IA): {puntaje_llm_obtenido} pts.")
             
             elif feedback_llm_general_txt: # Si SOLO hubo feedback general (quizás error en criterios)
@@ -926,47 +1883,6 @@ def evaluar_entrega(entrega: Entrega):
         elif habilitar_analisis_llm: # Pero no hay rúbrica
              feedback_llm_criterios_str_list = ["\n--- Evaluación Cualitativa (IA) ---\n(Rúbrica no definida para esta pregunta)"]
 
-        # 4. Preparación y Compilación para casos de prueba
-        try:
-            # Crear archivo temporal con el código
-            suffix = obtener_sufijo_archivo(lenguaje)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, mode='w',
-                                            encoding='utf-8', newline='\n') as source_file:
-                source_file.write(codigo_fuente)
-                source_file_path = source_file.name
-            log.info(f'Archivo temporal creado: {source_file_path}')
-            
-            # Compilar o preparar según el lenguaje
-            ejecutable_path, compile_error, base_execute_command = compilar_codigo(source_file_path, lenguaje)
-            
-            if compile_error:
-                estado_evaluacion = ESTADO_ERROR
-                feedback_casos = f"--- Compilación y Pruebas Funcionales ---\n{compile_error}"
-                raise ValueError(f"Error de compilación: {compile_error}")
-                
-        except Exception as e:
-            log.error(f"Error durante preparación/compilación: {e}", exc_info=True)
-            if not feedback_casos:  # Si no se asignó en el bloque try
-                feedback_casos = f"--- Compilación y Pruebas Funcionales ---\nError: {e}"
-            estado_evaluacion = ESTADO_ERROR
-            raise
-
-        # 5. Ejecución de Casos de Prueba
-        if base_execute_command:  # Si hay comando y no hubo error previo
-            log.info(f"Iniciando ejecución de {len(casos_de_prueba)} casos de prueba...")
-            
-            if casos_de_prueba:
-                for caso in casos_de_prueba:
-                    resultado_caso = ejecutar_caso_prueba(caso, base_execute_command, DEFAULT_TIMEOUT_SEC)
-                    resultados_casos_db.append(resultado_caso)
-                    total_puntos_casos += resultado_caso.puntos_obtenidos
-                
-                # Generar feedback de casos
-                feedback_casos = generar_feedback_casos(resultados_casos_db)
-            else:
-                log.warning(f"No hay casos de prueba definidos para pregunta {pregunta.id}")
-                feedback_casos = "--- Pruebas Funcionales ---\n(No hay casos de prueba definidos)"
-        
         # 6. Combinar Feedback y Guardar Evaluación
         log.info("Combinando feedback y preparando para guardar...")
         # Base con formato+métricas (sea consolidado o por separado)
@@ -997,7 +1913,12 @@ def evaluar_entrega(entrega: Entrega):
         evaluacion.puntaje_obtenido = round(total_puntos_casos, 2)
         evaluacion.feedback = feedback_final
         evaluacion.feedback_llm_general = feedback_llm_general_txt # Guardar feedback general del LLM
-        evaluacion.fecha_evaluacion = datetime.now(timezone.utc)
+        evaluacion.fecha_evaluacion = ahora
+        evaluacion.huella_evaluacion = huella
+        # Si la IA no respondió (fallo transitorio) la evaluación queda en 'cases_done': no se
+        # reutiliza tal cual, pero el próximo intento con la misma huella solo repite el LLM
+        llm_fallido = fut_llm is not None and respuesta_llm is None
+        evaluacion.checkpoint_phase = FASE_CASOS_TERMINADOS if llm_fallido else FASE_FINALIZADA
 
         if not guardar_evaluacion_y_resultados(evaluacion, analisis_resultados, resultados_casos_db, resultados_criterios_llm_db):
             estado_evaluacion = ESTADO_ERROR
@@ -1012,6 +1933,12 @@ def evaluar_entrega(entrega: Entrega):
         guardar_evaluacion_error(entrega.id, feedback_error)
         
     finally:
+        if executor is not None:
+            executor.shutdown(wait=False)  # Idempotente; cubre las salidas antes de lanzar el LLM
+        # Si el análisis falló antes de recoger la compilación, esperar para conocer los archivos creados
+        if fut_compilacion is not None and source_file_path is None:
+            source_file_path, ejecutable_path, _, _ = fut_compilacion.result()
+
         # Siempre limpiar archivos temporales
         limpiar_archivos_temporales(source_file_path, ejecutable_path, lenguaje)
         
@@ -1,27 +1,38 @@
 from app import app
-from datetime import datetime
+from bisect import bisect_right
+from datetime import datetime, timezone
+from flask import g, has_app_context
+
+# Umbrales (en segundos) y unidad correspondiente: (singular, plural, segundos por unidad).
+# bisect_right(_UMBRALES, s) da el índice del tramo; el último tramo muestra la fecha.
+_UMBRALES = (60, 3600, 86400, 604800, 2592000)
+_UNIDADES = (
+    None,  # < 1 minuto: "hace unos segundos"
+    ('minuto', 'minutos', 60),
+    ('hora', 'horas', 3600),
+    ('día', 'días', 86400),
+    ('semana', 'semanas', 604800),
+)
+
+def _ahora_utc():
+    """Hora UTC naive (como las fechas guardadas) una sola vez por request; una página puede formatear cientos de fechas."""
+    if not has_app_context():
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    ahora = g.get('_timeago_ahora')
+    if ahora is None:
+        ahora = g._timeago_ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+    return ahora
 
 @app.template_filter('timeago')
 def timeago_filter(date):
     """Convierte una fecha a formato "hace X tiempo"."""
-    now = datetime.utcnow()
-    diff = now - date
-    
-    seconds = diff.total_seconds()
-    
-    if seconds < 60:
+    seconds = (_ahora_utc() - date).total_seconds()
+
+    idx = bisect_right(_UMBRALES, seconds)
+    if idx == 0:
         return "hace unos segundos"
-    elif seconds < 3600:
-        minutes = int(seconds / 60)
-        return f"hace {minutes} {'minuto' if minutes == 1 else 'minutos'}"
-    elif seconds < 86400:
-        hours = int(seconds / 3600)
-        return f"hace {hours} {'hora' if hours == 1 else 'horas'}"
-    elif seconds < 604800:
-        days = int(seconds / 86400)
-        return f"hace {days} {'día' if days == 1 else 'días'}"
-    elif seconds < 2592000:
-        weeks = int(seconds / 604800)
-        return f"hace {weeks} {'semana' if weeks == 1 else 'semanas'}"
-    else:
-        return date.strftime("%d-%m-%Y")
\ No newline at end of file
+    if idx == len(_UMBRALES):
+        return date.strftime("%d-%m-%Y")
+    singular, plural, por_unidad = _UNIDADES[idx]
+    n = int(seconds / por_unidad)
+    return f"hace {n} {singular if n == 1 else plural}"
@@ -3,13 +3,15 @@
 import sqlite3
 
 # Ajusta la ruta a tu base de datos
-conn = sqlite3.connect('app.db')
+# isolation_level=None: las transacciones se controlan a mano (BEGIN/COMMIT abajo)
+conn = sqlite3.connect('app.db', isolation_level=None)
 cursor = conn.cursor()
+cursor.execute("PRAGMA synchronous=NORMAL")
 
 # Verificar las columnas existentes
 cursor.execute("PRAGMA table_info(resultado_de_evaluacion)")
-columnas = [col[1] for col in cursor.fetchall()]
-print("Columnas actuales:", columnas)
+columnas = {col[1] for col in cursor.fetchall()}
+print("Columnas actuales:", sorted(columnas))
 
 # Añadir las columnas faltantes si no existen
 columnas_a_agregar = [
@@ -27,6 +29,8 @@ columnas_a_agregar = [
     "fecha_ejecucion DATETIME"
 ]
 
+# Todos los ALTER en una sola transacción: un único commit (y fsync) en lugar de uno por columna
+cursor.execute("BEGIN")
 for col_def in columnas_a_agregar:
     col_name = col_def.split()[0]
     if col_name not in columnas:
@@ -36,6 +40,6 @@ for col_def in columnas_a_agregar:
         except sqlite3.OperationalError as e:
             print(f"Error al añadir {col_name}: {e}")
 
-conn.commit()
+cursor.execute("COMMIT")
 conn.close()
 print("¡Proceso completado!")
\ No newline at end of file
@@ -6,6 +6,7 @@ from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, N
 from flask_wtf.file import FileField, FileAllowed
 from wtforms.validators import ValidationError
 import json
+from models import _json_loads  # orjson si está disponible; la rúbrica y los argumentos se validan en cada guardado
 
 LENGUAJES_SOPORTADOS = [
     ('c', 'C'),             # Clave 'c', Label 'C'
@@ -19,7 +20,7 @@ def validate_json_syntax(form, field):
     """Valida que el texto sea JSON sintácticamente válido."""
     if field.data:
         try:
-            json.loads(field.data)
+            _json_loads(field.data)
         except json.JSONDecodeError:
             raise ValidationError('Formato JSON inválido.')
         except Exception as e:
@@ -30,7 +31,7 @@ def validate_json_list(form, field):
     """Valida que el texto sea una lista JSON válida."""
     if field.data:
         try:
-            data = json.loads(field.data)
+            data = _json_loads(field.data)
             if not isinstance(data, list):
                 raise ValidationError('Debe ser una lista JSON válida (ej: ["arg1", "arg2"]).')
         except json.JSONDecodeError:
@@ -1,11 +1,25 @@
 # models.py
 
 from extensions import db, login_manager
+from sqlalchemy import event
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+
+try:
+    import orjson  # Parser JSON en C: argumentos, rúbricas y respuestas del LLM se decodifican a menudo
+except ImportError:
+    orjson = None
+
+def _json_loads(texto: str) -> Any:
+    """Parsea JSON con orjson si está disponible; si no, con json estándar.
+    orjson.JSONDecodeError hereda de json.JSONDecodeError, así que los except existentes siguen sirviendo.
+    Es el único punto de uso de orjson: evaluator.py y forms.py lo importan desde aquí."""
+    if orjson is not None:
+        return orjson.loads(texto)
+    return json.loads(texto)
 
 # Tabla de asociación entre usuarios y horarios
 usuario_horario = db.Table('usuario_horario',
@@ -28,7 +42,7 @@ class Usuario(UserMixin, db.Model):
     estado = db.Column(db.String(20), nullable=False, default="activo")
 
     # Relaciones
-    horarios = db.relationship('Horario', secondary=usuario_horario, back_populates='usuarios', lazy='joined')
+    horarios = db.relationship('Horario', secondary=usuario_horario, back_populates='usuarios', lazy='select')
     entregas = db.relationship('Entrega', backref='alumno', lazy='dynamic', foreign_keys='Entrega.alumno_id')
     historial_de_examenes = db.relationship('Examen', secondary='usuario_examen', backref='usuarios', lazy='dynamic')
 
@@ -100,16 +114,47 @@ class Horario(db.Model):
     nombre = db.Column(db.String(50), nullable=False)
 
     # Relaciones
-    usuarios = db.relationship('Usuario', secondary=usuario_horario, back_populates='horarios', lazy='joined')
+    usuarios = db.relationship('Usuario', secondary=usuario_horario, back_populates='horarios', lazy='select')
     examenes = db.relationship('Examen', backref='horario', lazy=True)
 
+    def _usuarios_por_rol(self) -> Dict[str, Tuple['Usuario', ...]]:
+        """
+        Reparte `usuarios` por rol en una sola pasada y lo memoiza junto a la colección:
+        una vista que pide alumnos y docentes no recorre la lista dos veces. Si la colección
+        se recarga (objeto nuevo) o se modifica, o cambia el rol de algún usuario (eventos de
+        abajo), se vuelve a calcular. Las tuplas memoizadas no se entregan a quien llama.
+        """
+        usuarios = self.usuarios
+        cache = self.__dict__.get('_por_rol_cache')
+        if cache is None or cache[0] is not usuarios or cache[1] != _version_roles:
+            por_rol = {'alumno': [], 'docente': []}
+            for usuario in usuarios:
+                por_rol.setdefault(usuario.rol, []).append(usuario)
+            cache = self._por_rol_cache = (usuarios, _version_roles, {rol: tuple(lista) for rol, lista in por_rol.items()})
+        return cache[2]
+
     @property
     def alumnos(self):
-        return [usuario for usuario in self.usuarios if usuario.rol == 'alumno']
+        return list(self._usuarios_por_rol()['alumno'])
 
     @property
     def docentes(self):
-        return [usuario for usuario in self.usuarios if usuario.rol == 'docente']
+        return list(self._usuarios_por_rol()['docente'])
+
+@event.listens_for(Horario.usuarios, 'append')
+@event.listens_for(Horario.usuarios, 'remove')
+def _invalidar_usuarios_por_rol(horario, *args):
+    horario.__dict__.pop('_por_rol_cache', None)
+
+# Se incrementa con cada cambio de Usuario.rol: invalida el reparto de todos los horarios sin
+# tener que cargar la colección `horarios` del usuario dentro del evento
+_version_roles = 0
+
+@event.listens_for(Usuario.rol, 'set')
+def _invalidar_roles(usuario, valor, anterior, iniciador):
+    global _version_roles
+    if valor != anterior:
+        _version_roles += 1
 
 class Examen(db.Model):
     __tablename__ = 'examen'
@@ -162,6 +207,21 @@ class Pregunta(db.Model):
     casos_de_prueba = db.relationship('CasoDePrueba', backref='pregunta', lazy=True, cascade="all, delete-orphan")
     entregas = db.relationship('Entrega', backref='pregunta', lazy='dynamic')
 
+    @property
+    def rubrica_parsed(self) -> Optional[Dict[str, Any]]:
+        """
+        Rúbrica ya parseada (None si no hay). Se memoiza en la instancia junto al texto
+        original, así evaluar muchas entregas de la misma pregunta la parsea una sola vez
+        y una rúbrica editada se vuelve a parsear. Lanza json.JSONDecodeError si es inválida.
+        """
+        texto = self.rubrica_evaluacion
+        if not texto:
+            return None
+        cache = self.__dict__.get('_rubrica_cache')
+        if cache is None or cache[0] != texto:
+            cache = self._rubrica_cache = (texto, _json_loads(texto))
+        return cache[1]
+
     # Helper para parsear el JSON (recomendado)
     def obtener_configuracion_formato(self) -> Optional[Dict[str, Any]]:
         if not self.configuracion_formato_json:
@@ -188,20 +248,36 @@ class CasoDePrueba(db.Model):
     # Relaciones
     resultados = db.relationship('ResultadoDeEvaluacion', backref='caso_de_prueba', lazy='dynamic')
 
-    # Metodo helper para obtener los argumentos como una lista
-    def obtener_argumentos(self):
-        if not self.argumentos:
-            return []
-        try:
-            args = json.loads(self.argumentos)
+    @property
+    def argumentos_parsed(self) -> List[str]:
+        """
+        Argumentos como lista de str. Se memoiza en la instancia junto al texto original:
+        se evalúan muchas entregas contra el mismo caso y el JSON se decodifica una sola vez;
+        si se reasigna `argumentos` el texto cambia y se vuelve a decodificar.
+        """
+        texto = self.argumentos
+        cache = self.__dict__.get('_argumentos_cache')
+        if cache is not None and cache[0] == texto:
+            return cache[1]
+        args = []
+        if texto:
+            try:
+                args = _json_loads(texto)
+            except json.JSONDecodeError:
+                print(f"Error: No se pudo decodificar los argumentos JSON. {texto}")
+                args = []
             if isinstance(args, list):
-                return [str(arg) for arg in args]
+                args = [str(arg) for arg in args]
             else:
                 print(f"Error: Los argumentos no son una lista válida. {args}")
-                return []
-        except json.JSONDecodeError:
-            print(f"Error: No se pudo decodificar los argumentos JSON. {self.argumentos}")
-            return []
+                args = []
+        self._argumentos_cache = (texto, args)
+        return args
+
+    # Metodo helper para obtener los argumentos como una lista
+    def obtener_argumentos(self):
+        # Copia: quien la reciba puede modificarla sin tocar la memoizada
+        return list(self.argumentos_parsed)
     
 class Entrega(db.Model):
     __tablename__ = 'entrega'
@@ -220,6 +296,11 @@ class Entrega(db.Model):
         cascade='all, delete-orphan'
     )
 
+    __table_args__ = (
+        db.Index('ix_entrega_alumno_pregunta', 'alumno_id', 'pregunta_id'),  # Entregas de un alumno para una pregunta
+        db.Index('ix_entrega_pregunta', 'pregunta_id'),  # Todas las entregas de una pregunta
+    )
+
 class Evaluacion(db.Model):
     __tablename__ = 'evaluacion'
     id = db.Column(db.Integer, primary_key=True)
@@ -228,6 +309,8 @@ class Evaluacion(db.Model):
     feedback_llm_general = db.Column(db.Text, nullable=True, comment="Feedback cualitativo general del LLM")
     fecha_evaluacion = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     entrega_id = db.Column(db.Integer, db.ForeignKey('entrega.id'), nullable=False)
+    huella_evaluacion = db.Column(db.String(64), nullable=True, index=True, comment="SHA-256 del código y la configuración con que se evaluó")
+    checkpoint_phase = db.Column(db.String(20), nullable=True, comment="Última fase terminada: 'cases_done' (falló el LLM; reanudable) o 'finalized'")
 
     # Relaciones
     resultados = db.relationship('ResultadoDeEvaluacion', backref='evaluacion', lazy=True)
@@ -283,6 +366,10 @@ class ResultadoDeEvaluacion(db.Model):
     # Campos para auditoría
     fecha_ejecucion = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_resultado_eval_caso', 'evaluacion_id', 'caso_de_prueba_id'),  # Resultados de una evaluación (y de un caso en ella)
+    )
+
 # ===============================
 # MODELOS PARA LOS MÓDULOS DE ANÁLISIS DE CÓDIGO
 # ===============================
@@ -323,6 +410,10 @@ class AnalisisResultado(db.Model):
     entrega = db.relationship('Entrega', back_populates='analisis_resultados')
     herramienta = db.relationship('HerramientaAnalisis', backref=db.backref('resultados_generados', lazy='dynamic')) # backref ok aquí
 
+    __table_args__ = (
+        db.Index('ix_analisis_resultado_entrega', 'entrega_id'),  # Análisis de una entrega (se borran y reinsertan por entrega)
+    )
+
 class HerramientaAnalisis(db.Model):
     __tablename__ = 'herramienta_analisis'
     id = db.Column(db.Integer, primary_key=True)
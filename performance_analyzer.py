@@ -5,6 +5,8 @@ Este módulo implementa análisis de rendimiento para código en Python y C,
 evaluando la complejidad temporal (Big O) y uso de recursos.
 """
 
+import ast
+import shutil
 import subprocess
 import tempfile
 import os
@@ -13,21 +15,34 @@ import re
 import json
 import math
 import statistics
+import struct
 import time
 import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache, wraps
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional, Tuple, Union
 
+from disk_cache import podar_cache_lru, tocar_artefacto
+
 # Intentar importar herramientas específicas para análisis
 try:
     import radon.complexity as radon_cc
     import radon.raw as radon_raw
     import radon.metrics as radon_metrics
+    from radon.visitors import ComplexityVisitor
     RADON_AVAILABLE = True
 except ImportError:
     RADON_AVAILABLE = False
     logging.warning("Radon no está disponible. Instale con: pip install radon")
 
+try:
+    import numpy as np  # Ajuste vectorizado de los modelos de complejidad
+except ImportError:
+    np = None
+
 # Configuración de logging
 log = logging.getLogger(__name__)
 if not log.hasHandlers():
@@ -37,6 +52,12 @@ if not log.hasHandlers():
     log.addHandler(handler)
     log.setLevel(logging.INFO)
 
+# Herramientas externas: el PATH no cambia durante la vida del proceso, se consulta una vez
+HAS_GCC = shutil.which('gcc') is not None
+HAS_GPROF = shutil.which('gprof') is not None
+if not HAS_GPROF:
+    log.warning("gprof no está disponible para profiling de C")
+
 # Constante para nombre de herramienta en BD
 TOOL_PERFORMANCE_ANALYZER = "performance-analyzer"
 
@@ -44,6 +65,62 @@ TOOL_PERFORMANCE_ANALYZER = "performance-analyzer"
 DEFAULT_TEST_SIZES = [10, 100, 1000, 10000]  # Tamaños de entrada para pruebas
 MAX_EXECUTION_TIME = 300  # Tiempo máximo de ejecución (segundos)
 MIN_TEST_SAMPLES = 3  # Mínimo de muestras para estimación válida
+# Repeticiones por tamaño dentro del proceso hijo (se informa la mediana): muchas en tamaños
+# pequeños, donde el ruido domina, y se corta al superar el presupuesto acumulado
+MIN_REPETICIONES = 3
+MAX_REPETICIONES = 21
+PRESUPUESTO_REPETICIONES_MS = 1000
+# Métricas que escribe el proceso de prueba en PERF_OUT: time_ms, memory_kb, repeticiones
+_FORMATO_METRICAS = struct.Struct('=ddq')
+# Flags de optimización de C: se mide lo que obtendría un usuario real (-O0 infla las constantes
+# y confunde O(n) con O(n log n)); sin inlining de funciones para que gprof conserve sus nombres
+C_OPTIMIZACION = ['-O2', '-fno-inline-functions']
+# Ejecutables C compilados, por hash del wrapper y los flags (unos KB por entrega distinta)
+C_BINARIOS_CACHE_DIR = os.environ.get(
+    'PERF_ANALYZER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'perf_analyzer')
+)
+# Topes de esa caché (ejecutable + fuente por entrada), aplicados con la poda LRU de disk_cache
+C_BINARIOS_CACHE_MAX_ENTRADAS = int(os.environ.get('PERF_ANALYZER_CACHE_MAX', 1024))
+C_BINARIOS_CACHE_MAX_BYTES = int(os.environ.get('PERF_ANALYZER_CACHE_MAX_MB', 256)) * 1024 * 1024
+C_BINARIOS_CACHE_MAX_EDAD_SEG = int(os.environ.get('PERF_ANALYZER_CACHE_MAX_HORAS', 30 * 24)) * 3600
+# Locks por clave de compilación, LRU acotado: solo importan mientras se compila esa clave
+COMPILACION_LOCKS_MAX = 256
+_compilacion_locks: "OrderedDict[str, threading.Lock]" = OrderedDict()
+_compilacion_locks_lock = threading.Lock()
+
+# Tokenizador de C para el análisis estático: comentarios y literales se consumen enteros
+# (y se descartan), de modo que una sola pasada sobre el código basta para contar
+# estructuras de control y delimitar funciones por profundidad de llaves.
+_RE_TOKEN_C = re.compile(r"""
+      //[^\n]*                    # comentario de línea
+    | /\*.*?(?:\*/|\Z)            # comentario de bloque (tolera uno sin cerrar)
+    | "(?:\\.|[^"\\\n])*"?        # literal de cadena
+    | '(?:\\.|[^'\\\n])*'?        # literal de carácter
+    | [A-Za-z_]\w*                # identificador o palabra clave
+    | [{}();]
+""", re.DOTALL | re.VERBOSE)
+
+# Definiciones de función: C ("tipo nombre(...) {") y Python ("def nombre(", fallback sin AST)
+_RE_FUNCDEF_C = re.compile(r'(\w+)\s+(\w+)\s*\([^)]*\)\s*{')
+_RE_FUNCDEF_PY = re.compile(r'def\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*\(')
+
+# Nombres típicos de la función a medir (Python y C), en orden de prioridad ("sort" antes que
+# "merge": en un merge sort la función a medir es merge_sort, no su auxiliar merge)
+_NOMBRES_ALGORITMO_PY = ('sort', 'search', 'find', 'solve', 'process', 'calculate', 'merge', 'partition')
+_NOMBRES_ALGORITMO_C = ('sort', 'search', 'find', 'solve', 'process', 'calc', 'merge', 'partition')
+
+# Palabra clave -> contador de control_structures
+_CONTADORES_C = {
+    "if": "if_count",
+    "else": "else_count",
+    "for": "for_count",
+    "while": "while_count",
+    "switch": "switch_count",
+    "case": "case_count",
+    "goto": "goto_count",
+}
+# Palabras clave que suman un punto de decisión a la complejidad ciclomática
+_DECISIONES_C = frozenset(("if", "for", "while", "case"))
 
 # Mapeo de complejidades algorítmicas y sus descripciones
 COMPLEXITY_DESCRIPTIONS = {
@@ -79,6 +156,36 @@ class PerformanceResult:
             return f"Tamaño {self.size}: {self.time_ms:.2f} ms{memory_str}"
 
 
+# Caché por proceso de los análisis estáticos: son funciones puras del código y las
+# re-evaluaciones de una misma entrega vuelven a analizar exactamente el mismo texto.
+ANALISIS_ESTATICO_CACHE_MAX = 256
+_analisis_estatico_cache: "OrderedDict[Tuple[str, bytes], Dict[str, Any]]" = OrderedDict()
+_analisis_estatico_lock = threading.Lock()
+
+
+def _memoizar_por_codigo(funcion):
+    """
+    Memoiza funcion(code) por hash blake2b del código; los resultados con error no se guardan.
+    El dict devuelto se comparte entre llamadas: quien lo reciba no debe modificarlo.
+    """
+    @wraps(funcion)
+    def envoltura(code: str) -> Dict[str, Any]:
+        clave = (funcion.__name__, hashlib.blake2b(code.encode('utf-8'), digest_size=16).digest())
+        with _analisis_estatico_lock:
+            if clave in _analisis_estatico_cache:
+                _analisis_estatico_cache.move_to_end(clave)
+                return _analisis_estatico_cache[clave]
+        resultado = funcion(code)
+        if "error" not in resultado:
+            with _analisis_estatico_lock:
+                _analisis_estatico_cache[clave] = resultado
+                if len(_analisis_estatico_cache) > ANALISIS_ESTATICO_CACHE_MAX:
+                    _analisis_estatico_cache.popitem(last=False)
+        return resultado
+    return envoltura
+
+
+@_memoizar_por_codigo
 def analyze_python_with_radon(code: str) -> Dict[str, Any]:
     """
     Analiza código Python utilizando Radon para obtener métricas estáticas.
@@ -93,28 +200,48 @@ def analyze_python_with_radon(code: str) -> Dict[str, Any]:
         return {"error": "Radon no está disponible. Instale con: pip install radon"}
     
     try:
+        # Un solo ast.parse y un solo análisis raw para las tres métricas: cc_visit, analyze y
+        # mi_visit por separado parsean el código tres veces y lo tokenizan dos
+        tree = ast.parse(code)
+        
         # Análisis de complejidad ciclomática
-        cc_results = list(radon_cc.cc_visit(code))
+        cc_visitor = ComplexityVisitor.from_ast(tree)
+        cc_results = cc_visitor.blocks
         
         # Análisis raw (métricas básicas)
         raw_metrics = radon_raw.analyze(code)
         
-        # Análisis de mantenibilidad
-        mi_result = radon_metrics.mi_visit(code, True)
+        # Análisis de mantenibilidad: mismos parámetros que radon_metrics.mi_visit(code, True)
+        comment_lines = raw_metrics.comments + raw_metrics.multi
+        comments = comment_lines / float(raw_metrics.sloc) * 100 if raw_metrics.sloc != 0 else 0
+        mi_result = radon_metrics.mi_compute(
+            radon_metrics.h_visit_ast(tree).total.volume,
+            cc_visitor.total_complexity,
+            raw_metrics.lloc,
+            comments
+        )
+        
+        # Suma, máximo y lista de funciones en una sola pasada por los bloques
+        total_complexity = 0
+        max_complexity = 0
+        functions = []
+        for result in cc_results:
+            complexity = result.complexity
+            total_complexity += complexity
+            if complexity > max_complexity:
+                max_complexity = complexity
+            functions.append({
+                "name": result.name,
+                "complexity": complexity,
+                "rank": radon_cc.cc_rank(complexity)  # Los bloques de Radon no traen el rango
+            })
         
         # Preparar resultados
         results = {
             "complexity": {
-                "average": sum(result.complexity for result in cc_results) / len(cc_results) if cc_results else 0,
-                "max": max(result.complexity for result in cc_results) if cc_results else 0,
-                "functions": [
-                    {
-                        "name": result.name,
-                        "complexity": result.complexity,
-                        "rank": result.rank
-                    }
-                    for result in cc_results
-                ]
+                "average": total_complexity / len(functions) if functions else 0,
+                "max": max_complexity,
+                "functions": functions
             },
             "maintainability": mi_result,
             "raw_metrics": {
@@ -133,6 +260,7 @@ def analyze_python_with_radon(code: str) -> Dict[str, Any]:
         return {"error": f"Error en análisis Radon: {e}"}
 
 
+@_memoizar_por_codigo
 def analyze_c_complexity(code: str) -> Dict[str, Any]:
     """
     Analiza código C para estimar complejidad.
@@ -144,55 +272,74 @@ def analyze_c_complexity(code: str) -> Dict[str, Any]:
         Dict con métricas de complejidad estimadas
     """
     try:
-        # Patrones para identificar estructuras de control en C
-        patterns = {
-            "if_count": re.compile(r'\bif\s*\('),
-            "else_count": re.compile(r'\belse\b'),
-            "for_count": re.compile(r'\bfor\s*\('),
-            "while_count": re.compile(r'\bwhile\s*\('),
-            "switch_count": re.compile(r'\bswitch\s*\('),
-            "case_count": re.compile(r'\bcase\s+'),
-            "goto_count": re.compile(r'\bgoto\s+'),
-            "function_count": re.compile(r'(\w+)\s+(\w+)\s*\([^)]*\)\s*{')
-        }
-        
-        # Contar ocurrencias
-        counts = {name: len(pattern.findall(code)) for name, pattern in patterns.items()}
-        
-        # Extraer nombres de funciones
-        function_matches = patterns["function_count"].findall(code)
+        # Una sola pasada: contadores globales y, por función, sus puntos de decisión
+        counts = dict.fromkeys(_CONTADORES_C.values(), 0)
+        counts["function_count"] = 0
         functions = []
-        
-        # Analizar complejidad por función
-        for ret_type, func_name in function_matches:
-            if func_name != "main":  # Excluir función main
-                # Extraer el cuerpo de la función con regex
-                func_pattern = re.compile(rf'{ret_type}\s+{func_name}\s*\([^)]*\)\s*{{(.*?)}}', re.DOTALL)
-                func_matches = func_pattern.findall(code)
-                
-                if func_matches:
-                    func_body = func_matches[0]
-                    # Estimar complejidad ciclomática
+
+        depth = 0           # Profundidad de llaves
+        paren = 0           # Profundidad de paréntesis a nivel superior
+        prev_ident = None   # Identificador inmediatamente anterior
+        candidato = None    # Nombre antes de '(' a nivel superior
+        pendiente = None    # Firma cerrada con ')', falta ver '{' para ser definición
+        actual = None       # [nombre, complejidad] de la función en curso
+
+        for match in _RE_TOKEN_C.finditer(code):
+            token = match.group()
+            inicial = token[0]
+            if inicial in '/"\'':
+                continue  # Comentario o literal
+            if inicial == '_' or inicial.isalpha():
+                contador = _CONTADORES_C.get(token)
+                if contador:
+                    counts[contador] += 1
                     # CC = 1 + número de decisiones (if, for, while, case)
-                    complexity = 1
-                    complexity += len(re.findall(r'\bif\s*\(', func_body))
-                    complexity += len(re.findall(r'\bfor\s*\(', func_body))
-                    complexity += len(re.findall(r'\bwhile\s*\(', func_body))
-                    complexity += len(re.findall(r'\bcase\s+', func_body))
-                    
-                    # Determinar rango de complejidad
-                    rank = "A"  # Simple: 1-5
-                    if complexity > 10:
-                        rank = "C"  # Complejo: >10
-                    elif complexity > 5:
-                        rank = "B"  # Moderado: 6-10
-                    
-                    functions.append({
-                        "name": func_name,
-                        "complexity": complexity,
-                        "rank": rank
-                    })
-        
+                    if actual is not None and token in _DECISIONES_C:
+                        actual[1] += 1
+                prev_ident = token
+                pendiente = None
+                continue
+
+            if depth == 0:
+                if token == '(':
+                    if paren == 0 and prev_ident and prev_ident not in _CONTADORES_C:
+                        candidato = prev_ident
+                    paren += 1
+                elif token == ')':
+                    if paren:
+                        paren -= 1
+                        if paren == 0 and candidato:
+                            pendiente, candidato = candidato, None
+                        prev_ident = None
+                        continue
+                elif token == '{' and pendiente:
+                    counts["function_count"] += 1
+                    actual = [pendiente, 1]
+                elif token == ';':
+                    candidato = None
+            if token == '{':
+                depth += 1
+            elif token == '}' and depth:
+                depth -= 1
+                if depth == 0 and actual is not None:
+                    func_name, complexity = actual
+                    actual = None
+                    if func_name != "main":  # Excluir función main
+                        # Determinar rango de complejidad
+                        rank = "A"  # Simple: 1-5
+                        if complexity > 10:
+                            rank = "C"  # Complejo: >10
+                        elif complexity > 5:
+                            rank = "B"  # Moderado: 6-10
+
+                        functions.append({
+                            "name": func_name,
+                            "complexity": complexity,
+                            "rank": rank
+                        })
+            prev_ident = None
+            pendiente = None
+
         # Calcular métricas agregadas
         avg_complexity = sum(f["complexity"] for f in functions) / len(functions) if functions else 0
         max_complexity = max(f["complexity"] for f in functions) if functions else 0
@@ -217,7 +364,10 @@ def analyze_c_complexity(code: str) -> Dict[str, Any]:
 
 def prepare_python_profiling(code: str, size: int) -> Tuple[str, List[str]]:
     """
-    Prepara un wrapper de código Python con profiling y generación de datos de prueba.
+    Prepara un wrapper de código Python con medición de tiempo y generación de datos de prueba.
+    
+    Solo se mide con perf_counter_ns: cProfile instrumenta cada llamada y multiplica el
+    tiempo medido, lo que falsea la estimación de complejidad.
     
     Args:
         code: Código fuente original
@@ -231,15 +381,15 @@ def prepare_python_profiling(code: str, size: int) -> Tuple[str, List[str]]:
     if not main_function:
         raise ValueError("No se pudo identificar una función principal en el código")
     
-    # Crear archivo temporal con profiling
+    # Crear archivo temporal con el wrapper
     with tempfile.NamedTemporaryFile(suffix='.py', mode='w', delete=False, encoding='utf-8') as f:
         profiling_code = f"""
-import cProfile
-import pstats
-import io
 import time
 import sys
+import os
 import json
+import struct
+import statistics
 import traceback
 import random
 import resource
@@ -247,7 +397,7 @@ import resource
 # Código original del estudiante
 {code}
 
-# Wrapper para profiling
+# Wrapper para medición
 if __name__ == "__main__":
     try:
         # Generar datos de prueba
@@ -258,37 +408,29 @@ if __name__ == "__main__":
         # Medir uso de recursos iniciales
         start_rusage = resource.getrusage(resource.RUSAGE_SELF)
         
-        # Ejecutar con profiling
-        profile = cProfile.Profile()
-        profile.enable()
-        start_time = time.time()
-        
-        # Llamar a la función principal
-        result = {main_function}(data)
+        # Repeticiones: se informa la mediana; cada una parte de una copia de los datos
+        runs = []
+        total_ns = 0
+        for _ in range({_repeticiones(size)}):
+            entrada = data[:]
+            start_ns = time.perf_counter_ns()
+            
+            # Llamar a la función principal
+            result = {main_function}(entrada)
+            
+            end_ns = time.perf_counter_ns()
+            runs.append(end_ns - start_ns)
+            total_ns += end_ns - start_ns
+            if total_ns >= {PRESUPUESTO_REPETICIONES_MS * 1_000_000}:
+                break  # Tamaños grandes: no multiplicar el tiempo
         
         # Detener mediciones
-        end_time = time.time()
-        profile.disable()
         end_rusage = resource.getrusage(resource.RUSAGE_SELF)
         
-        # Calcular métricas
-        execution_time_ms = (end_time - start_time) * 1000
-        memory_kb = end_rusage.ru_maxrss - start_rusage.ru_maxrss
-        
-        # Formatear resultados de profiling
-        s = io.StringIO()
-        ps = pstats.Stats(profile, stream=s).sort_stats('cumulative')
-        ps.print_stats(10)  # Limitar a 10 funciones más significativas
-        profile_text = s.getvalue()
-        
-        # Resultados en formato JSON
-        results = {{
-            "time_ms": execution_time_ms,
-            "memory_kb": memory_kb,
-            "profile": profile_text
-        }}
-        
-        print(json.dumps(results))
+        # Resultados en PERF_OUT: métricas con formato binario fijo
+        with open(os.environ["PERF_OUT"], "wb") as salida:
+            salida.write(struct.pack("{_FORMATO_METRICAS.format}", statistics.median(runs) / 1e6,
+                                     end_rusage.ru_maxrss - start_rusage.ru_maxrss, len(runs)))
         sys.exit(0)
         
     except Exception as e:
@@ -303,37 +445,47 @@ if __name__ == "__main__":
         tmp_path = f.name
     
     # Comando para ejecutar
+    # -I (modo aislado): sin site de usuario ni variables PYTHON* del servidor; arranca más rápido
+    # y el entorno de la app (PYTHONPATH, etc.) no se filtra al código medido
     python_cmd = sys.executable or 'python3'
-    return tmp_path, [python_cmd, tmp_path]
+    return tmp_path, [python_cmd, '-I', tmp_path]
+
+
+def _repeticiones(size: int) -> int:
+    """Repeticiones de la medición para un tamaño: inversamente proporcionales a él."""
+    return max(MIN_REPETICIONES, min(MAX_REPETICIONES, 1000 // max(size, 1)))
 
 
 def prepare_c_profiling(code: str, size: int) -> Tuple[str, str, List[str]]:
     """
     Prepara un wrapper de código C con medición de tiempo y generación de datos de prueba.
     
+    El tamaño se recibe por argv[1], así el ejecutable no depende de él: se compila una vez
+    por código (y flags) y se reutiliza desde C_BINARIOS_CACHE_DIR para todos los tamaños
+    y en re-evaluaciones posteriores.
+    
     Args:
         code: Código fuente original
         size: Tamaño de entrada para la prueba
         
     Returns:
-        Tuple con (ruta_archivo_fuente, ruta_ejecutable, comando_para_ejecutar)
+        Tuple con (ruta_archivo_fuente, ruta_ejecutable, comando_para_ejecutar); ambos
+        archivos pertenecen a la caché y no deben borrarse
     """
     # Identificar función principal
     main_function = extract_c_main_function(code)
     
-    # Crear archivo temporal
-    with tempfile.NamedTemporaryFile(suffix='.c', mode='w', delete=False, encoding='utf-8') as f:
-        # Verificar si gprof está disponible
-        has_gprof = False
-        try:
-            subprocess.run(['which', 'gprof'], check=True, capture_output=True)
-            has_gprof = True
-        except (subprocess.SubprocessError, FileNotFoundError):
-            log.warning("gprof no está disponible para profiling de C")
-        
-        # Crear wrapper con instrumentación
-        if has_gprof:
-            profiling_code = f"""
+    if not HAS_GCC:
+        raise RuntimeError("gcc no está disponible en el PATH: no se puede compilar código C")
+    has_gprof = HAS_GPROF
+    
+    if main_function:
+        llamada_c = f"perf_sink += {main_function}(work, SIZE);"
+    else:
+        llamada_c = "// No se pudo detectar función principal"
+    
+    # Crear wrapper con instrumentación (con gprof solo cambian los flags de compilación)
+    profiling_code = f"""
 #include <stdio.h>
 #include <stdlib.h>
 #include <time.h>
@@ -344,11 +496,19 @@ def prepare_c_profiling(code: str, size: int) -> Tuple[str, str, List[str]]:
 // Código original
 {code}
 
-// Wrapper para profiling con gprof
-int main() {{
+// Sumidero volátil: con -O2 el compilador no puede descartar la llamada medida ni su resultado
+static volatile long long perf_sink;
+
+static int perf_wrapper_comparar(const void* a, const void* b) {{
+    double x = *(const double*)a, y = *(const double*)b;
+    return (x > y) - (x < y);
+}}
+
+// Wrapper para medición de tiempo; el tamaño llega como primer argumento
+int main(int argc, char **argv) {{
     // Generar datos de prueba
-    const int SIZE = {size};
-    int* data = (int*)malloc(SIZE * sizeof(int));
+    const int SIZE = argc > 1 ? atoi(argv[1]) : 0;
+    int* data = (int*)malloc((SIZE > 0 ? SIZE : 1) * sizeof(int));
     if (!data) {{
         fprintf(stderr, "{{\\\"error\\\": \\\"Error de asignación de memoria\\\"}}\\n");
         return 1;
@@ -360,107 +520,133 @@ int main() {{
         data[i] = rand() % 10000;
     }}
     
-    // Medir rendimiento
-    struct timeval start_time, end_time;
-    struct rusage start_usage, end_usage;
-    
-    getrusage(RUSAGE_SELF, &start_usage);
-    gettimeofday(&start_time, NULL);
-    
-    // Llamar a la función principal
-    {f"int result = {main_function}(data, SIZE);" if main_function else "// No se pudo detectar función principal"}
-    
-    // Finalizar mediciones
-    gettimeofday(&end_time, NULL);
-    getrusage(RUSAGE_SELF, &end_usage);
-    
-    // Calcular métricas
-    long time_ms = ((end_time.tv_sec - start_time.tv_sec) * 1000) + 
-                   ((end_time.tv_usec - start_time.tv_usec) / 1000);
-    long memory_kb = end_usage.ru_maxrss - start_usage.ru_maxrss;
-    
-    // Imprimir resultados como JSON
-    printf("{{\\\"time_ms\\\": %ld, \\\"memory_kb\\\": %ld}}\\n", time_ms, memory_kb);
-    
-    free(data);
-    return 0;
-}}
-"""
-        else:
-            # Versión simple sin gprof
-            profiling_code = f"""
-#include <stdio.h>
-#include <stdlib.h>
-#include <time.h>
-#include <string.h>
-#include <sys/time.h>
-#include <sys/resource.h>
-
-// Código original
-{code}
-
-// Wrapper simple para medición de tiempo
-int main() {{
-    // Generar datos de prueba
-    const int SIZE = {size};
-    int* data = (int*)malloc(SIZE * sizeof(int));
-    if (!data) {{
+    // Repeticiones (argv[2]): se informa la mediana; cada una parte de una copia de los datos
+    int repeats = argc > 2 ? atoi(argv[2]) : 1;
+    if (repeats < 1) repeats = 1;
+    int* work = (int*)malloc((SIZE > 0 ? SIZE : 1) * sizeof(int));
+    double* runs_ms = (double*)malloc(repeats * sizeof(double));
+    if (!work || !runs_ms) {{
         fprintf(stderr, "{{\\\"error\\\": \\\"Error de asignación de memoria\\\"}}\\n");
         return 1;
     }}
     
-    // Inicializar datos
-    srand(time(NULL));
-    for (int i = 0; i < SIZE; i++) {{
-        data[i] = rand() % 10000;
-    }}
-    
     // Medir rendimiento
-    struct timeval start_time, end_time;
+    struct timespec start_time, end_time;
     struct rusage start_usage, end_usage;
+    int runs = 0;
+    double total_ms = 0;
     
     getrusage(RUSAGE_SELF, &start_usage);
-    gettimeofday(&start_time, NULL);
-    
-    // Llamar a la función principal
-    {f"int result = {main_function}(data, SIZE);" if main_function else "// No se pudo detectar función principal"}
-    
-    // Finalizar mediciones
-    gettimeofday(&end_time, NULL);
+    while (runs < repeats) {{
+        memcpy(work, data, SIZE * sizeof(int));
+        clock_gettime(CLOCK_MONOTONIC, &start_time);
+        
+        // Llamar a la función principal
+        {llamada_c}
+        
+        clock_gettime(CLOCK_MONOTONIC, &end_time);
+        double run_ms = (end_time.tv_sec - start_time.tv_sec) * 1e3 +
+                        (end_time.tv_nsec - start_time.tv_nsec) / 1e6;
+        runs_ms[runs++] = run_ms;
+        total_ms += run_ms;
+        if (total_ms >= {PRESUPUESTO_REPETICIONES_MS}) break;  // Tamaños grandes: no multiplicar el tiempo
+    }}
     getrusage(RUSAGE_SELF, &end_usage);
+    for (int i = 0; i < SIZE; i++) {{
+        perf_sink += work[i];  // Lo escrito en work tampoco es código muerto
+    }}
     
     // Calcular métricas
-    long time_ms = ((end_time.tv_sec - start_time.tv_sec) * 1000) + 
-                   ((end_time.tv_usec - start_time.tv_usec) / 1000);
+    qsort(runs_ms, runs, sizeof(double), perf_wrapper_comparar);
+    double time_ms = runs % 2 ? runs_ms[runs / 2] : (runs_ms[runs / 2 - 1] + runs_ms[runs / 2]) / 2;
     long memory_kb = end_usage.ru_maxrss - start_usage.ru_maxrss;
     
-    // Imprimir resultados como JSON
-    printf("{{\\\"time_ms\\\": %ld, \\\"memory_kb\\\": %ld}}\\n", time_ms, memory_kb);
-    
+    // Resultados en PERF_OUT con el formato de _FORMATO_METRICAS: double, double, int64
+    const char* out_path = getenv("PERF_OUT");
+    FILE* out = out_path ? fopen(out_path, "wb") : NULL;
+    if (!out) {{
+        fprintf(stderr, "{{\\\"error\\\": \\\"No se pudo abrir PERF_OUT\\\"}}\\n");
+        return 1;
+    }}
+    double memory = (double)memory_kb;
+    long long runs_total = runs;
+    fwrite(&time_ms, sizeof time_ms, 1, out);
+    fwrite(&memory, sizeof memory, 1, out);
+    fwrite(&runs_total, sizeof runs_total, 1, out);
+    fclose(out);
+    
+    free(runs_ms);
+    free(work);
     free(data);
     return 0;
 }}
 """
-        f.write(profiling_code)
-        source_path = f.name
     
     # Compilar con flags adecuados
-    executable_path = os.path.splitext(source_path)[0] + ('.exe' if sys.platform == 'win32' else '')
-    
     if has_gprof:
-        compile_command = ['gcc', '-Wall', '-pg', '-O0', source_path, '-o', executable_path]
+        compile_flags = ['-Wall', '-pg', *C_OPTIMIZACION]
     else:
-        compile_command = ['gcc', '-Wall', '-O0', source_path, '-o', executable_path]
-    
-    try:
-        process = subprocess.run(compile_command, capture_output=True, text=True, timeout=60)
-        if process.returncode != 0:
-            raise ValueError(f"Error compilando código C: {process.stderr}")
-    except subprocess.TimeoutExpired:
-        raise TimeoutError("Timeout durante compilación")
+        compile_flags = ['-Wall', *C_OPTIMIZACION]
+    
+    # La clave cubre el wrapper completo (código, función detectada) y los flags
+    clave = hashlib.blake2b(
+        "\0".join(compile_flags + [profiling_code]).encode('utf-8'), digest_size=16
+    ).hexdigest()
+    os.makedirs(C_BINARIOS_CACHE_DIR, exist_ok=True)
+    base_path = os.path.join(os.path.abspath(C_BINARIOS_CACHE_DIR), clave)  # Se ejecuta con otro cwd
+    source_path = base_path + '.c'
+    executable_path = base_path + ('.exe' if sys.platform == 'win32' else '')
+    
+    with _lock_compilacion(clave):
+        if tocar_artefacto(executable_path):
+            log.info("Ejecutable C reutilizado desde caché (código sin cambios).")
+        else:
+            with open(source_path, 'w', encoding='utf-8') as f:
+                f.write(profiling_code)
+            # Se compila a un nombre temporal y se renombra: otro proceso nunca ve un binario a medias
+            tmp_executable = f"{executable_path}.{os.getpid()}.tmp"
+            compile_command = ['gcc', *compile_flags, source_path, '-o', tmp_executable]
+            try:
+                process = subprocess.run(compile_command, capture_output=True, text=True, timeout=60)
+                if process.returncode != 0:
+                    raise ValueError(f"Error compilando código C: {process.stderr}")
+                os.replace(tmp_executable, executable_path)
+            except subprocess.TimeoutExpired:
+                raise TimeoutError("Timeout durante compilación")
+            finally:
+                if os.path.exists(tmp_executable):
+                    os.unlink(tmp_executable)
+            _podar_cache_binarios()
     
     # Comando para ejecutar
-    return source_path, executable_path, [executable_path]
+    return source_path, executable_path, [executable_path, str(size), str(_repeticiones(size))]
+
+
+def _lock_compilacion(clave: str) -> threading.Lock:
+    """Lock por clave de compilación: evaluaciones simultáneas del mismo código compilan una sola vez."""
+    with _compilacion_locks_lock:
+        lock = _compilacion_locks.get(clave)
+        if lock is None:
+            lock = _compilacion_locks[clave] = threading.Lock()
+            # Se descartan los más antiguos que no estén tomados (uno tomado se está compilando)
+            for antigua in list(_compilacion_locks):
+                if len(_compilacion_locks) <= COMPILACION_LOCKS_MAX:
+                    break
+                if not _compilacion_locks[antigua].locked():
+                    del _compilacion_locks[antigua]
+        else:
+            _compilacion_locks.move_to_end(clave)
+        return lock
+
+
+def _podar_cache_binarios() -> int:
+    """Poda LRU de C_BINARIOS_CACHE_DIR con sus topes (ver disk_cache.podar_cache_lru)."""
+    return podar_cache_lru(C_BINARIOS_CACHE_DIR, C_BINARIOS_CACHE_MAX_ENTRADAS,
+                           C_BINARIOS_CACHE_MAX_BYTES, C_BINARIOS_CACHE_MAX_EDAD_SEG)
+
+
+# Al arrancar: la caché persiste entre ejecuciones y, sin poda, crecería sin tope
+_podar_cache_binarios()
 
 
 def extract_main_function(code: str) -> Optional[str]:
@@ -475,38 +661,29 @@ def extract_main_function(code: str) -> Optional[str]:
     """
     # Intentar usar AST (más preciso)
     try:
-        import ast
-        
-        class FunctionVisitor(ast.NodeVisitor):
-            def __init__(self):
-                self.functions = []
-                
-            def visit_FunctionDef(self, node):
-                self.functions.append(node.name)
-                self.generic_visit(node)
-        
         tree = ast.parse(code)
-        visitor = FunctionVisitor()
-        visitor.visit(tree)
-        
-        if visitor.functions:
-            # Heurística: buscar funciones con nombres típicos de algoritmos
-            common_names = ['sort', 'search', 'find', 'solve', 'process', 'calculate', 'merge', 'partition']
-            for name in common_names:
-                for func in visitor.functions:
-                    if name in func.lower():
+        # Basta con las funciones de nivel superior; solo si no hay se buscan anidadas/métodos
+        functions = [node.name for node in tree.body if isinstance(node, ast.FunctionDef)]
+        if not functions:
+            functions = [node.name for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)]
+        
+        if functions:
+            # Heurística: buscar funciones con nombres típicos de algoritmos (en orden de prioridad)
+            nombres = [func.lower() for func in functions]
+            for name in _NOMBRES_ALGORITMO_PY:
+                for func, nombre in zip(functions, nombres):
+                    if name in nombre:
                         return func
             
             # Si no hay coincidencias, usar la primera función
-            return visitor.functions[0]
+            return functions[0]
         
-    except (ImportError, SyntaxError) as e:
+    except SyntaxError as e:
         log.warning(f"Error analizando código con AST: {e}")
     
     # Fallback: regex
     try:
-        func_pattern = re.compile(r'def\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*\(')
-        matches = func_pattern.findall(code)
+        matches = _RE_FUNCDEF_PY.findall(code)
         
         if matches:
             return matches[0]
@@ -527,34 +704,38 @@ def extract_c_main_function(code: str) -> Optional[str]:
     Returns:
         Nombre de la función principal o None
     """
-    # Buscar definiciones de funciones
-    func_pattern = re.compile(r'(\w+)\s+(\w+)\s*\([^)]*\)\s*{')
-    matches = func_pattern.findall(code)
-    
-    # Filtrar función main
-    candidates = []
-    for ret_type, name in matches:
-        if name != 'main':
-            candidates.append(name)
-    
-    if not candidates:
-        return None
-    
-    # Heurística: priorizar funciones con nombres típicos
-    algo_keywords = ['sort', 'search', 'find', 'solve', 'process', 'calc', 'merge', 'partition']
-    for keyword in algo_keywords:
-        for func in candidates:
-            if keyword in func.lower():
-                return func
+    # Una pasada por las definiciones: se guarda la primera candidata y la de mayor prioridad
+    # según el nombre; una coincidencia con la prioridad máxima termina la búsqueda
+    primera = None
+    mejor = None
+    mejor_prioridad = len(_NOMBRES_ALGORITMO_C)
+    for match in _RE_FUNCDEF_C.finditer(code):
+        name = match.group(2)
+        # Filtrar función main (y "else if (...) {", que el patrón también reconoce)
+        if name == 'main' or name in _CONTADORES_C:
+            continue
+        if primera is None:
+            primera = name
+        nombre = name.lower()
+        for prioridad in range(mejor_prioridad):
+            if _NOMBRES_ALGORITMO_C[prioridad] in nombre:
+                mejor, mejor_prioridad = name, prioridad
+                break
+        if mejor_prioridad == 0:
+            return mejor
     
     # Si no hay coincidencias, usar la primera función
-    return candidates[0]
+    return mejor or primera
 
 
 def run_performance_tests(code: str, language: str) -> List[PerformanceResult]:
     """
     Ejecuta pruebas de rendimiento con diferentes tamaños de entrada.
     
+    Los tamaños se miden en secuencia, de menor a mayor: en paralelo competirían por CPU,
+    caché y ancho de banda de memoria y falsearían los tiempos. Tras el primer timeout no
+    se prueban tamaños mayores.
+    
     Args:
         code: Código fuente
         language: Lenguaje de programación
@@ -562,93 +743,103 @@ def run_performance_tests(code: str, language: str) -> List[PerformanceResult]:
     Returns:
         Lista de resultados de rendimiento
     """
+    if language.lower() not in ('python', 'c', 'cpp', 'c++'):
+        log.warning(f"Lenguaje no soportado para análisis de rendimiento: {language}")
+        return []
+    
     results = []
-    temp_files = []  # Para limpiar después
+    for size in DEFAULT_TEST_SIZES:
+        resultado = _ejecutar_tamano(code, language, size)
+        results.append(resultado)
+        if resultado.timeout:
+            log.warning(f"Timeout en tamaño {size} - Omitiendo tamaños mayores")
+            break
+    return results
+
+
+def _ejecutar_tamano(code: str, language: str, size: int) -> PerformanceResult:
+    """
+    Prepara y ejecuta la prueba de un tamaño. Sus archivos temporales se borran al terminar
+    este tamaño, no al final del barrido: el espacio en disco no crece con el número de tamaños.
+    """
+    temp_files = []
+    # Directorio de trabajo propio: los binarios con -pg escriben gmon.out en el cwd
+    work_dir = tempfile.mkdtemp(prefix='perf_analyzer_')
+    log.info(f"Ejecutando prueba de rendimiento para tamaño {size}")
+    
+    # Calcular timeout adaptativo
+    timeout = min(MAX_EXECUTION_TIME, max(30, size // 100))
     
     try:
-        for size in DEFAULT_TEST_SIZES:
-            log.info(f"Ejecutando prueba de rendimiento para tamaño {size}")
-            
-            try:
-                # Preparar código con profiling
-                if language.lower() == 'python':
-                    tmp_path, command = prepare_python_profiling(code, size)
-                    temp_files.append(tmp_path)
-                elif language.lower() in ['c', 'cpp', 'c++']:
-                    source_path, executable_path, command = prepare_c_profiling(code, size)
-                    temp_files.extend([source_path, executable_path])
-                else:
-                    log.warning(f"Lenguaje no soportado para análisis de rendimiento: {language}")
-                    break
-                
-                # Calcular timeout adaptativo
-                timeout = min(MAX_EXECUTION_TIME, max(30, size // 100))
-                
-                # Ejecutar prueba
-                process = subprocess.run(
-                    command,
-                    capture_output=True,
-                    text=True,
-                    timeout=timeout
-                )
-                
-                if process.returncode == 0:
-                    # Procesar salida JSON
-                    try:
-                        result_data = json.loads(process.stdout)
-                        
-                        # Extraer métricas básicas
-                        time_ms = result_data.get('time_ms', 0)
-                        memory_kb = result_data.get('memory_kb')
-                        
-                        # Guardar resultados
-                        results.append(PerformanceResult(
-                            size=size,
-                            time_ms=time_ms,
-                            memory_kb=memory_kb
-                        ))
-                        
-                    except json.JSONDecodeError as e:
-                        results.append(PerformanceResult(
-                            size=size,
-                            time_ms=0,
-                            error=f"Error decodificando JSON: {e}"
-                        ))
-                
-                else:
-                    # Error en la ejecución
-                    error_msg = "Error desconocido"
-                    try:
-                        error_data = json.loads(process.stderr)
-                        error_msg = error_data.get('error', process.stderr)
-                    except:
-                        error_msg = process.stderr or "Error desconocido"
-                    
-                    results.append(PerformanceResult(
-                        size=size,
-                        time_ms=0,
-                        error=error_msg
-                    ))
-            
-            except subprocess.TimeoutExpired:
-                # Timeout durante la ejecución
-                results.append(PerformanceResult(
-                    size=size,
-                    time_ms=timeout * 1000,  # Convertir a ms
-                    timeout=True
-                ))
-                
-                # No probar tamaños mayores si ya hay timeout
-                log.warning(f"Timeout en tamaño {size} - Omitiendo tamaños mayores")
-                break
-                
-            except Exception as e:
-                log.error(f"Error en prueba de tamaño {size}: {e}", exc_info=True)
-                results.append(PerformanceResult(
+        # Preparar código con profiling
+        if language.lower() == 'python':
+            tmp_path, command = prepare_python_profiling(code, size)
+            temp_files.append(tmp_path)
+        else:
+            # Fuente y ejecutable quedan en la caché de binarios: no son temporales
+            _, _, command = prepare_c_profiling(code, size)
+        
+        # Las métricas llegan en binario por un archivo aparte (PERF_OUT): así no se parsea JSON
+        # y lo que imprima el código del estudiante por stdout no las corrompe
+        out_path = os.path.join(work_dir, 'metricas.perf')
+        
+        # Ejecutar prueba
+        process = subprocess.run(
+            command,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            cwd=work_dir,
+            env=dict(os.environ, PERF_OUT=out_path)
+        )
+        
+        if process.returncode == 0:
+            with open(out_path, 'rb') as f:
+                datos = f.read()
+            if len(datos) < _FORMATO_METRICAS.size:
+                return PerformanceResult(
                     size=size,
                     time_ms=0,
-                    error=str(e)
-                ))
+                    error="El proceso de prueba no escribió sus métricas"
+                )
+            
+            # Extraer métricas básicas
+            time_ms, memory_kb, _runs = _FORMATO_METRICAS.unpack_from(datos)
+            return PerformanceResult(
+                size=size,
+                time_ms=time_ms,
+                memory_kb=memory_kb
+            )
+        
+        # Error en la ejecución
+        error_msg = "Error desconocido"
+        try:
+            error_data = json.loads(process.stderr)
+            error_msg = error_data.get('error', process.stderr)
+        except:
+            error_msg = process.stderr or "Error desconocido"
+        
+        return PerformanceResult(
+            size=size,
+            time_ms=0,
+            error=error_msg
+        )
+    
+    except subprocess.TimeoutExpired:
+        # Timeout durante la ejecución
+        return PerformanceResult(
+            size=size,
+            time_ms=timeout * 1000,  # Convertir a ms
+            timeout=True
+        )
+        
+    except Exception as e:
+        log.error(f"Error en prueba de tamaño {size}: {e}", exc_info=True)
+        return PerformanceResult(
+            size=size,
+            time_ms=0,
+            error=str(e)
+        )
     
     finally:
         # Limpiar archivos temporales
@@ -658,8 +849,7 @@ def run_performance_tests(code: str, language: str) -> List[PerformanceResult]:
                     os.unlink(file_path)
             except Exception as e:
                 log.warning(f"Error eliminando archivo temporal {file_path}: {e}")
-    
-    return results
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 
 def estimate_complexity(results: List[PerformanceResult]) -> Tuple[str, float]:
@@ -678,82 +868,110 @@ def estimate_complexity(results: List[PerformanceResult]) -> Tuple[str, float]:
     if len(valid_results) < MIN_TEST_SAMPLES:
         return "Indeterminada", 0.0
     
+    # Sin caché: los tiempos medidos casi nunca se repiten, y redondearlos para que lo hagan
+    # falsea la pendiente en código rápido (los tiempos de microsegundos se aplanan)
+    return _estimar_complejidad_puntos(tuple((r.size, r.time_ms) for r in valid_results))
+
+
+# Clasificación por la pendiente b de log(tiempo) = a + b·log(n): (límite superior, clase).
+# Por encima del último límite, O(2^n).
+_CLASES_POR_PENDIENTE = (
+    (0.2, "O(1)"),
+    (0.7, "O(log n)"),
+    (1.2, "O(n)"),
+    (2.3, "O(n²)"),
+    (3.3, "O(n³)"),
+)
+# Clases que la pendiente no separa bien (difieren en un factor log): se decide por el residuo
+# frente a cada curva. Las curvas requieren tamaños > 1.
+_CURVAS_DESEMPATE = {
+    "O(1)": lambda n: 1.0,
+    "O(log n)": math.log2,
+    "O(n)": float,
+    "O(n log n)": lambda n: n * math.log2(n),
+    "O(n²)": lambda n: float(n) ** 2,
+}
+_DESEMPATES = {
+    "O(1)": ("O(1)", "O(log n)"),
+    "O(log n)": ("O(1)", "O(log n)"),
+    "O(n)": ("O(n)", "O(n log n)"),
+    # n log n sobre 10..10000 tiene pendiente ~1.2: cae en el borde del tramo cuadrático
+    "O(n²)": ("O(n log n)", "O(n²)"),
+}
+
+
+def _estimar_complejidad_puntos(puntos: Tuple[Tuple[int, float], ...]) -> Tuple[str, float]:
+    """
+    Ajusta una recta a log(tiempo) frente a log(tamaño) y clasifica por su pendiente.
+    La confianza es el R² del ajuste (para O(1), la cercanía de la pendiente a 0).
+    """
     # Extraer tamaños y tiempos
-    sizes = [r.size for r in valid_results]
-    times = [r.time_ms for r in valid_results]
-    
-    # Calcular errores con diferentes modelos de complejidad
-    errors = {}
-    
-    # Normalizar tiempos para comparación
-    max_time = max(times)
-    normalized_times = [t / max_time for t in times]
-    
-    # O(1)
-    const_expected = [1.0 for _ in sizes]
-    const_error = sum((t - e)**2 for t, e in zip(normalized_times, const_expected)) / len(sizes)
-    errors["O(1)"] = const_error
-    
-    # O(log n)
-    try:
-        log_expected = [math.log2(s) if s > 0 else 0.1 for s in sizes]
-        max_log = max(log_expected)
-        if max_log > 0:
-            normalized_log = [l / max_log for l in log_expected]
-            log_error = sum((t - l)**2 for t, l in zip(normalized_times, normalized_log)) / len(sizes)
-            errors["O(log n)"] = log_error
-    except:
-        errors["O(log n)"] = float('inf')
-    
-    # O(n)
-    linear_expected = [s / max(sizes) for s in sizes]
-    linear_error = sum((t - l)**2 for t, l in zip(normalized_times, linear_expected)) / len(sizes)
-    errors["O(n)"] = linear_error
-    
-    # O(n log n)
-    try:
-        nlogn_expected = [(s * math.log2(s if s > 0 else 0.1)) for s in sizes]
-        max_nlogn = max(nlogn_expected)
-        if max_nlogn > 0:
-            normalized_nlogn = [nl / max_nlogn for nl in nlogn_expected]
-            nlogn_error = sum((t - nl)**2 for t, nl in zip(normalized_times, normalized_nlogn)) / len(sizes)
-            errors["O(n log n)"] = nlogn_error
-    except:
-        errors["O(n log n)"] = float('inf')
-    
-    # O(n²)
-    quadratic_expected = [(s / max(sizes))**2 for s in sizes]
-    quadratic_error = sum((t - q)**2 for t, q in zip(normalized_times, quadratic_expected)) / len(sizes)
-    errors["O(n²)"] = quadratic_error
-    
-    # O(n³)
-    cubic_expected = [(s / max(sizes))**3 for s in sizes]
-    cubic_error = sum((t - c)**2 for t, c in zip(normalized_times, cubic_expected)) / len(sizes)
-    errors["O(n³)"] = cubic_error
-    
-    # O(2^n)
-    try:
-        # Usar factor de escala para evitar overflow
-        scale_factor = 10.0 / max(sizes)
-        exp_expected = [2**(s * scale_factor) for s in sizes]
-        max_exp = max(exp_expected)
-        if max_exp > 0:
-            normalized_exp = [e / max_exp for e in exp_expected]
-            exp_error = sum((t - e)**2 for t, e in zip(normalized_times, normalized_exp)) / len(sizes)
-            errors["O(2^n)"] = exp_error
-    except:
-        errors["O(2^n)"] = float('inf')
-    
-    # Encontrar el modelo con menor error
-    best_complexity = min(errors.items(), key=lambda x: x[1])
-    complexity_name, error_value = best_complexity
-    
-    # Calcular nivel de confianza (inversamente proporcional al error)
-    confidence = 1.0 / (1.0 + error_value)
-    
+    sizes = [size for size, _ in puntos]
+    times = [time_ms for _, time_ms in puntos]
+    if len(set(sizes)) < 2:
+        return "Indeterminada", 0.0
+
+    pendiente, confidence = _ajuste_log_log(sizes, times)
+
+    complexity_name = "O(2^n)"
+    for limite, clase in _CLASES_POR_PENDIENTE:
+        if pendiente < limite:
+            complexity_name = clase
+            break
+
+    candidatas = _DESEMPATES.get(complexity_name)
+    if candidatas and min(sizes) > 1:
+        log_times = [math.log(t) for t in times]
+        clave_sizes = tuple(sizes)
+        complexity_name = min(
+            candidatas,
+            key=lambda clase: _dispersion_log(log_times, _log_curva(clase, clave_sizes))
+        )
+
+    if complexity_name == "O(1)":
+        # Sobre tiempos planos el R² solo mide ruido: la confianza es la cercanía de la pendiente a 0
+        confidence = max(0.0, 1.0 - abs(pendiente) / _CLASES_POR_PENDIENTE[0][0])
+
     return complexity_name, confidence
 
 
+def _ajuste_log_log(sizes: List[int], times: List[float]) -> Tuple[float, float]:
+    """Pendiente de la recta log(tiempo) = a + b·log(n) por mínimos cuadrados y su R² en [0, 1]."""
+    if np is not None:
+        x = np.log(np.asarray(sizes, dtype=np.float64))
+        y = np.log(np.asarray(times, dtype=np.float64))
+        b, a = np.polyfit(x, y, 1)
+        ss_res = float(((y - (a + b * x)) ** 2).sum())
+        ss_tot = float(((y - y.mean()) ** 2).sum())
+    else:
+        x = [math.log(s) for s in sizes]
+        y = [math.log(t) for t in times]
+        b, a = statistics.linear_regression(x, y)
+        media = statistics.fmean(y)
+        ss_res = sum((yi - (a + b * xi)) ** 2 for xi, yi in zip(x, y))
+        ss_tot = sum((yi - media) ** 2 for yi in y)
+    # Tiempos idénticos: la recta horizontal los explica por completo
+    r2 = 1.0 - ss_res / ss_tot if ss_tot > 0 else 1.0
+    return float(b), min(1.0, max(0.0, r2))
+
+
+@lru_cache(maxsize=256)
+def _log_curva(clase: str, sizes: Tuple[int, ...]) -> Tuple[float, ...]:
+    """
+    log(curva(n)) de una clase de desempate. Solo depende de los tamaños, que casi siempre son
+    DEFAULT_TEST_SIZES: en una corrección por lotes se calcula una vez y no por entrega.
+    """
+    curva = _CURVAS_DESEMPATE[clase]
+    return tuple(math.log(curva(s)) for s in sizes)
+
+
+def _dispersion_log(log_times: List[float], log_curva: Tuple[float, ...]) -> float:
+    """Cuánto se apartan los tiempos de c·curva(n) para el mejor c: varianza de log(t) - log(curva)."""
+    diferencias = [t - e for t, e in zip(log_times, log_curva)]
+    media = statistics.fmean(diferencias)
+    return sum((d - media) ** 2 for d in diferencias)
+
+
 def generate_performance_report(
     results: List[PerformanceResult],
     static_analysis: Dict[str, Any],
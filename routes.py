@@ -12,6 +12,8 @@ from datetime import datetime
 import sys
 import json
 import os
+import time
+from functools import lru_cache
 from werkzeug.utils import secure_filename
 import zipfile
 import io
@@ -29,74 +31,99 @@ def obtener_entregas_recientes(docente_id, limite=5):
     """
     Obtiene las entregas más recientes relacionadas con los cursos del docente.
     """
-    # Obtener horarios del docente
-    horarios = Usuario.query.get(docente_id).horarios
-    
-    # Obtener ids de exámenes asociados a esos horarios
-    examenes_ids = db.session.query(Examen.id).filter(
-        Examen.horario_id.in_([h.id for h in horarios])
-    ).all()
-    examenes_ids = [id[0] for id in examenes_ids]
-    
-    # Obtener las entregas más recientes para esos exámenes
-    entregas_recientes = Entrega.query.join(Pregunta).filter(
-        Pregunta.examen_id.in_(examenes_ids)
-    ).order_by(Entrega.fecha_entrega.desc()).limit(limite).all()
+    # Una sola consulta: los joins ya traen pregunta y examen, así que se
+    # reutilizan con contains_eager (sin lazy loads por fila en la plantilla).
+    entregas_recientes = Entrega.query\
+        .join(Entrega.pregunta)\
+        .join(Pregunta.examen)\
+        .join(usuario_horario, usuario_horario.c.horario_id == Examen.horario_id)\
+        .filter(usuario_horario.c.usuario_id == docente_id)\
+        .options(
+            db.contains_eager(Entrega.pregunta).contains_eager(Pregunta.examen),
+            db.selectinload(Entrega.alumno)
+        )\
+        .order_by(Entrega.fecha_entrega.desc())\
+        .limit(limite).all()
     
     return entregas_recientes
 
 # Agregar al principio del archivo routes.py o crear un archivo helpers.py
-from sqlalchemy import func
+from sqlalchemy import func, case, distinct, event, select
 from collections import defaultdict
 
-def obtener_evaluaciones_por_examen(examen_id=None, curso_id=None):
+def _subconsulta_ultimas_evaluaciones(examen_id=None, curso_id=None):
     """
-    Obtiene las evaluaciones filtradas por examen y/o curso.
-    Sólo incluye la última entrega de cada alumno para cada pregunta.
+    Subconsulta (eid, rn) con las evaluaciones filtradas por examen y/o curso;
+    rn == 1 marca la última entrega de cada alumno para cada pregunta.
     """
-    # Base query - join todas las tablas necesarias
-    query = db.session.query(Evaluacion)\
+    # Numerar las entregas de cada (alumno, pregunta) de la más reciente a la más
+    # antigua; la deduplicación ocurre en la BD y solo viajan las filas con rn == 1.
+    rn = func.row_number().over(
+        partition_by=(Entrega.alumno_id, Entrega.pregunta_id),
+        order_by=Entrega.fecha_entrega.desc()
+    ).label('rn')
+    sub = db.session.query(Evaluacion.id.label('eid'), rn)\
         .join(Entrega, Evaluacion.entrega_id == Entrega.id)\
         .join(Pregunta, Entrega.pregunta_id == Pregunta.id)\
         .join(Examen, Pregunta.examen_id == Examen.id)\
         .join(Horario, Examen.horario_id == Horario.id)\
-        .join(OfertaDeCurso, Horario.oferta_de_curso_id == OfertaDeCurso.id)\
-        .join(Curso, OfertaDeCurso.curso_id == Curso.id)
+        .join(OfertaDeCurso, Horario.oferta_de_curso_id == OfertaDeCurso.id)
     
     # Aplicar filtros si se proporcionan
     if examen_id:
-        query = query.filter(Examen.id == examen_id)
+        sub = sub.filter(Examen.id == examen_id)
     if curso_id:
-        query = query.filter(Curso.id == curso_id)
-    
-    # Obtener todas las entregas que coinciden con los filtros
-    evaluaciones = query.all()
-    
-    # Diccionario para rastrear la última entrega de cada alumno por pregunta
-    ultimas_entregas = {}
-    
-    for eval in evaluaciones:
-        alumno_id = eval.entrega.alumno_id
-        pregunta_id = eval.entrega.pregunta_id
-        fecha_entrega = eval.entrega.fecha_entrega
-        
-        key = (alumno_id, pregunta_id)
-        
-        # Si no existe esta combinación alumno-pregunta o si esta entrega es más reciente
-        if key not in ultimas_entregas or fecha_entrega > ultimas_entregas[key][1]:
-            ultimas_entregas[key] = (eval.id, fecha_entrega)
-    
-    # Obtener solo los IDs de las evaluaciones que corresponden a las últimas entregas
-    ids_ultimas_evaluaciones = [eval_id for eval_id, _ in ultimas_entregas.values()]
-    
-    # Filtrar las evaluaciones originales para quedarnos solo con las últimas
-    return Evaluacion.query.filter(Evaluacion.id.in_(ids_ultimas_evaluaciones))
+        sub = sub.filter(OfertaDeCurso.curso_id == curso_id)
+    return sub.subquery()
 
-def calcular_estadisticas_evaluaciones(evaluaciones):
+def obtener_evaluaciones_por_examen(examen_id=None, curso_id=None):
     """
-    Calcula estadísticas generales a partir de una lista de evaluaciones.
+    Obtiene las evaluaciones filtradas por examen y/o curso.
+    Sólo incluye la última entrega de cada alumno para cada pregunta.
     """
-    if not evaluaciones:
+    sub = _subconsulta_ultimas_evaluaciones(examen_id, curso_id)
+    
+    # Se devuelve una QUERY (no una lista) para que el llamador pueda ordenar y paginar.
+    # Se precarga todo lo que leen la plantilla y la descarga (entrega, pregunta,
+    # examen y alumno) para no disparar un SELECT perezoso por evaluación.
+    opciones = [
+        db.joinedload(Evaluacion.entrega).options(
+            db.joinedload(Entrega.pregunta).joinedload(Pregunta.examen),
+            db.selectinload(Entrega.alumno)
+        )
+    ]
+    if current_app.config.get('SQLALCHEMY_RAISELOAD'):
+        opciones.append(db.raiseload('*'))
+    return Evaluacion.query\
+        .join(sub, sub.c.eid == Evaluacion.id)\
+        .filter(sub.c.rn == 1)\
+        .options(*opciones)
+
+def calcular_estadisticas_evaluaciones(examen_id=None, curso_id=None):
+    """
+    Calcula estadísticas generales de las últimas evaluaciones filtradas por examen
+    y/o curso. Todo se agrega en la BD: solo vuelven escalares y una fila por examen.
+    """
+    sub = _subconsulta_ultimas_evaluaciones(examen_id, curso_id)
+    
+    def _ultimas(*columnas):
+        return db.session.query(*columnas)\
+            .select_from(Evaluacion)\
+            .join(sub, sub.c.eid == Evaluacion.id)\
+            .join(Entrega, Evaluacion.entrega_id == Entrega.id)\
+            .join(Pregunta, Entrega.pregunta_id == Pregunta.id)\
+            .filter(sub.c.rn == 1)
+    
+    # Totales: conteo, sumas para el promedio general y conteos de únicos
+    total, total_puntos, total_max_puntos, estudiantes_unicos, examenes_unicos = _ultimas(
+        func.count(Evaluacion.id),
+        func.sum(Evaluacion.puntaje_obtenido),
+        func.sum(Pregunta.puntaje_total),
+        func.count(distinct(Entrega.alumno_id)),
+        func.count(distinct(Pregunta.examen_id))
+    ).one()
+    
+    if not total:
         return {
             'total_evaluaciones': 0,
             'promedio_general': 0,
@@ -106,105 +133,130 @@ def calcular_estadisticas_evaluaciones(evaluaciones):
             'rendimiento_examenes': {}
         }
     
-    # Conjunto para rastrear IDs únicos
-    estudiantes_ids = set()
-    examenes_ids = set()
-    
-    # Para calcular promedios por examen
-    examen_stats = defaultdict(lambda: {'total_puntos': 0, 'max_puntos': 0, 'count': 0})
-    
-    # Para distribución de calificaciones
-    distribuciones = [0, 0, 0, 0, 0]  # 0-20%, 21-40%, 41-60%, 61-80%, 81-100%
-    
-    # Variables para promedio general
-    total_puntos = 0
-    total_max_puntos = 0
-    
-    # Analizar cada evaluación
-    for eval in evaluaciones:
-        estudiantes_ids.add(eval.entrega.alumno_id)
-        examen_id = eval.entrega.pregunta.examen_id
-        examenes_ids.add(examen_id)
-        
-        puntos = eval.puntaje_obtenido
-        max_puntos = eval.entrega.pregunta.puntaje_total
-        
-        # Sumar para el promedio general
-        total_puntos += puntos
-        total_max_puntos += max_puntos
-        
-        # Agregar a las estadísticas por examen
-        examen_titulo = eval.entrega.pregunta.examen.titulo
-        examen_stats[examen_titulo]['total_puntos'] += puntos
-        examen_stats[examen_titulo]['max_puntos'] += max_puntos
-        examen_stats[examen_titulo]['count'] += 1
-        
-        # Calcular porcentaje y actualizar distribución
-        if max_puntos > 0:
-            porcentaje = (puntos / max_puntos) * 100
-            if porcentaje <= 20:
-                distribuciones[0] += 1
-            elif porcentaje <= 40:
-                distribuciones[1] += 1
-            elif porcentaje <= 60:
-                distribuciones[2] += 1
-            elif porcentaje <= 80:
-                distribuciones[3] += 1
-            else:
-                distribuciones[4] += 1
-    
     # Calcular el promedio general
     promedio_general = 0
     if total_max_puntos > 0:
         promedio_general = (total_puntos / total_max_puntos) * 100
     
-    # Calcular promedios por examen
+    # Promedios por examen (agrupados por título, como se muestran)
     rendimiento_examenes = {}
-    for examen, stats in examen_stats.items():
-        if stats['max_puntos'] > 0:
-            rendimiento_examenes[examen] = (stats['total_puntos'] / stats['max_puntos']) * 100
-        else:
-            rendimiento_examenes[examen] = 0
+    por_examen = _ultimas(Examen.titulo, func.sum(Evaluacion.puntaje_obtenido), func.sum(Pregunta.puntaje_total))\
+        .join(Examen, Pregunta.examen_id == Examen.id)\
+        .group_by(Examen.titulo)
+    for titulo, puntos, max_puntos in por_examen:
+        rendimiento_examenes[titulo] = (puntos / max_puntos) * 100 if max_puntos > 0 else 0
+    
+    # Distribución de calificaciones: tramo 0-4 según el porcentaje (sin dividir:
+    # puntos * 100 <= límite * máximo), solo para preguntas con puntaje > 0
+    puntos_pct = Evaluacion.puntaje_obtenido * 100
+    tramo = case(
+        *[(puntos_pct <= limite * Pregunta.puntaje_total, i) for i, limite in enumerate((20, 40, 60, 80))],
+        else_=4
+    ).label('tramo')
+    distribuciones = [0, 0, 0, 0, 0]  # 0-20%, 21-40%, 41-60%, 61-80%, 81-100%
+    for idx, cantidad in _ultimas(tramo, func.count()).filter(Pregunta.puntaje_total > 0).group_by(tramo):
+        distribuciones[idx] = cantidad
     
     return {
-        'total_evaluaciones': len(evaluaciones),
+        'total_evaluaciones': total,
         'promedio_general': round(promedio_general, 1),
-        'estudiantes_unicos': len(estudiantes_ids),
-        'examenes_unicos': len(examenes_ids),
+        'estudiantes_unicos': estudiantes_unicos,
+        'examenes_unicos': examenes_unicos,
         'distribuciones': distribuciones,
         'rendimiento_examenes': rendimiento_examenes
     }
 
+def _horario_ids_de_usuario(usuario_id):
+    """
+    SELECT de los IDs de horario del usuario, para usar en un IN (...): evita cargar
+    el Usuario y sus objetos Horario solo para leer los IDs.
+    """
+    return select(usuario_horario.c.horario_id).where(usuario_horario.c.usuario_id == usuario_id)
+
 def obtener_cursos_y_examenes_docente(docente_id):
     """
     Obtiene la lista de cursos y exámenes disponibles para un docente específico.
     """
-    # Obtener horarios del docente
-    horarios = Usuario.query.get(docente_id).horarios
-    
-    # Obtener cursos únicos
-    cursos = {}
-    for horario in horarios:
-        curso = horario.oferta_de_curso.curso
-        if curso.id not in cursos:
-            cursos[curso.id] = {
-                'id': curso.id,
-                'nombre': curso.nombre,
-                'codigo': curso.codigo
-            }
-    
-    # Obtener exámenes asociados a los horarios del docente
-    examenes = []
-    for horario in horarios:
-        for examen in horario.examenes:
-            examenes.append({
-                'id': examen.id,
-                'titulo': examen.titulo,
-                'curso_id': horario.oferta_de_curso.curso_id,
-                'curso_nombre': horario.oferta_de_curso.curso.nombre
-            })
+    # Cursos únicos de los horarios del docente (solo columnas, sin hidratar objetos)
+    filas_cursos = db.session.query(Curso.id, Curso.nombre, Curso.codigo)\
+        .join(OfertaDeCurso, OfertaDeCurso.curso_id == Curso.id)\
+        .join(Horario, Horario.oferta_de_curso_id == OfertaDeCurso.id)\
+        .join(usuario_horario, usuario_horario.c.horario_id == Horario.id)\
+        .filter(usuario_horario.c.usuario_id == docente_id)\
+        .distinct().order_by(Curso.nombre).all()
+    cursos = [fila._asdict() for fila in filas_cursos]
+    
+    # Exámenes asociados a los horarios del docente
+    filas_examenes = db.session.query(
+            Examen.id, Examen.titulo,
+            Curso.id.label('curso_id'), Curso.nombre.label('curso_nombre')
+        )\
+        .join(Horario, Examen.horario_id == Horario.id)\
+        .join(usuario_horario, usuario_horario.c.horario_id == Horario.id)\
+        .join(OfertaDeCurso, Horario.oferta_de_curso_id == OfertaDeCurso.id)\
+        .join(Curso, OfertaDeCurso.curso_id == Curso.id)\
+        .filter(usuario_horario.c.usuario_id == docente_id)\
+        .order_by(Horario.id, Examen.id).all()
+    examenes = [fila._asdict() for fila in filas_examenes]
     
-    return list(cursos.values()), examenes
+    return cursos, examenes
+
+def _load_all_linters():
+    """
+    Opciones de linter (perfil, nombre mostrado) por cada lenguaje soportado, con
+    '--- Ninguno ---' primero. Una sola consulta para todos los lenguajes.
+    """
+    codigos_lenguaje = [lang[0] for lang in LENGUAJES_SOPORTADOS]
+    filas = HerramientaAnalisis.query.with_entities(
+        HerramientaAnalisis.lenguaje, HerramientaAnalisis.nombre, HerramientaAnalisis.nombre_mostrado
+    ).filter(
+        HerramientaAnalisis.lenguaje.in_(codigos_lenguaje)
+    ).order_by(HerramientaAnalisis.lenguaje, HerramientaAnalisis.nombre_mostrado).all()
+    
+    todos_los_linters = {lc: [('', '--- Ninguno ---')] for lc in codigos_lenguaje}
+    for lenguaje, nombre, nombre_mostrado in filas:
+        todos_los_linters[lenguaje].append((nombre, nombre_mostrado))
+    return todos_los_linters
+
+# Las herramientas cambian muy rara vez (las instala seed_data.py en otro proceso):
+# se cachean en memoria y se vuelven a leer como mucho cada LINTERS_CACHE_TTL segundos.
+LINTERS_CACHE_TTL = 300
+
+@lru_cache(maxsize=1)
+def _linters_cached(_periodo):
+    """(dict de linters, su JSON) para el periodo de TTL dado; los errores no se cachean."""
+    todos_los_linters = _load_all_linters()
+    return todos_los_linters, json.dumps(todos_los_linters)
+
+def _linters_y_json():
+    """Linters por lenguaje y su JSON ya serializado. Tratar el dict como solo lectura."""
+    return _linters_cached(int(time.monotonic() // LINTERS_CACHE_TTL))
+
+# JSON de respaldo para el formulario si no se pudieron leer los linters
+_LINTERS_ERROR_JSON = json.dumps({lang[0]: [('', '--- Error ---')] for lang in LENGUAJES_SOPORTADOS})
+
+def _render_examen_form(form, editar=False, **contexto):
+    """Renderiza crear_examen.html (crear o editar) con los linters por lenguaje en JSON."""
+    try:
+        todos_los_linters, todos_los_linters_json = _linters_y_json()
+        print(f"Linters obtenidos para {len(todos_los_linters)} lenguajes.")
+    except Exception as e:
+        flash('Error al cargar opciones de linter.', 'warning')
+        print(f"Error obteniendo linters para formulario: {e}", file=sys.stderr)
+        todos_los_linters_json = _LINTERS_ERROR_JSON
+    return render_template(
+        'crear_examen.html',
+        form=form,
+        editar=editar,
+        todos_los_linters_json=todos_los_linters_json,
+        **contexto
+    )
+
+@event.listens_for(HerramientaAnalisis, 'after_insert')
+@event.listens_for(HerramientaAnalisis, 'after_update')
+@event.listens_for(HerramientaAnalisis, 'after_delete')
+def _invalidar_linters_cached(mapper, connection, target):
+    _linters_cached.cache_clear()
 
 @app.route('/')
 def index():
@@ -289,8 +341,7 @@ def dashboard():
     now = datetime.utcnow()  # Para comparar con fechas de exámenes
     
     if current_user.rol == 'alumno':
-        horarios = current_user.horarios
-        examenes = Examen.query.filter(Examen.horario_id.in_([h.id for h in horarios])).all()
+        examenes = Examen.query.filter(Examen.horario_id.in_(_horario_ids_de_usuario(current_user.id))).all()
         
         # Obtener entregas recientes para el alumno
         entregas_recientes = Entrega.query.filter(
@@ -307,8 +358,12 @@ def dashboard():
             entregas_recientes=entregas_recientes
         )
     elif current_user.rol == 'docente':
-        horarios = current_user.horarios
-        examenes = Examen.query.filter(Examen.horario_id.in_([h.id for h in horarios])).all()
+        examenes = Examen.query.filter(Examen.horario_id.in_(_horario_ids_de_usuario(current_user.id))).all()
+        # La plantilla cuenta los alumnos de cada horario: horarios y usuarios se cargan con
+        # selectinload sobre el mismo current_user, en lugar de una consulta por horario
+        Usuario.query.options(
+            db.selectinload(Usuario.horarios).selectinload(Horario.usuarios)
+        ).filter_by(id=current_user.id).one()
         return render_template(
             'dashboard_docente.html', 
             examenes=examenes, 
@@ -514,8 +569,7 @@ def gestionar_examenes():
         flash('Acceso no autorizado.', 'danger')
         return redirect(url_for('dashboard'))
 
-    horarios = current_user.horarios
-    examenes = Examen.query.filter(Examen.horario_id.in_([h.id for h in horarios])).all()
+    examenes = Examen.query.filter(Examen.horario_id.in_(_horario_ids_de_usuario(current_user.id))).all()
     form = DeleteForm()  # Instanciar el formulario de eliminación
     return render_template('gestionar_examenes.html', examenes=examenes, form=form)
 
@@ -542,24 +596,19 @@ def crear_examen():
 
     if request.method == 'POST':
         print("Procesando POST /docente/crear_examen - Poblando Choices Linter")
+        try:
+            linters_por_lenguaje, _ = _linters_y_json()  # Una consulta para todas las preguntas
+        except Exception as e_choices:
+            print(f"Error obteniendo linters para choices: {e_choices}", file=sys.stderr)
+            linters_por_lenguaje = None
         for i, pregunta_subform in enumerate(form.preguntas):
-            try:
-                lenguaje_seleccionado = request.form.get(f'preguntas-{i}-lenguaje_programacion')
-                print(f"  Poblando choices pregunta {i}, lenguaje: {lenguaje_seleccionado}")
-                if lenguaje_seleccionado:
-                    # --- INICIO: Lógica de obtener_linters_para_lenguaje_bd integrada ---
-                    opciones = [('', '--- Ninguno ---')]
-                    herramientas = HerramientaAnalisis.query.filter_by(
-                        lenguaje=lenguaje_seleccionado
-                    ).order_by(HerramientaAnalisis.nombre_mostrado).all()
-                    opciones.extend([(h.nombre, h.nombre_mostrado) for h in herramientas])
-                    pregunta_subform.linter_perfil.choices = opciones
-                    # --- FIN: Lógica integrada ---
-                else:
-                    pregunta_subform.linter_perfil.choices = [('', '--- Ninguno ---')]
-            except Exception as e_choices:
-                 print(f"Error poblando choices pregunta {i}: {e_choices}", file=sys.stderr)
-                 pregunta_subform.linter_perfil.choices = [('', '--- Error ---')]
+            lenguaje_seleccionado = request.form.get(f'preguntas-{i}-lenguaje_programacion')
+            print(f"  Poblando choices pregunta {i}, lenguaje: {lenguaje_seleccionado}")
+            if linters_por_lenguaje is None:
+                pregunta_subform.linter_perfil.choices = [('', '--- Error ---')]
+            else:
+                # Copia: la lista memoizada en _linters_cached no debe compartirse entre formularios
+                pregunta_subform.linter_perfil.choices = list(linters_por_lenguaje.get(lenguaje_seleccionado, [('', '--- Ninguno ---')]))
 
     if form.validate_on_submit():
         # --- Procesamiento POST ---
@@ -575,96 +624,102 @@ def crear_examen():
             habilitar_similitud = form.habilitar_similitud.data
             habilitar_rendimiento = form.habilitar_rendimiento.data # Nombre correcto
 
-            horarios = Horario.query.join(OfertaDeCurso).filter(
+            # Solo se necesitan los IDs: sin hidratar objetos Horario
+            horario_ids = [fila[0] for fila in db.session.query(Horario.id).join(OfertaDeCurso).filter(
                 OfertaDeCurso.curso_id.in_(selected_curso_ids)
-            ).all()
+            ).all()]
 
-            if not horarios:
+            if not horario_ids:
                 flash('No hay horarios válidos asociados a los cursos seleccionados.', 'warning')
                 # Renderizar de nuevo con el error y los datos ingresados
-                # Necesitamos volver a cargar los linters para el renderizado
-                todos_los_linters = {}
-                try:
-                    codigos_lenguaje = [lang[0] for lang in LENGUAJES_SOPORTADOS]
-                    for lenguaje_codigo in codigos_lenguaje:
-                        opciones = [('', '--- Ninguno ---')]
-                        herramientas = HerramientaAnalisis.query.filter_by(lenguaje=lenguaje_codigo).order_by(HerramientaAnalisis.nombre_mostrado).all()
-                        opciones.extend([(h.nombre, h.nombre_mostrado) for h in herramientas])
-                        todos_los_linters[lenguaje_codigo] = opciones
-                except Exception as e_linter:
-                    print(f"Error obteniendo linters (POST error): {e_linter}", file=sys.stderr)
-                    for lc in [lang[0] for lang in LENGUAJES_SOPORTADOS]: todos_los_linters[lc] = [('', '--- Error ---')]
-
-                return render_template('crear_examen.html', form=form, editar=False, todos_los_linters_json=json.dumps(todos_los_linters))
-
+                return _render_examen_form(form)
+
+
+            # Datos de preguntas y casos: se preparan una vez y se repiten por horario
+            preguntas_data = []
+            for i, pregunta_form_data in enumerate(form.preguntas.data): # Iterar sobre la data
+                print(f"  Procesando pregunta índice {i}: {pregunta_form_data.get('enunciado', '')[:30]}...")
+                # Crear JSON de configuración de formato
+                config_formato = None
+                perfil_linter = pregunta_form_data.get('linter_perfil')
+                args_adicionales = pregunta_form_data.get('linter_args_adicionales', '')
+
+                if habilitar_formato_global and perfil_linter:
+                    config_formato = {
+                        "perfil": perfil_linter,
+                        "args_adicionales": args_adicionales or ""
+                    }
+                config_formato_json = json.dumps(config_formato) if config_formato else None
+                print(f"    Config formato JSON: {config_formato_json}")
+
+                campos_pregunta = dict(
+                    enunciado=pregunta_form_data['enunciado'],
+                    puntaje_total=pregunta_form_data['puntaje_total'],
+                    lenguaje_programacion=pregunta_form_data['lenguaje_programacion'],
+                    rubrica_evaluacion=pregunta_form_data.get('rubrica_evaluacion') or None,
+                    configuracion_formato_json=config_formato_json
+                )
+                campos_casos = [
+                    dict(
+                        descripcion=caso_data.get('descripcion'), # Usar get para opcionales
+                        argumentos=caso_data.get('argumentos'),
+                        entrada=caso_data.get('entrada'),
+                        salida_esperada=caso_data.get('salida_esperada'),
+                        puntos=caso_data['puntos'], # Asumir requerido
+                        es_oculto=caso_data.get('es_oculto', False)
+                    )
+                    for caso_data in pregunta_form_data.get('casos_de_prueba', [])
+                ]
+                preguntas_data.append((campos_pregunta, campos_casos))
 
-            # Usar transacción para asegurar atomicidad
+            # Usar transacción para asegurar atomicidad. Se inserta por fases (un flush
+            # por nivel, no por fila): exámenes -> configuración y preguntas -> casos.
             with db.session.begin_nested():
-                for horario in horarios:
-                    print(f"Creando examen para horario ID: {horario.id}")
-                    nuevo_examen = Examen(
+                examenes = [
+                    Examen(
                         titulo=titulo,
                         descripcion=descripcion,
                         fecha_publicacion=datetime.utcnow(),
                         fecha_cierre=fecha_cierre,
-                        horario_id=horario.id
+                        horario_id=horario_id
                     )
-                    db.session.add(nuevo_examen)
-                    db.session.flush() # Obtener ID del examen
-
-                    config_analisis = ConfiguracionExamen(
+                    for horario_id in horario_ids
+                ]
+                db.session.add_all(examenes)
+                db.session.flush() # Obtener IDs de los exámenes
+                print(f"Exámenes creados para horarios: {horario_ids}")
+
+                configuraciones = []
+                preguntas_por_examen = []
+                for nuevo_examen in examenes:
+                    configuraciones.append(ConfiguracionExamen(
                         examen_id=nuevo_examen.id,
                         habilitar_formato=habilitar_formato_global,
                         habilitar_metricas=habilitar_metricas,
                         habilitar_similitud=habilitar_similitud,
                         habilitar_rendimiento=habilitar_rendimiento # Nombre correcto
-                    )
-                    db.session.add(config_analisis)
-
-                    # Procesar preguntas añadidas dinámicamente
-                    for i, pregunta_form_data in enumerate(form.preguntas.data): # Iterar sobre la data
-                        print(f"  Procesando pregunta índice {i}: {pregunta_form_data.get('enunciado', '')[:30]}...")
-                        # Crear JSON de configuración de formato
-                        config_formato = None
-                        perfil_linter = pregunta_form_data.get('linter_perfil')
-                        args_adicionales = pregunta_form_data.get('linter_args_adicionales', '')
-
-                        if habilitar_formato_global and perfil_linter:
-                            config_formato = {
-                                "perfil": perfil_linter,
-                                "args_adicionales": args_adicionales or ""
-                            }
-                        config_formato_json = json.dumps(config_formato) if config_formato else None
-                        print(f"    Config formato JSON: {config_formato_json}")
-
-                        nueva_pregunta = Pregunta(
-                            enunciado=pregunta_form_data['enunciado'],
-                            puntaje_total=pregunta_form_data['puntaje_total'],
-                            lenguaje_programacion=pregunta_form_data['lenguaje_programacion'],
-                            rubrica_evaluacion=pregunta_form_data.get('rubrica_evaluacion') or None,
-                            configuracion_formato_json=config_formato_json,
-                            examen_id=nuevo_examen.id
+                    ))
+                    for campos_pregunta, campos_casos in preguntas_data:
+                        preguntas_por_examen.append(
+                            (Pregunta(examen_id=nuevo_examen.id, **campos_pregunta), campos_casos)
                         )
-                        db.session.add(nueva_pregunta)
-                        db.session.flush() # Obtener ID de la pregunta
-
-                        # Procesar casos de prueba anidados
-                        for j, caso_data in enumerate(pregunta_form_data.get('casos_de_prueba', [])):
-                            print(f"    Procesando caso índice {j} para pregunta {nueva_pregunta.id}")
-                            nuevo_caso = CasoDePrueba(
-                                descripcion=caso_data.get('descripcion'), # Usar get para opcionales
-                                argumentos=caso_data.get('argumentos'),
-                                entrada=caso_data.get('entrada'),
-                                salida_esperada=caso_data.get('salida_esperada'),
-                                puntos=caso_data['puntos'], # Asumir requerido
-                                es_oculto=caso_data.get('es_oculto', False),
-                                pregunta_id=nueva_pregunta.id
-                            )
-                            db.session.add(nuevo_caso)
+                db.session.add_all(configuraciones)
+                db.session.add_all([pregunta for pregunta, _ in preguntas_por_examen])
+                db.session.flush() # Obtener IDs de las preguntas
+
+                # Los IDs de los casos no se necesitan: inserción masiva sin objetos ORM
+                casos = [
+                    dict(campos_caso, pregunta_id=nueva_pregunta.id)
+                    for nueva_pregunta, campos_casos in preguntas_por_examen
+                    for campos_caso in campos_casos
+                ]
+                if casos:
+                    db.session.bulk_insert_mappings(CasoDePrueba, casos)
+                print(f"  {len(preguntas_por_examen)} preguntas y {len(casos)} casos creados")
 
             # Commit de la transacción principal si todo fue bien
             db.session.commit()
-            flash(f'Examen "{titulo}" creado exitosamente para {len(horarios)} horario(s).', 'success')
+            flash(f'Examen "{titulo}" creado exitosamente para {len(horario_ids)} horario(s).', 'success')
             return redirect(url_for('gestionar_examenes'))
 
         except Exception as e:
@@ -672,50 +727,11 @@ def crear_examen():
             flash('Ocurrió un error grave al crear los exámenes. Inténtalo nuevamente.', 'danger')
             print(f"Error al crear exámenes: {e}", file=sys.stderr)
             # Volver a renderizar el formulario con los datos ingresados y errores
-            # Necesitamos obtener los linters de nuevo para el renderizado
-            todos_los_linters = {}
-            try:
-                codigos_lenguaje = [lang[0] for lang in LENGUAJES_SOPORTADOS]
-                for lenguaje_codigo in codigos_lenguaje:
-                    opciones = [('', '--- Ninguno ---')]
-                    herramientas = HerramientaAnalisis.query.filter_by(lenguaje=lenguaje_codigo).order_by(HerramientaAnalisis.nombre_mostrado).all()
-                    opciones.extend([(h.nombre, h.nombre_mostrado) for h in herramientas])
-                    todos_los_linters[lenguaje_codigo] = opciones
-            except Exception as e_linter:
-                print(f"Error obteniendo linters (POST error): {e_linter}", file=sys.stderr)
-                for lc in [lang[0] for lang in LENGUAJES_SOPORTADOS]: todos_los_linters[lc] = [('', '--- Error ---')]
-
-            return render_template('crear_examen.html', form=form, editar=False, todos_los_linters_json=json.dumps(todos_los_linters))
-
-    # --- Método GET: Obtener TODOS los linters y pasarlos ---
-    print("Procesando GET para /docente/crear_examen")
-    todos_los_linters = {}
-    try:
-        codigos_lenguaje = [lang[0] for lang in LENGUAJES_SOPORTADOS]
-        for lenguaje_codigo in codigos_lenguaje:
-            opciones = [('', '--- Ninguno ---')]
-            herramientas = HerramientaAnalisis.query.filter_by(
-                lenguaje=lenguaje_codigo
-            ).order_by(HerramientaAnalisis.nombre_mostrado).all()
-            opciones.extend([(h.nombre, h.nombre_mostrado) for h in herramientas])
-            todos_los_linters[lenguaje_codigo] = opciones
-        print("--- DEBUG: Datos para Template ---")
-        print(f"Todos Linters Dict: {todos_los_linters}") # Verifica el diccionario Python
-        todos_los_linters_json_str = json.dumps(todos_los_linters)
-        print(f"Todos Linters JSON: {todos_los_linters_json_str}") # Verifica la cadena JSON
-        print("---------------------------------")
-        print(f"Linters obtenidos para GET: {len(todos_los_linters)} lenguajes")
-    except Exception as e:
-        flash('Error al cargar opciones de linter.', 'warning')
-        print(f"Error obteniendo linters para el formulario GET: {e}", file=sys.stderr)
-        for lc in [lang[0] for lang in LENGUAJES_SOPORTADOS]: todos_los_linters[lc] = [('', '--- Error ---')]
+            return _render_examen_form(form)
 
-    return render_template(
-        'crear_examen.html',
-        form=form,
-        editar=False,
-        todos_los_linters_json=json.dumps(todos_los_linters) # Pasar como JSON
-    )
+    # --- Método GET: formulario vacío con TODOS los linters ---
+    print("Procesando GET para /docente/crear_examen")
+    return _render_examen_form(form)
 
 
 @app.route('/docente/editar_examen/<int:examen_id>', methods=['GET', 'POST'])
@@ -751,27 +767,25 @@ def editar_examen(examen_id):
     if request.method == 'POST':
         print("Procesando POST /docente/editar_examen - Poblando Choices Linter ANTES de validar")
         # Iterar sobre los subformularios de pregunta que WTForms crea a partir del request
+        try:
+            linters_por_lenguaje, _ = _linters_y_json()  # Una consulta para todas las preguntas
+        except Exception as e_choices_post:
+            # Manejar error pero asignar choices vacías para evitar fallo total
+            print(f"Error obteniendo linters para choices POST: {e_choices_post}", file=sys.stderr)
+            linters_por_lenguaje = None
         for i, pregunta_subform in enumerate(form.preguntas):
-            try:
-                # Obtener el lenguaje seleccionado para esta pregunta específica DESDE EL FORMULARIO ENVIADO
-                lenguaje_seleccionado = request.form.get(f'preguntas-{i}-lenguaje_programacion')
-                print(f"  Poblando choices pregunta {i}, lenguaje POST: {lenguaje_seleccionado}")
-                opciones_linter = [('', '--- Ninguno ---')] # Default
-                if lenguaje_seleccionado:
-                    # Consultar las herramientas/perfiles para ese lenguaje
-                    herramientas = HerramientaAnalisis.query.filter_by(
-                        lenguaje=lenguaje_seleccionado
-                    ).order_by(HerramientaAnalisis.nombre_mostrado).all()
-                    opciones_linter.extend([(h.nombre, h.nombre_mostrado) for h in herramientas])
-
-                # ASIGNAR LAS CHOICES AL CAMPO DEL FORMULARIO ANTES DE LA VALIDACIÓN
-                pregunta_subform.linter_perfil.choices = opciones_linter
-                print(f"    Choices asignadas para pregunta {i}: {opciones_linter}")
-
-            except Exception as e_choices_post:
-                 # Manejar error pero asignar choices vacías para evitar fallo total
-                 print(f"Error poblando choices POST para pregunta {i}: {e_choices_post}", file=sys.stderr)
-                 pregunta_subform.linter_perfil.choices = [('', '--- Error ---')]
+            # Obtener el lenguaje seleccionado para esta pregunta específica DESDE EL FORMULARIO ENVIADO
+            lenguaje_seleccionado = request.form.get(f'preguntas-{i}-lenguaje_programacion')
+            print(f"  Poblando choices pregunta {i}, lenguaje POST: {lenguaje_seleccionado}")
+            if linters_por_lenguaje is None:
+                opciones_linter = [('', '--- Error ---')]
+            else:
+                # Copia: la lista memoizada en _linters_cached no debe compartirse entre formularios
+                opciones_linter = list(linters_por_lenguaje.get(lenguaje_seleccionado, [('', '--- Ninguno ---')]))
+
+            # ASIGNAR LAS CHOICES AL CAMPO DEL FORMULARIO ANTES DE LA VALIDACIÓN
+            pregunta_subform.linter_perfil.choices = opciones_linter
+            print(f"    Choices asignadas para pregunta {i}: {opciones_linter}")
     # --- FIN: Poblar CHOICES para POST ---
 
     # --- Lógica para Método GET (Poblar el formulario) ---
@@ -914,27 +928,7 @@ def editar_examen(examen_id):
             # Volver a renderizar con errores - Necesitamos linters y flag global
             global_formato_habilitado = form.habilitar_formato.data # Usar valor del form fallido
 
-    # --- GET o POST con error: Obtener TODOS los linters y pasarlos al template ---
-    print("Obteniendo linters para renderizar formulario...")
-    todos_los_linters = {}
-    try:
-        # Obtener todos los lenguajes definidos en LENGUAJES_SOPORTADOS
-        codigos_lenguaje = [lang[0] for lang in LENGUAJES_SOPORTADOS]
-        for lenguaje_codigo in codigos_lenguaje:
-            opciones = [('', '--- Ninguno ---')] # Opción por defecto
-            # Consultar herramientas para este lenguaje
-            herramientas = HerramientaAnalisis.query.filter_by(
-                lenguaje=lenguaje_codigo
-            ).order_by(HerramientaAnalisis.nombre_mostrado).all()
-            opciones.extend([(h.nombre, h.nombre_mostrado) for h in herramientas])
-            todos_los_linters[lenguaje_codigo] = opciones
-        print(f"Linters obtenidos para {len(todos_los_linters)} lenguajes.")
-    except Exception as e:
-        flash('Error al cargar opciones de linter.', 'warning')
-        print(f"Error obteniendo linters para formulario: {e}", file=sys.stderr)
-        # Crear defaults vacíos en caso de error
-        for lc in [lang[0] for lang in LENGUAJES_SOPORTADOS]:
-            todos_los_linters[lc] = [('', '--- Error ---')]
+    # --- GET o POST con error: renderizar con TODOS los linters ---
 
     # Obtener estado actual del flag global si es GET
     if request.method == 'GET':
@@ -942,15 +936,13 @@ def editar_examen(examen_id):
     # Si es POST con error, global_formato_habilitado ya tiene el valor del form
 
     curso_asociado = examen.horario.oferta_de_curso.curso
-    return render_template(
-        'crear_examen.html', # Reutilizar la misma plantilla
-        form=form, # Pasar el formulario poblado (o con errores)
+    return _render_examen_form(
+        form, # Pasar el formulario poblado (o con errores)
         editar=True,
         examen_id=examen.id,
         curso=curso_asociado,
         examen=examen,
-        global_formato_habilitado=global_formato_habilitado, # Pasar flag
-        todos_los_linters_json=json.dumps(todos_los_linters) # Pasar linters
+        global_formato_habilitado=global_formato_habilitado # Pasar flag
     )
 
 
@@ -1239,8 +1231,7 @@ def evaluar_en_lote(examen_id):
 @app.route('/ver_examenes')
 @login_required
 def ver_examenes():
-    horarios = current_user.horarios
-    examenes = Examen.query.filter(Examen.horario_id.in_([h.id for h in horarios])).all()
+    examenes = Examen.query.filter(Examen.horario_id.in_(_horario_ids_de_usuario(current_user.id))).all()
     return render_template('ver_examenes.html', examenes=examenes)
 
 @app.route('/mis_entregas')
@@ -1332,7 +1323,7 @@ def ver_resultados():
     evaluaciones_paginadas = pagination.items
     
     # Calcular estadísticas con TODOS los resultados filtrados, no solo los de la página actual
-    estadisticas = calcular_estadisticas_evaluaciones(evaluaciones_query.all())
+    estadisticas = calcular_estadisticas_evaluaciones(examen_id, curso_id)
     
     cursos, examenes = obtener_cursos_y_examenes_docente(current_user.id)
     
@@ -146,9 +146,12 @@ def seed_database():
             # --- PASO 3: Asociar todos los usuarios al horario ---
             log.info(f"\n--- Asociando usuarios al horario '{horario.nombre}' ---")
             
+            # Ids ya asociados en un set: pertenencia O(1) en vez de recorrer la colección por usuario
+            ids_asociados = {u.id for u in horario.usuarios}
             for usuario in usuarios_procesados:
-                if usuario not in horario.usuarios:
+                if usuario.id not in ids_asociados:
                     horario.usuarios.append(usuario)
+                    ids_asociados.add(usuario.id)
                     log.info(f"Asociando a {usuario.nombre}...")
                 else:
                     log.info(f"{usuario.nombre} ya está asociado.")
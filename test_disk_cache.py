@@ -0,0 +1,71 @@
+"""
+Pruebas de la poda LRU de cachés en disco (disk_cache.podar_cache_lru), que comparten la
+caché de compilación del evaluador y la de binarios del analizador de rendimiento.
+"""
+
+import os
+import time
+
+import pytest
+
+from disk_cache import podar_cache_lru, tocar_artefacto
+
+SIN_TOPE = 10 ** 9
+
+
+def _entrada(directorio, clave, antiguedad, tamano=10, sufijos=('', '.c'), como_directorio=False):
+    """Crea los archivos de una entrada (o un directorio, como las clases Java) con la antigüedad dada."""
+    mtime = time.time() - antiguedad
+    paths = []
+    for sufijo in sufijos:
+        path = directorio / (clave + sufijo)
+        if como_directorio:
+            path.mkdir()
+            for clase in ('Main.class', 'Main$1.class'):  # Mismo tamaño total que ejecutable + fuente
+                (path / clase).write_bytes(b'x' * tamano)
+        else:
+            path.write_bytes(b'x' * tamano)
+        os.utime(path, (mtime, mtime))
+        paths.append(path)
+    return paths
+
+
+# (entradas: {clave: antigüedad en s, tamaño en bytes}, topes, borradas esperadas)
+CASOS = {
+    'por_entradas_borra_la_menos_usada': (
+        {'vieja': (3000, 10), 'media': (2000, 10), 'nueva': (1000, 10)},
+        dict(max_entradas=2, max_bytes=SIN_TOPE, max_edad_seg=SIN_TOPE), {'vieja'}),
+    'por_bytes': (
+        {'grande': (3000, 20), 'chica': (2000, 20)},
+        dict(max_entradas=SIN_TOPE, max_bytes=50, max_edad_seg=SIN_TOPE), {'grande'}),
+    'por_antiguedad': (
+        {'caducada': (9000, 1), 'vigente': (2000, 1)},
+        dict(max_entradas=SIN_TOPE, max_bytes=SIN_TOPE, max_edad_seg=5000), {'caducada'}),
+    'respeta_las_en_uso': (
+        {'en_uso': (10, 10)},
+        dict(max_entradas=0, max_bytes=0, max_edad_seg=0), set()),
+    'dentro_de_los_topes_no_borra': (
+        {'a': (3000, 10), 'b': (2000, 10)},
+        dict(max_entradas=2, max_bytes=SIN_TOPE, max_edad_seg=SIN_TOPE), set()),
+}
+
+
+@pytest.mark.parametrize('como_directorio', [False, True], ids=['archivos', 'directorios'])
+@pytest.mark.parametrize('entradas, topes, borradas', CASOS.values(), ids=CASOS.keys())
+def test_podar_cache_lru(tmp_path, entradas, topes, borradas, como_directorio):
+    sufijos = ('',) if como_directorio else ('', '.c')
+    paths = {clave: _entrada(tmp_path, clave, antiguedad, tamano, sufijos, como_directorio)
+             for clave, (antiguedad, tamano) in entradas.items()}
+    assert podar_cache_lru(str(tmp_path), **topes) == len(borradas)
+    for clave, archivos in paths.items():
+        # Los archivos de una entrada se borran o se conservan juntos
+        assert all(p.exists() == (clave not in borradas) for p in archivos), clave
+
+
+def test_tocar_artefacto_renueva_el_uso(tmp_path):
+    vieja, = _entrada(tmp_path, 'vieja', 3000, sufijos=('',))
+    nueva, = _entrada(tmp_path, 'nueva', 2000, sufijos=('',))
+    assert tocar_artefacto(str(vieja))
+    assert podar_cache_lru(str(tmp_path), max_entradas=1, max_bytes=SIN_TOPE, max_edad_seg=SIN_TOPE) == 1
+    assert vieja.exists() and not nueva.exists()
+    assert not tocar_artefacto(str(tmp_path / 'no_existe'))
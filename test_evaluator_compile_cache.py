@@ -0,0 +1,78 @@
+"""
+Pruebas de la caché de compilación (evaluator.compilar_codigo).
+
+Un reenvío idéntico no debe volver a invocar gcc/javac, y el índice Java en memoria debe
+mantenerse dentro de su tope. La poda en disco se prueba en test_disk_cache.py.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import evaluator
+
+CODIGO_C = '#include <stdio.h>\nint main(void) { puts("%s"); return 0; }\n'
+CODIGO_JAVA = 'public class Main { public static void main(String[] a) { System.out.println("%s"); } }\n'
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directorio = tmp_path / "cache"
+    monkeypatch.setattr(evaluator, 'COMPILE_CACHE_DIR', str(directorio))
+    monkeypatch.setattr(evaluator, '_java_compile_cache', evaluator.OrderedDict())
+    return directorio
+
+
+@pytest.fixture
+def compilaciones(monkeypatch):
+    """Registra las llamadas a gcc/javac; javac se simula creando el .class esperado."""
+    llamadas = []
+    original = subprocess.run
+
+    def run(comando, *args, **kwargs):
+        llamadas.append(comando[0])
+        if comando[0] == 'javac':
+            destino = comando[comando.index('-d') + 1]
+            nombre = os.path.splitext(os.path.basename(comando[-1]))[0]
+            open(os.path.join(destino, nombre + '.class'), 'wb').close()
+            return subprocess.CompletedProcess(comando, 0, '', '')
+        return original(comando, *args, **kwargs)
+    monkeypatch.setattr(evaluator.subprocess, 'run', run)
+    return llamadas
+
+
+def _fuente(tmp_path, nombre, contenido):
+    path = tmp_path / nombre
+    path.write_text(contenido)
+    return str(path)
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None, reason="Requiere gcc")
+def test_acierto_c_no_invoca_gcc(tmp_path, cache_dir, compilaciones):
+    fuente = _fuente(tmp_path, "a.c", CODIGO_C % "hola")
+    primero, error, _ = evaluator.compilar_codigo(fuente, 'c')
+    assert error is None and compilaciones == ['gcc']
+    segundo, error, comando = evaluator.compilar_codigo(fuente, 'c')
+    assert error is None and segundo == primero and comando == [primero]
+    assert compilaciones == ['gcc']
+
+
+def test_acierto_java_no_invoca_javac(tmp_path, cache_dir, compilaciones):
+    fuente = _fuente(tmp_path, "Main.java", CODIGO_JAVA % "hola")
+    evaluator.compilar_codigo(fuente, 'java')
+    _, error, comando = evaluator.compilar_codigo(fuente, 'java')
+    assert error is None and comando[-1] == 'Main'
+    assert compilaciones == ['javac']
+
+
+def test_indice_java_acotado(tmp_path, cache_dir, compilaciones, monkeypatch):
+    monkeypatch.setattr(evaluator, 'COMPILE_CACHE_MAX_ENTRADAS', 2)
+    directorios = []
+    for i in range(3):
+        fuente = _fuente(tmp_path, "Main.java", CODIGO_JAVA % i)
+        _, _, comando = evaluator.compilar_codigo(fuente, 'java')
+        directorios.append(comando[comando.index('-cp') + 1])
+    assert len(evaluator._java_compile_cache) == 2
+    assert [d for d, _ in evaluator._java_compile_cache.values()] == directorios[1:]
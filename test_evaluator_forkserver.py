@@ -0,0 +1,87 @@
+"""
+Pruebas del servidor fork de Python (evaluator.ServidorPython).
+
+El mismo script se ejecuta con "python script.py" y con el servidor fork; la salida
+estándar, la salida de error y el código de retorno deben coincidir.
+"""
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from evaluator import ServidorPython, PYTHON_FORKSERVER
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="El servidor fork requiere os.fork()")
+
+SCRIPT_HILO = """
+import threading, time
+def trabajo():
+    time.sleep(0.2)
+    print("desde el hilo")
+threading.Thread(target=trabajo).start()
+print("desde main")
+"""
+
+SCRIPT_ATEXIT = """
+import atexit, sys
+atexit.register(lambda: print("adios desde atexit"))
+print("hola")
+sys.exit(3)
+"""
+
+SCRIPT_DEPRECATION = """
+import warnings
+warnings.warn("api vieja", DeprecationWarning)
+print("listo")
+"""
+
+SCRIPT_ARCHIVO = """
+f = open({ruta!r}, "w")
+f.write("sin cerrar")
+"""
+
+
+def _comparar(tmp_path, fuente, stdin=b""):
+    script = tmp_path / "script.py"
+    script.write_text(textwrap.dedent(fuente))
+    esperado = subprocess.run([sys.executable, str(script)], input=stdin, capture_output=True,
+                              timeout=10, cwd=tmp_path)
+    servidor = ServidorPython(str(script), sys.executable)
+    try:
+        codigo, stdout_bytes, stderr_bytes = servidor.ejecutar([], stdin, 10)
+    finally:
+        servidor.cerrar()
+    assert codigo == esperado.returncode
+    assert stdout_bytes == esperado.stdout
+    # Las rutas del script coinciden, así que el stderr (avisos/tracebacks) también
+    assert stderr_bytes == esperado.stderr
+    return stdout_bytes, stderr_bytes
+
+
+def test_forkserver_desactivado_por_defecto():
+    if 'EVALUADOR_PYTHON_FORKSERVER' not in os.environ:
+        assert PYTHON_FORKSERVER is False
+
+
+def test_forkserver_espera_hilos_no_daemon(tmp_path):
+    stdout_bytes, _ = _comparar(tmp_path, SCRIPT_HILO)
+    assert b"desde el hilo" in stdout_bytes
+
+
+def test_forkserver_ejecuta_atexit(tmp_path):
+    stdout_bytes, _ = _comparar(tmp_path, SCRIPT_ATEXIT)
+    assert stdout_bytes.endswith(b"adios desde atexit\n")
+
+
+def test_forkserver_muestra_deprecation_warning(tmp_path):
+    _, stderr_bytes = _comparar(tmp_path, SCRIPT_DEPRECATION)
+    assert b"DeprecationWarning: api vieja" in stderr_bytes
+
+
+def test_forkserver_vacia_archivos_abiertos(tmp_path):
+    salida = tmp_path / "salida_alumno.txt"
+    _comparar(tmp_path, SCRIPT_ARCHIVO.format(ruta=str(salida)))
+    assert salida.read_text() == "sin cerrar"
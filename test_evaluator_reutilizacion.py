@@ -0,0 +1,175 @@
+"""
+Pruebas de evaluator.evaluar_entrega: reutilización de evaluaciones por huella y orden de las fases.
+
+Un reenvío idéntico del mismo alumno a la misma pregunta crea una Entrega nueva; su
+evaluación debe copiarse de la anterior sin compilar ni ejecutar los casos otra vez.
+La llamada al LLM (de pago) solo se lanza si el código compila; si falla, el reintento
+reutiliza los casos ya ejecutados y solo repite el LLM.
+"""
+
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from extensions import db
+from models import (
+    Usuario, Curso, CicloAcademico, OfertaDeCurso, Horario, Examen, ConfiguracionExamen,
+    Pregunta, CasoDePrueba, Entrega, Evaluacion
+)
+import evaluator
+
+CODIGO = "import sys\nprint(int(sys.argv[1]) * 2)\n"
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def pregunta(app):
+    alumno = Usuario(nombre='alumno', email='a@x', contrasena='x', rol='alumno')
+    curso = Curso(nombre='Curso', codigo='C1')
+    ciclo = CicloAcademico(nombre='2024-1')
+    db.session.add_all([alumno, curso, ciclo])
+    db.session.flush()
+    oferta = OfertaDeCurso(curso_id=curso.id, ciclo_academico_id=ciclo.id)
+    db.session.add(oferta)
+    db.session.flush()
+    horario = Horario(oferta_de_curso_id=oferta.id, nombre='H1')
+    db.session.add(horario)
+    db.session.flush()
+    examen = Examen(titulo='E', descripcion='d', fecha_cierre=datetime.utcnow() + timedelta(days=1), horario_id=horario.id)
+    db.session.add(examen)
+    db.session.flush()
+    db.session.add(ConfiguracionExamen(examen_id=examen.id, habilitar_formato=False, habilitar_metricas=False,
+                                       habilitar_similitud=False, habilitar_rendimiento=False))
+    pregunta = Pregunta(enunciado='Doble', puntaje_total=2, lenguaje_programacion='python', examen_id=examen.id)
+    db.session.add(pregunta)
+    db.session.flush()
+    db.session.add_all([
+        CasoDePrueba(descripcion='dos', argumentos='["2"]', salida_esperada='4', puntos=1, pregunta_id=pregunta.id),
+        CasoDePrueba(descripcion='tres', argumentos='["3"]', salida_esperada='6', puntos=1, pregunta_id=pregunta.id),
+    ])
+    db.session.commit()
+    return pregunta
+
+
+def _entregar(pregunta, codigo=CODIGO):
+    alumno = Usuario.query.filter_by(rol='alumno').one()
+    entrega = Entrega(codigo_fuente=codigo, alumno_id=alumno.id, pregunta_id=pregunta.id)
+    db.session.add(entrega)
+    db.session.commit()
+    return entrega
+
+
+def _contar_compilaciones(monkeypatch):
+    llamadas = []
+    original = evaluator.preparar_y_compilar
+
+    def contar(*args, **kwargs):
+        llamadas.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(evaluator, 'preparar_y_compilar', contar)
+    return llamadas
+
+
+def test_reenvio_identico_reutiliza_la_evaluacion(pregunta, monkeypatch):
+    compilaciones = _contar_compilaciones(monkeypatch)
+    primera = _entregar(pregunta)
+    evaluator.evaluar_entrega(primera)
+    assert len(compilaciones) == 1
+    previa = Evaluacion.query.filter_by(entrega_id=primera.id).one()
+    assert previa.puntaje_obtenido == 2
+
+    segunda = _entregar(pregunta)
+    evaluator.evaluar_entrega(segunda)
+    assert len(compilaciones) == 1  # No se volvió a compilar ni a ejecutar
+
+    copia = Evaluacion.query.filter_by(entrega_id=segunda.id).one()
+    assert copia.id != previa.id
+    assert copia.puntaje_obtenido == previa.puntaje_obtenido
+    assert copia.feedback == previa.feedback
+    assert sorted(r.caso_de_prueba_id for r in copia.resultados) == sorted(r.caso_de_prueba_id for r in previa.resultados)
+    assert len(previa.resultados) == 2  # La evaluación original conserva sus resultados
+
+
+def test_codigo_distinto_se_evalua(pregunta, monkeypatch):
+    compilaciones = _contar_compilaciones(monkeypatch)
+    evaluator.evaluar_entrega(_entregar(pregunta))
+    segunda = _entregar(pregunta, CODIGO.replace("* 2", "* 3"))
+    evaluator.evaluar_entrega(segunda)
+    assert len(compilaciones) == 2
+    assert Evaluacion.query.filter_by(entrega_id=segunda.id).one().puntaje_obtenido == 0
+
+
+def test_forzar_reevalua(pregunta, monkeypatch):
+    compilaciones = _contar_compilaciones(monkeypatch)
+    evaluator.evaluar_entrega(_entregar(pregunta))
+    evaluator.evaluar_entrega(_entregar(pregunta), forzar=True)
+    assert len(compilaciones) == 2
+
+
+def _contar_llamadas_llm(monkeypatch, pregunta):
+    llamadas = []
+    pregunta.rubrica_evaluacion = '{"criterios": [{"nombre": "Claridad", "max_puntaje": 1}]}'
+    db.session.commit()
+    monkeypatch.setattr(evaluator, 'preparar_prompt_llm', lambda entrega, pregunta: ([{"role": "user", "content": "x"}], None))
+    monkeypatch.setattr(evaluator, 'llamar_api_openai_llm_con_cache', lambda messages: llamadas.append(messages))
+    return llamadas
+
+
+@pytest.mark.skipif(shutil.which('gcc') is None, reason="Requiere gcc")
+def test_error_de_compilacion_no_llama_al_llm(pregunta, monkeypatch):
+    llamadas = _contar_llamadas_llm(monkeypatch, pregunta)
+    pregunta.lenguaje_programacion = 'c'
+    db.session.commit()
+    entrega = _entregar(pregunta, "int main(void) { return 0 }\n")
+    assert evaluator.evaluar_entrega(entrega) == evaluator.ESTADO_ERROR
+    assert llamadas == []
+
+
+def test_compilacion_correcta_llama_al_llm(pregunta, monkeypatch):
+    llamadas = _contar_llamadas_llm(monkeypatch, pregunta)
+    evaluator.evaluar_entrega(_entregar(pregunta))
+    assert len(llamadas) == 1
+
+
+def test_fallo_del_llm_reintenta_solo_el_llm(pregunta, monkeypatch):
+    compilaciones = _contar_compilaciones(monkeypatch)
+    llamadas = _contar_llamadas_llm(monkeypatch, pregunta)
+    respuesta = {"feedback_general": "Bien", "resultados_criterios": [
+        {"criterio_nombre": "Claridad", "puntaje_obtenido": 1, "max_puntaje_criterio": 1, "feedback_criterio": "ok"}]}
+    # La primera llamada falla (None); la segunda responde
+    monkeypatch.setattr(evaluator, 'llamar_api_openai_llm_con_cache',
+                        lambda messages: respuesta if llamadas.append(messages) or len(llamadas) > 1 else None)
+
+    primera = _entregar(pregunta)
+    evaluator.evaluar_entrega(primera)
+    checkpoint = Evaluacion.query.filter_by(entrega_id=primera.id).one()
+    assert checkpoint.checkpoint_phase == evaluator.FASE_CASOS_TERMINADOS
+    assert checkpoint.resultados_criterios_llm.count() == 0
+
+    segunda = _entregar(pregunta)
+    evaluator.evaluar_entrega(segunda)
+    assert len(compilaciones) == 1  # Los casos salen del checkpoint
+    assert len(llamadas) == 2
+    final = Evaluacion.query.filter_by(entrega_id=segunda.id).one()
+    assert final.checkpoint_phase == evaluator.FASE_FINALIZADA
+    assert [c.criterio_nombre for c in final.resultados_criterios_llm] == ['Claridad']
+    assert sorted(r.caso_de_prueba_id for r in final.resultados) == sorted(r.caso_de_prueba_id for r in checkpoint.resultados)
+    assert sum(r.puntos_obtenidos for r in final.resultados) == 2
+
+    # Ya finalizada, un tercer envío idéntico se copia sin llamar al LLM
+    evaluator.evaluar_entrega(_entregar(pregunta))
+    assert len(compilaciones) == 1 and len(llamadas) == 2
@@ -0,0 +1,21 @@
+"""
+Pruebas de los locks de compilación del analizador de rendimiento
+(performance_analyzer._lock_compilacion). La poda de la caché de binarios se prueba en
+test_disk_cache.py.
+"""
+
+import performance_analyzer as pa
+
+
+def test_locks_de_compilacion_acotados(monkeypatch):
+    monkeypatch.setattr(pa, 'COMPILACION_LOCKS_MAX', 2)
+    monkeypatch.setattr(pa, '_compilacion_locks', pa.OrderedDict())
+    tomado = pa._lock_compilacion('a')
+    with tomado:
+        pa._lock_compilacion('b')
+        pa._lock_compilacion('c')
+        # 'a' está tomado (compilando): se descarta 'b', el siguiente más antiguo
+        assert list(pa._compilacion_locks) == ['a', 'c']
+        assert pa._lock_compilacion('a') is tomado
+    pa._lock_compilacion('d')
+    assert list(pa._compilacion_locks) == ['a', 'd']